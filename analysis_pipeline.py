@@ -0,0 +1,209 @@
+# analysis_pipeline.py
+# ✅ 宣告式分析管線：每個 stage 宣告自己的輸入 / 輸出檔案，相依關係由檔案自動推導
+#    輸入內容雜湊與 run 資料夾內 analysis_manifest.json 記錄相同時略過該 stage，只重跑受影響的下游
+#    互不相依的 stage 以多行程並行（子行程的 matplotlib 使用 Agg 後端）
+
+import os
+import sys
+import json
+import hashlib
+import importlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from columnar_store import columnar_path
+
+MANIFEST_NAME = "analysis_manifest.json"
+MANIFEST_VERSION = 1
+
+class Stage:
+    """
+    name：stage 名稱（manifest 的 key）
+    func：func(run_dir)，必須是模組層級函式（才能送到子行程）
+    inputs / outputs：相對於 run 資料夾的檔名；.csv 表格同時涵蓋對應的欄式檔資料夾
+    modules：程式碼雜湊涵蓋的模組（預設為 func 所在模組），模組原始碼改變時 stage 也會重跑
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), modules=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.modules = list(modules) if modules else [func.__module__]
+
+# === 雜湊 ===
+def _artifact_files(run_dir, name):
+    """一個輸入 / 輸出名稱實際對應的檔案（metrics.csv → metrics.csv + metrics.cols/*）"""
+    path = os.path.join(run_dir, name)
+    files = [path] if os.path.isfile(path) else []
+    if name.endswith(".csv"):
+        cols_dir = columnar_path(path)
+        if os.path.isdir(cols_dir):
+            files += [os.path.join(cols_dir, f) for f in sorted(os.listdir(cols_dir))]
+    return files
+
+def _file_sha256(path, key, file_cache):
+    """以 (大小, 修改時間) 快取檔案雜湊，未變動的大檔案不必重新讀取"""
+    stat = os.stat(path)
+    cached = file_cache.get(key)
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    file_cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": h.hexdigest()}
+    return h.hexdigest()
+
+def artifact_hash(run_dir, name, file_cache):
+    files = _artifact_files(run_dir, name)
+    if not files:
+        return None
+    h = hashlib.sha256()
+    for path in files:
+        # 以相對路徑為 key，run 資料夾被 organize_runs 搬移後快取仍然有效
+        key = os.path.relpath(path, run_dir).replace(os.sep, "/")
+        h.update(key.encode("utf-8"))
+        h.update(_file_sha256(path, key, file_cache).encode("ascii"))
+    return h.hexdigest()
+
+def code_hash(modules):
+    h = hashlib.sha256()
+    for name in sorted(modules):
+        module = sys.modules.get(name) or importlib.import_module(name)
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+# === manifest ===
+def load_manifest(run_dir):
+    path = os.path.join(run_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+    return {"version": MANIFEST_VERSION, "files": {}, "stages": {}}
+
+def save_manifest(run_dir, manifest):
+    path = os.path.join(run_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# === 子行程 ===
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+def _run_stage(func, run_dir):
+    func(run_dir)
+
+# === 管線 ===
+class AnalysisPipeline:
+    def __init__(self, stages):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("❌ stage 名稱重複")
+
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"❌ {output} 同時由 {producers[output]} 與 {stage.name} 產生")
+                producers[output] = stage.name
+
+        # 讀取某檔案的 stage 相依於產生該檔案的 stage（原地修改自己輸入的 stage 除外）
+        self.deps = {
+            stage.name: {producers[f] for f in stage.inputs if f in producers and producers[f] != stage.name}
+            for stage in stages
+        }
+
+    def _is_fresh(self, stage, record, input_hashes, file_cache, run_dir, stage_code):
+        if record is None or record.get("code") != stage_code:
+            return False
+        # 原地修改的檔案（同時是輸入與輸出）以上次執行後的內容比對
+        expected = {name: record["inputs"].get(name) for name in stage.inputs}
+        expected.update({name: record["outputs"].get(name) for name in stage.inputs if name in stage.outputs})
+        if input_hashes != expected:
+            return False
+        return all(artifact_hash(run_dir, name, file_cache) == record["outputs"].get(name) for name in stage.outputs)
+
+    def run(self, run_dir, max_workers=None, force=False):
+        """
+        執行管線，回傳 {stage 名稱: "ran" / "skipped" / "failed"}。
+        max_workers=1 時全部在本行程依序執行；force=True 時忽略 manifest。
+        """
+        manifest = load_manifest(run_dir)
+        file_cache = manifest["files"]
+        status = {}
+        pending = dict(self.stages)
+        running = {}
+        started = {}
+
+        def ready():
+            return [name for name in pending if self.deps[name] <= set(status)]
+
+        def start(stage, submit):
+            input_hashes = {name: artifact_hash(run_dir, name, file_cache) for name in stage.inputs}
+            stage_code = code_hash(stage.modules)
+            record = manifest["stages"].get(stage.name)
+            if not force and self._is_fresh(stage, record, input_hashes, file_cache, run_dir, stage_code):
+                print(f"⏭️ {stage.name}：輸入未變更，略過")
+                status[stage.name] = "skipped"
+                return
+            print(f"▶️ {stage.name}")
+            started[stage.name] = (input_hashes, stage_code)
+            submit(stage)
+
+        def finish(stage, error):
+            if error is not None:
+                print(f"⚠️ {stage.name} 失敗：{error}")
+                manifest["stages"].pop(stage.name, None)
+                status[stage.name] = "failed"
+                return
+            input_hashes, stage_code = started[stage.name]
+            manifest["stages"][stage.name] = {
+                "code": stage_code,
+                "inputs": input_hashes,
+                "outputs": {name: artifact_hash(run_dir, name, file_cache) for name in stage.outputs},
+            }
+            save_manifest(run_dir, manifest)
+            status[stage.name] = "ran"
+
+        def run_inline(stage):
+            try:
+                _run_stage(stage.func, run_dir)
+            except Exception as e:
+                finish(stage, e)
+            else:
+                finish(stage, None)
+
+        if max_workers == 1:
+            while pending:
+                names = ready()
+                if not names:
+                    raise RuntimeError("❌ stage 相依關係有循環")
+                for name in names:
+                    start(pending.pop(name), run_inline)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+                def submit(stage):
+                    running[pool.submit(_run_stage, stage.func, run_dir)] = stage
+
+                while pending or running:
+                    for name in ready():
+                        start(pending.pop(name), submit)
+                    if not running:
+                        if pending and not ready():
+                            raise RuntimeError("❌ stage 相依關係有循環")
+                        continue
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(running.pop(future), future.exception())
+
+        save_manifest(run_dir, manifest)
+        return status
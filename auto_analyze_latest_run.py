@@ -1,106 +1,144 @@
 # ✅ 完整自動化：載入最新 test run，標記語法事件、畫圖、曲線擬合 + cycle/transition 分析 + 產出總結報告
 
 import os
-import pandas as pd
-from syntax_event_logger import SyntaxEventLogger
+import argparse
+from analysis_pipeline import AnalysisPipeline, Stage, load_manifest
+from columnar_store import convert_csv, load_table, series_index, table_columns, table_exists
+from syntax_event_logger import RHYTHM_NAME, SyntaxEventLogger, event_log_path
 from plot_syntax_pulse_v2 import plot_syntax_pulse
 from fit_logistic_map import fit_logistic_map
 from fit_s_growth import fit_s_growth
 from cycle_marker_utils import add_cycle_markers
-from detect_transition_points import detect_transitions
-from cycle_transition_detector import detect_cycle_transitions
+from event_extraction import extract_events, save_events
 from summary_report_generator import generate_summary_report
 from plot_hs_curve import plot_hs_curve  # ✅ 新增：繪製 H-S 曲線
-
-# === 自動尋找最新的 test 結果資料夾 ===
-def find_latest_test_dir(base_dir="runs"):
-    all_test_dirs = []
-    for category in ["test", "test_many", "fast"]:
-        category_path = os.path.join(base_dir, category)
-        if not os.path.isdir(category_path):
-            continue
-        for f in os.listdir(category_path):
-            subdir = os.path.join(category_path, f)
-            if os.path.isdir(subdir) and f.startswith(category):
-                all_test_dirs.append(subdir)
-
-    if not all_test_dirs:
-        raise FileNotFoundError("❌ 找不到任何 test、test_many 或 fast 類型的測試資料夾。")
-
-    latest_dir = sorted(all_test_dirs)[-1]
-    print("📂 最新測試資料夾：", latest_dir)
-    return latest_dir
+from run_catalog import headline_metrics, record_artifact, record_metrics
+from run_discovery import find_latest_test_dir
+
+# === 各分析 stage（輸入 / 輸出皆為 run 資料夾內的檔名）===
+# 失敗時直接丟出例外，由 pipeline 記錄為 failed（不寫入 manifest，下次會重試）
+# 資料不足而略過擬合是正常結果：stage 視為完成，輸出記錄為不存在，輸入未變更前不再重跑
+def _remove_stale(*paths):
+    # 略過時清掉上一次的輸出，避免報告引用舊圖
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def stage_cycle_markers(test_dir):
+    # Step 0: 加入智慧週期欄位
+    metrics_path = os.path.join(test_dir, "metrics.csv")
+    if "cycle" not in table_columns(metrics_path):
+        print("🔁 加入 cycle 欄位...")
+        add_cycle_markers(metrics_path)
+
+def stage_syntax_events(test_dir):
+    # Step 1: 語法事件標記
+    df_check = load_table(os.path.join(test_dir, "metrics.csv"))
+    index = series_index(df_check.columns)
+    logger = SyntaxEventLogger(index=index)
+    logger.log_batch(
+        positions=df_check[index],
+        h=df_check['entropy'],
+        s=df_check['wisdom_density'],
+        q=df_check.get('modularity', 0.0),
+        terminated=df_check.get('terminated', False)
+    )
+    logger.save_log(os.path.join(test_dir, RHYTHM_NAME))
+
+def stage_syntax_pulse(test_dir):
+    # Step 2: 繪製語法脈動圖
+    df_check = load_table(os.path.join(test_dir, "metrics.csv"))
+    plot_syntax_pulse(df_check, event_path=event_log_path(test_dir),
+                      save_path=os.path.join(test_dir, "syntax_pulse_v2.png"))
+
+def stage_fit_h(test_dir):
+    # Step 3: 擬合 H 曲線
+    output_path = os.path.join(test_dir, "fit_H_logistic.png")
+    if fit_logistic_map(os.path.join(test_dir, "metrics.csv"), output_path=output_path) is None:
+        _remove_stale(output_path, os.path.join(test_dir, "logistic_fit_summary.csv"))
+
+def stage_fit_s(test_dir):
+    # Step 4: 擬合 S 曲線
+    output_path = os.path.join(test_dir, "fit_S_growth.png")
+    if fit_s_growth(os.path.join(test_dir, "metrics.csv"), output_path=output_path) is None:
+        _remove_stale(output_path)
+
+def stage_hs_curve(test_dir):
+    # Step 4.5: 繪製 H-S 曲線
+    hs_curve_path = os.path.join(test_dir, "hs_curve_many.png")
+    plot_hs_curve(load_table(os.path.join(test_dir, "metrics.csv")), save_path=hs_curve_path)
+    print(f"📈 H-S 曲線圖儲存：{hs_curve_path}")
+
+def stage_events(test_dir):
+    # Step 5-6: 轉變點（微觀）、週期切換（宏觀）與 Q 事件，一次讀取 metrics 全部產出
+    save_events(extract_events(os.path.join(test_dir, "metrics.csv")), test_dir)
+
+def stage_summary_report(test_dir):
+    # Step 7: 產出文字總結報告
+    generate_summary_report(test_dir)
+
+ANALYSIS_PIPELINE = AnalysisPipeline([
+    Stage("cycle_markers", stage_cycle_markers, inputs=["metrics.csv"], outputs=["metrics.csv"],
+          modules=[__name__, "cycle_marker_utils", "cycle_segmentation"]),
+    Stage("syntax_events", stage_syntax_events, inputs=["metrics.csv"], outputs=[RHYTHM_NAME],
+          modules=[__name__, "syntax_event_logger"]),
+    Stage("syntax_pulse", stage_syntax_pulse, inputs=["metrics.csv", RHYTHM_NAME],
+          outputs=["syntax_pulse_v2.png", "cycle_summary.csv"], modules=[__name__, "plot_syntax_pulse_v2"]),
+    Stage("fit_h", stage_fit_h, inputs=["metrics.csv"], outputs=["fit_H_logistic.png", "logistic_fit_summary.csv"],
+          modules=[__name__, "fit_logistic_map"]),
+    Stage("fit_s", stage_fit_s, inputs=["metrics.csv"], outputs=["fit_S_growth.png"],
+          modules=[__name__, "fit_s_growth"]),
+    Stage("hs_curve", stage_hs_curve, inputs=["metrics.csv"], outputs=["hs_curve_many.png"],
+          modules=[__name__, "plot_hs_curve"]),
+    Stage("events", stage_events, inputs=["metrics.csv"],
+          outputs=["transition_points.csv", "cycle_transition_points.csv", "q_events.json"],
+          modules=[__name__, "event_extraction", "detect_transition_points", "cycle_segmentation", "q_event_logger"]),
+    Stage("summary_report", stage_summary_report,
+          inputs=["metrics.csv", RHYTHM_NAME, "transition_points.csv", "q_events.json",
+                  "syntax_pulse_v2.png", "fit_H_logistic.png", "fit_S_growth.png"],
+          outputs=["summary_report.txt"], modules=[__name__, "summary_report_generator"]),
+])
+
+# === 分析單一 run 資料夾（batch_analyze 也會直接呼叫）===
+def analyze_run(test_dir, max_workers=None, force=False):
+    metrics_path = os.path.join(test_dir, "metrics.csv")
+
+    if not table_exists(metrics_path):
+        raise FileNotFoundError(f"❌ 找不到 metrics.csv：{metrics_path}")
+    print(f"✅ 載入 metrics 檔案：{metrics_path}")
+
+    # 只有 CSV 的舊資料夾：先轉成欄式格式，之後各步驟都直接 memmap 讀取
+    if os.path.exists(metrics_path):
+        convert_csv(metrics_path)
+
+    # 依輸入 / 輸出相依執行各 stage；輸入未變更的 stage 直接略過
+    status = ANALYSIS_PIPELINE.run(test_dir, max_workers=max_workers, force=force)
+    ran = [name for name, result in status.items() if result == "ran"]
+    failed = [name for name, result in status.items() if result == "failed"]
+    print(f"📋 執行 {len(ran)} 個 stage，略過 {len(status) - len(ran) - len(failed)} 個，失敗 {len(failed)} 個")
+
+    # 產出檔與重點指標寫入 run 目錄索引（雜湊直接沿用 manifest 的內容雜湊）
+    if ran:
+        for record in load_manifest(test_dir)["stages"].values():
+            for name, sha256 in record["outputs"].items():
+                if sha256 is not None and os.path.isfile(os.path.join(test_dir, name)):
+                    record_artifact(os.path.join(test_dir, name), sha256=sha256, run_dir=test_dir)
+        record_metrics(test_dir, headline_metrics(test_dir))
+    return status
 
 # === 主流程 ===
-def main():
+def main(max_workers=None, force=False):
     try:
         test_dir = find_latest_test_dir()
-        metrics_path = os.path.join(test_dir, "metrics.csv")
-
-        if not os.path.exists(metrics_path):
-            raise FileNotFoundError(f"❌ 找不到 metrics.csv：{metrics_path}")
-        print(f"✅ 載入 metrics 檔案：{metrics_path}")
-
-        # Step 0: 加入智慧週期欄位
-        df_check = pd.read_csv(metrics_path)
-        if "cycle" not in df_check.columns:
-            print("🔁 加入 cycle 欄位...")
-            add_cycle_markers(metrics_path)
-            df_check = pd.read_csv(metrics_path)
-
-        # Step 1: 語法事件標記
-        logger = SyntaxEventLogger()
-        for _, row in df_check.iterrows():
-            logger.log_event(
-                episode=row['episode'],
-                h=row['entropy'],
-                s=row['wisdom_density'],
-                q=row.get('modularity', 0.0),
-                terminated=bool(row.get('terminated', False))
-            )
-        rhythm_path = os.path.join(test_dir, "wisdom_rhythm.json")
-        logger.save_log(rhythm_path)
-
-        # Step 2: 繪製語法脈動圖
-        plot_syntax_pulse(df_check, event_path=rhythm_path,
-                          save_path=os.path.join(test_dir, "syntax_pulse_v2.png"))
-
-        # Step 3: 擬合 H 曲線
-        try:
-            fit_logistic_map(metrics_path, output_path=os.path.join(test_dir, "fit_H_logistic.png"))
-        except Exception as e:
-            print("⚠️ 擬合 H 曲線失敗：", e)
-
-        # Step 4: 擬合 S 曲線
-        try:
-            fit_s_growth(metrics_path, output_path=os.path.join(test_dir, "fit_S_growth.png"))
-        except Exception as e:
-            print("⚠️ 擬合 S 曲線失敗：", e)
-
-        # Step 4.5: 繪製 H-S 曲線
-        try:
-            hs_curve_path = os.path.join(test_dir, "hs_curve_many.png")
-            plot_hs_curve(df_check, save_path=hs_curve_path)
-            print(f"📈 H-S 曲線圖儲存：{hs_curve_path}")
-        except Exception as e:
-            print("⚠️ 無法繪製 H-S 曲線：", e)
-
-        # Step 5: 偵測轉變點（微觀）
-        transition_path = os.path.join(test_dir, "transition_points.csv")
-        detect_transitions(metrics_path, save_path=transition_path)
-
-        # Step 6: 偵測週期切換（宏觀）
-        cycle_transitions = detect_cycle_transitions(metrics_path)
-        print(f"🌀 共偵測到 {len(cycle_transitions)} 個 cycle transition")
-
-        # Step 7: 產出文字總結報告
-        report_path = generate_summary_report(test_dir)
-        print(f"📝 分析報告已儲存：{report_path}")
-
+        analyze_run(test_dir, max_workers=max_workers, force=force)
         print("🎉 全部分析完成 ✅ 結果儲存於：", test_dir)
 
     except Exception as e:
         print("❌ 發生錯誤：", e)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="同時執行的 stage 數量（1 = 依序在本行程執行）")
+    parser.add_argument("--force", action="store_true", help="忽略快取，重新執行所有 stage")
+    args = parser.parse_args()
+    main(max_workers=args.workers, force=args.force)
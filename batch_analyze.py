@@ -0,0 +1,118 @@
+# batch_analyze.py
+# ✅ 批次分析 runs/ 底下所有 test / test_many / train run：以有上限的行程池平行執行，最後輸出一張跨 run 總表
+#    每個 run 的分析輸出寫到該資料夾的 analysis.log；單一 run 失敗只記錄錯誤，不中斷整批
+
+import os
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from columnar_store import table_exists
+from calculate_metrics import calculate_metrics
+from auto_analyze_latest_run import analyze_run
+from run_catalog import headline_metrics
+from run_discovery import BATCH_CATEGORIES, find_run_dirs, run_category, run_timestamp
+from run_fs import archived_runs
+
+SUMMARY_NAME = "cross_run_summary.csv"
+LOG_NAME = "analysis.log"
+
+# === 子行程 ===
+def _init_worker():
+    # 每個 run 一個子行程：torch / BLAS 只用一條執行緒，matplotlib 不開視窗
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    import matplotlib
+    matplotlib.use("Agg")
+
+def analyze_one(run_dir, force=False):
+    """在子行程中分析單一 run，回傳摘要列"""
+    start = time.perf_counter()
+    status = {}
+    with open(os.path.join(run_dir, LOG_NAME), "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        # 只有 test_log 的 test run：先算出 metrics
+        if not table_exists(os.path.join(run_dir, "metrics.csv")) and \
+                table_exists(os.path.join(run_dir, "test_log.csv")):
+            try:
+                calculate_metrics(run_dir)
+            except ValueError as e:
+                # 舊版 test_log 沒有 action 欄位：無法計算 H / S，只整理重點指標
+                print(e)
+        # 行程池已經是以 run 為單位平行，run 內的 stage 依序執行
+        # 沒有 metrics 的 run（例如 train run 只有 rewards.csv）不跑分析 stage，只整理重點指標
+        if table_exists(os.path.join(run_dir, "metrics.csv")):
+            status = analyze_run(run_dir, max_workers=1, force=force)
+        else:
+            print(f"ℹ️ 沒有 metrics.csv，略過分析 stage：{run_dir}")
+
+    results = list(status.values())
+    return {
+        "status": "failed" if "failed" in results else "ok",
+        "stages_ran": results.count("ran"),
+        "stages_failed": results.count("failed"),
+        "seconds": round(time.perf_counter() - start, 3),
+        **headline_metrics(run_dir),
+    }
+
+# === 主流程 ===
+def batch_analyze(run_dirs, max_workers=None, force=False):
+    rows = {}
+    total = len(run_dirs)
+    print(f"🔍 共 {total} 個 run 待分析")
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(analyze_one, run_dir, force): run_dir for run_dir in run_dirs}
+        for i, future in enumerate(as_completed(futures), 1):
+            run_dir = futures[future]
+            name = os.path.basename(run_dir)
+            try:
+                row = future.result()
+            except Exception as e:
+                row = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+                print(f"❌ [{i}/{total}] {name}：{row['error']}（詳見 {os.path.join(run_dir, LOG_NAME)}）")
+            else:
+                mark = "✅" if row["status"] == "ok" else "⚠️"
+                print(f"{mark} [{i}/{total}] {name}：執行 {row['stages_ran']} 個 stage，"
+                      f"失敗 {row['stages_failed']} 個（{row['seconds']:.1f}s）")
+            rows[run_dir] = {"run": name, "category": run_category(run_dir), "path": run_dir, **row}
+
+    # 依 run 的時間順序輸出，與完成順序無關
+    return pd.DataFrame([rows[run_dir] for run_dir in run_dirs])
+
+def summarize_archived(base_dir="runs", skip=()):
+    """只存在於 runs/archive 的 run：直接讀封存內容整理摘要列（不解壓、不執行分析 stage）"""
+    runs = {name: path for name, path in archived_runs(base_dir).items()
+            if name not in skip and run_category(name) in BATCH_CATEGORIES}
+    rows = []
+    for name in sorted(runs, key=lambda name: (run_timestamp(name), name)):
+        try:
+            row = {"status": "archived", **headline_metrics(runs[name])}
+        except Exception as e:
+            row = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            print(f"❌ {name}（封存）：{row['error']}")
+        rows.append({"run": name, "category": run_category(name), "path": runs[name], **row})
+    print(f"🗄️ 已讀取 {len(rows)} 個僅存在於封存中的 run")
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("runs", nargs="*", help="run 資料夾（預設為 runs/test、runs/test_many、runs/train 下全部）")
+    parser.add_argument("--base-dir", default="runs")
+    parser.add_argument("--workers", type=int, default=None, help="同時分析的 run 數（預設為 CPU 核心數）")
+    parser.add_argument("--force", action="store_true", help="忽略 manifest，每個 stage 都重跑")
+    parser.add_argument("--archived", action="store_true", help="總表也納入只存在於 runs/archive 的 run")
+    args = parser.parse_args()
+
+    run_dirs = args.runs or find_run_dirs(args.base_dir, BATCH_CATEGORIES)
+    if not run_dirs:
+        raise SystemExit(f"❌ {args.base_dir} 底下找不到任何 run 資料夾")
+
+    summary = batch_analyze(run_dirs, max_workers=args.workers, force=args.force)
+    if args.archived:
+        archived = summarize_archived(args.base_dir, skip={os.path.basename(d) for d in run_dirs})
+        summary = pd.DataFrame(summary.to_dict("records") + archived.to_dict("records"))
+    summary_path = os.path.join(args.base_dir, SUMMARY_NAME)
+    summary.to_csv(summary_path, index=False)
+    failed = summary["status"].isin(["error", "failed"]).sum()
+    print(f"📊 跨 run 總表儲存到：{summary_path}（{len(summary)} 個 run，{failed} 個有錯誤）")
@@ -0,0 +1,207 @@
+# batch_evaluator.py
+# ✅ 無畫面批次評估：策略只載入一次，所有回合同步推進，每一步只呼叫一次批次 predict
+
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from maze_env.maze_env import MazeEnv
+from loop_detector import BatchLoopDetector
+
+# 迴圈偵測表（同時進行的回合數 × cell × 動作）的上限。每格 int32：確定性策略一張表（8M 格 ≈ 32 MB），
+# 隨機策略另需週期 / 重複次數兩張（≈ 96 MB）。超過時把回合分成多組依序評估；單一回合就超過時才停用偵測
+LOOP_TRACK_MAX_ENTRIES = 8_000_000
+
+# === 由每回合動作次數計算行動熵（與 test_many.calculate_entropy 相同定義）===
+def entropy_from_counts(action_counts):
+    counts = np.atleast_2d(action_counts).astype(np.float64)
+    totals = counts.sum(axis=1, keepdims=True)
+    probs = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(probs > 0, probs * np.log2(probs), 0.0)
+    return -terms.sum(axis=1)
+
+# === 主邏輯：同步執行 n_episodes 個回合 ===
+def evaluate_policy_batched(policy, n_episodes=10_000, max_steps=1000, deterministic=False,
+                            env=None, record_every=0, detect_loops=True):
+    """
+    policy：任何具有 predict(obs_batch, deterministic=...) 介面的物件（例如 PPO）。
+    env：提供迷宮查表的 MazeEnv（預設為標準 10x10 迷宮）。
+    record_every：每隔 k 個回合保留一條完整軌跡（0 = 不保留）。
+    detect_loops：證實進入迴圈的回合立即結束（記錄迴圈長度與進入步數）；隨機策略只有迴圈上每一步的動作機率
+                  皆為 1 時才證實（需 policy 提供 action_probabilities），其餘只記錄為疑似迴圈。
+                  偵測表超過 LOOP_TRACK_MAX_ENTRIES 時回合分組依序評估。
+    """
+    env = env or MazeEnv()
+    recorded = np.arange(0, n_episodes, record_every) if record_every else np.zeros(0, dtype=int)
+    n_keys = env.maze.size * env.action_space.n
+    if detect_loops and n_keys > LOOP_TRACK_MAX_ENTRIES:
+        print("⚠️ 迷宮過大，停用迴圈偵測")
+        detect_loops = False
+    group = max(1, LOOP_TRACK_MAX_ENTRIES // n_keys) if detect_loops else n_episodes
+    if n_episodes <= group:
+        return _evaluate_group(policy, n_episodes, max_steps, deterministic, env, recorded, detect_loops)
+
+    parts = []
+    for start in range(0, n_episodes, group):
+        size = min(group, n_episodes - start)
+        local = recorded[(recorded >= start) & (recorded < start + size)] - start
+        parts.append(_evaluate_group(policy, size, max_steps, deterministic, env, local, detect_loops))
+    merged = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]
+              if isinstance(parts[0][name], np.ndarray) and name != "recorded_episodes"}
+    merged["optimal_steps"] = parts[0]["optimal_steps"]
+    merged["recorded_episodes"] = recorded
+    merged["trajectories"] = [path for part in parts for path in part["trajectories"]]
+    return merged
+
+def _evaluate_group(policy, n_episodes, max_steps, deterministic, env, recorded, detect_loops):
+    """同步推進一組回合；recorded 為要保留軌跡的回合（組內編號）"""
+    next_state, reward_table, done_table = env.next_state_table, env.reward_table, env.done_table
+    obs_table = env.obs_table
+    n_actions = env.action_space.n
+
+    cells = np.full(n_episodes, env.start_cell, dtype=next_state.dtype)
+    active = np.ones(n_episodes, dtype=bool)
+    success = np.zeros(n_episodes, dtype=bool)
+    steps = np.zeros(n_episodes, dtype=np.int32)
+    returns = np.zeros(n_episodes, dtype=np.float64)
+    action_counts = np.zeros((n_episodes, n_actions), dtype=np.int64)
+
+    trajectories = np.full((len(recorded), max_steps + 1), -1, dtype=next_state.dtype)
+    trajectories[:, 0] = env.start_cell
+
+    n_keys = env.maze.size * n_actions
+    loops = BatchLoopDetector(n_episodes, n_keys, deterministic=deterministic) if detect_loops else None
+    check_certain = loops is not None and not deterministic and hasattr(policy, "action_probabilities")
+
+    for t in range(max_steps):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+
+        actions, _ = policy.predict(obs_table[cells[idx]], deterministic=deterministic)
+        actions = np.asarray(actions, dtype=np.int64).reshape(-1)
+
+        if loops is not None:
+            # 以「動作前的位置 + 動作」為 key；確認迴圈的回合不再推進
+            certain = None
+            if check_certain:
+                certain = policy.action_probabilities(obs_table[cells[idx]])[np.arange(len(idx)), actions] >= 1.0
+            looped = loops.update(t + 1, idx, cells[idx] * n_actions + actions, certain)
+            if looped.any():
+                active[idx[looped]] = False
+                idx, actions = idx[~looped], actions[~looped]
+
+        new_cells = next_state[cells[idx], actions]
+        cells[idx] = new_cells
+        action_counts[idx, actions] += 1
+        steps[idx] += 1
+        returns[idx] += reward_table[new_cells]
+
+        finished = idx[done_table[new_cells]]
+        success[finished] = True
+        active[finished] = False
+
+        if len(recorded):
+            # 已結束的回合會維持在終點，於輸出時依 steps 截斷
+            trajectories[:, t + 1] = cells[recorded]
+
+    no_loop = np.full(n_episodes, -1, dtype=np.int32)
+    return {
+        "success": success,
+        "steps": steps,
+        "loop_entry_step": loops.loop_entry_step if loops is not None else no_loop,
+        "loop_length": loops.loop_length if loops is not None else no_loop,
+        "suspected_loop_entry_step": loops.suspected_entry_step if loops is not None else no_loop,
+        "suspected_loop_length": loops.suspected_length if loops is not None else no_loop,
+        "returns": returns,
+        "optimal_steps": env.optimal_path_length,
+        "action_counts": action_counts,
+        "entropy": entropy_from_counts(action_counts),
+        "recorded_episodes": recorded,
+        "trajectories": [trajectories[i, :steps[ep] + 1] for i, ep in enumerate(recorded)],
+    }
+
+# === 彙總統計 ===
+def path_efficiency(results):
+    """成功回合的 最短路徑步數 / 實際步數（1 = 走最短路徑）；終點無法抵達時為空陣列"""
+    optimal = results.get("optimal_steps", -1)
+    steps = results["steps"][results["success"]]
+    if optimal < 0 or len(steps) == 0:
+        return np.zeros(0, dtype=np.float64)
+    return optimal / np.maximum(steps, 1)
+
+def summarize_results(results):
+    success = results["success"]
+    steps = results["steps"]
+    total_counts = results["action_counts"].sum(axis=0)
+    efficiency = path_efficiency(results)
+    optimal = results.get("optimal_steps", -1)
+    return {
+        "episodes": int(len(success)),
+        "success_rate": float(success.mean()) if len(success) else 0.0,
+        "mean_steps_to_goal": float(steps[success].mean()) if success.any() else None,
+        "optimal_steps": int(optimal) if optimal >= 0 else None,
+        "mean_path_efficiency": float(efficiency.mean()) if len(efficiency) else None,
+        "mean_return": float(results["returns"].mean()) if len(success) else 0.0,
+        "mean_episode_entropy": float(results["entropy"].mean()) if len(success) else 0.0,
+        "action_entropy": float(entropy_from_counts(total_counts)[0]),
+        "loop_episodes": int((results["loop_length"] > 0).sum()),
+        "suspected_loop_episodes": int((results["suspected_loop_length"] > 0).sum()),
+    }
+
+# === 儲存結果：只寫彙總與（選擇性）軌跡 ===
+def save_results(results, run_dir, env=None, render=False):
+    env = env or MazeEnv()
+    os.makedirs(run_dir, exist_ok=True)
+
+    summary = summarize_results(results)
+    optimal = results.get("optimal_steps", -1)   # 多走的步數 = 實際步數 - 最短路徑（未成功為 -1）
+    with open(os.path.join(run_dir, "eval_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    pd.DataFrame({
+        "episode": np.arange(1, len(results["success"]) + 1),
+        "success": results["success"],
+        "steps": results["steps"],
+        "excess_steps": np.where(results["success"] & (optimal >= 0), results["steps"] - optimal, -1),
+        "return": results["returns"],
+        "entropy": results["entropy"],
+        "loop_entry_step": results["loop_entry_step"],
+        "loop_length": results["loop_length"],
+        "suspected_loop_entry_step": results["suspected_loop_entry_step"],
+        "suspected_loop_length": results["suspected_loop_length"],
+    }).to_csv(os.path.join(run_dir, "eval_episodes.csv"), index=False)
+
+    if len(results["recorded_episodes"]):
+        trajectories = {
+            f"episode_{ep + 1}": env.positions[cells]
+            for ep, cells in zip(results["recorded_episodes"], results["trajectories"])
+        }
+        np.savez_compressed(os.path.join(run_dir, "trajectories.npz"), **trajectories)
+
+        if render:
+            for name, path in trajectories.items():
+                env.state = path[-1]
+                print(f"🗺️ {name}（{len(path) - 1} 步）")
+                print(env.render_text(path=path))
+
+    return summary
+
+def evaluate_and_save(policy, run_dir, n_episodes=10_000, max_steps=1000, deterministic=False,
+                      render_every=0, env=None):
+    env = env or MazeEnv()
+    start = time.perf_counter()
+    results = evaluate_policy_batched(policy, n_episodes=n_episodes, max_steps=max_steps,
+                                      deterministic=deterministic, env=env, record_every=render_every)
+    elapsed = time.perf_counter() - start
+
+    summary = save_results(results, run_dir, env=env, render=bool(render_every))
+    print(f"⚡ {n_episodes} 回合評估完成，用時 {elapsed:.2f} 秒")
+    print(f"📊 成功率 {summary['success_rate']:.2%}，平均步數 {summary['mean_steps_to_goal']}"
+          f"（最短 {summary['optimal_steps']}，路徑效率 {summary['mean_path_efficiency']}），"
+          f"行動熵 {summary['action_entropy']:.4f}，迴圈提早結束 {summary['loop_episodes']} 回合"
+          f"（疑似迴圈 {summary['suspected_loop_episodes']} 回合）")
+    print(f"📄 評估結果儲存到 {run_dir}")
+    return summary
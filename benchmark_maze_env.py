@@ -0,0 +1,71 @@
+# benchmark_maze_env.py
+# ✅ 比較單一 MazeEnv 與批次 VecMazeEnv 的 steps/sec，並驗證兩者軌跡完全一致
+
+import time
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv
+from maze_env.maze_env import MazeEnv
+from maze_env.vec_maze_env import VecMazeEnv
+
+# === 驗證：VecMazeEnv 與 N 個獨立 MazeEnv 軌跡相同 ===
+def check_equivalence(num_envs=16, n_steps=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    reference = DummyVecEnv([MazeEnv for _ in range(num_envs)])
+    batched = VecMazeEnv(num_envs)
+
+    obs_ref = reference.reset()
+    obs_vec = batched.reset()
+    assert np.array_equal(obs_ref, obs_vec)
+
+    for _ in range(n_steps):
+        actions = rng.integers(0, 4, size=num_envs)
+        obs_ref, rew_ref, done_ref, info_ref = reference.step(actions)
+        obs_vec, rew_vec, done_vec, info_vec = batched.step(actions)
+
+        assert np.array_equal(obs_ref, obs_vec)
+        assert np.array_equal(rew_ref, rew_vec)
+        assert np.array_equal(done_ref, done_vec)
+        for a, b in zip(info_ref, info_vec):
+            assert np.array_equal(a["position"], b["position"])
+            if "terminal_observation" in a:
+                assert np.array_equal(a["terminal_observation"], b["terminal_observation"])
+
+    print(f"✅ 軌跡一致：{num_envs} 個環境 × {n_steps} 步")
+
+# === 測速：單一 MazeEnv ===
+def benchmark_single(n_steps=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, 4, size=n_steps)
+    env = MazeEnv()
+    env.reset()
+
+    start = time.perf_counter()
+    for action in actions:
+        _, _, terminated, _, _ = env.step(action)
+        if terminated:
+            env.reset()
+    elapsed = time.perf_counter() - start
+    return n_steps / elapsed
+
+# === 測速：批次 VecMazeEnv ===
+def benchmark_batched(num_envs=64, n_steps=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    n_calls = max(1, n_steps // num_envs)
+    actions = rng.integers(0, 4, size=(n_calls, num_envs))
+    env = VecMazeEnv(num_envs)
+    env.reset()
+
+    start = time.perf_counter()
+    for batch in actions:
+        env.step(batch)
+    elapsed = time.perf_counter() - start
+    return n_calls * num_envs / elapsed
+
+if __name__ == "__main__":
+    check_equivalence()
+
+    single = benchmark_single()
+    print(f"🐢 MazeEnv：{single:,.0f} steps/sec")
+    for num_envs in [1, 8, 64, 256]:
+        batched = benchmark_batched(num_envs=num_envs)
+        print(f"🚀 VecMazeEnv (N={num_envs})：{batched:,.0f} steps/sec（{batched / single:.1f}x）")
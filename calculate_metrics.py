@@ -1,23 +1,13 @@
 # calculate_metrics.py
-# ✅ 自動尋找最新 test_log.csv，計算 entropy 與智慧密度並輸出 metrics.csv
+# ✅ 自動尋找最新 test_log.csv，計算 entropy、智慧密度與轉移圖模組化程度 Q，並輸出 metrics.csv / episode_metrics.csv
 
-import pandas as pd 
+import argparse
 import numpy as np
 import os
-
-def find_latest_test_dir(base_dir="runs"):
-    all_dirs = []
-    for category in ["test", "test_many", "fast"]:
-        cat_path = os.path.join(base_dir, category)
-        if not os.path.exists(cat_path):
-            continue
-        for name in os.listdir(cat_path):
-            sub_path = os.path.join(cat_path, name)
-            if os.path.isdir(sub_path) and name.startswith(category):
-                all_dirs.append(sub_path)
-    if not all_dirs:
-        raise FileNotFoundError("❌ 找不到任何 test 類別的資料夾")
-    return sorted(all_dirs)[-1]
+from columnar_store import table_exists
+from metrics_engine import DEFAULT_STRIDE, DEFAULT_WINDOW, compute_metrics
+from run_catalog import record_artifact
+from run_discovery import find_latest_test_dir
 
 # === 計算行動熵（H） ===
 def calculate_entropy(actions):
@@ -26,29 +16,30 @@ def calculate_entropy(actions):
     probs = probs[probs > 0]
     return -np.sum(probs * np.log2(probs))
 
-# === 主流程 ===
-if __name__ == "__main__":
-    test_dir = find_latest_test_dir()
+# === 由 test_log 計算 metrics（batch_analyze 也會直接呼叫）===
+# metrics.csv：每 stride 步以最近 window 步計算 H / S（/ Q），step 為 window 結尾、episode 為所屬回合；
+# episode_metrics.csv：每回合一列
+def calculate_metrics(test_dir, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE, distinct=False):
     test_csv_path = os.path.join(test_dir, "test_log.csv")
     save_csv_path = os.path.join(test_dir, "metrics.csv")
+    episode_csv_path = os.path.join(test_dir, "episode_metrics.csv")
 
-    if not os.path.exists(test_csv_path):
+    if not table_exists(test_csv_path):
         raise FileNotFoundError(f"❌ 找不到 test_log.csv：{test_csv_path}")
 
-    test_df = pd.read_csv(test_csv_path)
-    actions = test_df['action'].values
-
-    entropy = calculate_entropy(actions)
-    total_steps = len(test_df)
-    success_steps = test_df['reward'].gt(0.5).sum()
-    params = 1e5
-    wisdom_density = success_steps / (total_steps * params)
+    n_windows, n_episodes = compute_metrics(test_csv_path, save_csv_path, episode_csv_path,
+                                            window=window, stride=stride, distinct=distinct)
+    print(f"✅ Metrics 儲存到：{save_csv_path}（{n_windows} 列）")
+    print(f"✅ 每回合 metrics 儲存到：{episode_csv_path}（{n_episodes} 回合）")
+    record_artifact(save_csv_path)
+    record_artifact(episode_csv_path)
+    return save_csv_path
 
-    metrics_df = pd.DataFrame({
-        "episode": np.arange(1, total_steps + 1),
-        "entropy": [entropy] * total_steps,
-        "wisdom_density": [wisdom_density] * total_steps
-    })
-
-    metrics_df.to_csv(save_csv_path, index=False)
-    print(f"✅ Metrics 儲存到：{save_csv_path}")
+# === 主流程 ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="滑動 window 的步數")
+    parser.add_argument("--stride", type=int, default=DEFAULT_STRIDE, help="每隔幾步計算一次（步數太少時自動縮小）")
+    parser.add_argument("--distinct", action="store_true", help="與上一列數值完全相同的 window 不輸出")
+    args = parser.parse_args()
+    calculate_metrics(find_latest_test_dir(), window=args.window, stride=args.stride, distinct=args.distinct)
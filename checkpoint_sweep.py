@@ -0,0 +1,115 @@
+# checkpoint_sweep.py
+# ✅ 平行評估每個訓練 run 的所有 checkpoint，輸出學習曲線表（依 checkpoint 雜湊快取，重跑只評估新檔案）
+
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from policy_table import file_sha256, load_policy
+from batch_evaluator import evaluate_policy_batched, summarize_results
+from run_catalog import run_checkpoints
+from run_discovery import find_run_dirs
+
+CACHE_NAME = "sweep_cache.json"
+CURVE_NAME = "learning_curve.csv"
+CURVE_METRICS = ("success_rate", "mean_steps_to_goal", "mean_path_efficiency", "action_entropy")
+
+# === 找出訓練 run 與其 checkpoint ===
+def find_train_runs(base_dir="runs"):
+    return find_run_dirs(base_dir, ("train",))
+
+def find_checkpoints(run_dir):
+    return run_checkpoints(run_dir)
+
+# === 單一 checkpoint 評估（在子行程中執行）===
+def _init_worker():
+    # 每個子行程只用一條 torch 執行緒，避免多行程互搶 CPU
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+def evaluate_checkpoint(model_path, n_episodes=1000, max_steps=1000, deterministic=False):
+    policy = load_policy(model_path)
+    results = evaluate_policy_batched(policy, n_episodes=n_episodes, max_steps=max_steps,
+                                      deterministic=deterministic)
+    summary = summarize_results(results)
+    return {name: summary[name] for name in CURVE_METRICS}
+
+# === 快取 ===
+def load_cache(run_dir):
+    cache_path = os.path.join(run_dir, CACHE_NAME)
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_cache(run_dir, cache):
+    cache_path = os.path.join(run_dir, CACHE_NAME)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+def cache_key(sha256, n_episodes, max_steps, deterministic):
+    return f"{sha256}:{n_episodes}:{max_steps}:{int(deterministic)}"
+
+# === 主流程 ===
+def sweep_runs(run_dirs, n_episodes=1000, max_steps=1000, deterministic=False, max_workers=None):
+    caches = {run_dir: load_cache(run_dir) for run_dir in run_dirs}
+    rows = {run_dir: [] for run_dir in run_dirs}
+    pending = []
+
+    for run_dir in run_dirs:
+        for step, path in find_checkpoints(run_dir):
+            sha256 = file_sha256(path)
+            key = cache_key(sha256, n_episodes, max_steps, deterministic)
+            row = {"step": step, "checkpoint": os.path.basename(path), "sha256": sha256}
+            # 舊版快取缺少後來加入的指標時重新評估
+            if set(CURVE_METRICS) <= set(caches[run_dir].get(key, ())):
+                rows[run_dir].append({**row, **caches[run_dir][key]})
+            else:
+                pending.append((run_dir, key, row, path))
+
+    print(f"🔍 共 {sum(len(r) for r in rows.values()) + len(pending)} 個 checkpoint，"
+          f"{len(pending)} 個需要評估")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(evaluate_checkpoint, path, n_episodes, max_steps, deterministic): (run_dir, key, row)
+                for run_dir, key, row, path in pending
+            }
+            for future in as_completed(futures):
+                run_dir, key, row = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ 評估失敗 {os.path.join(run_dir, row['checkpoint'])}：{e}")
+                    continue
+                caches[run_dir][key] = result
+                rows[run_dir].append({**row, **result})
+                print(f"✅ {os.path.basename(run_dir)}/{row['checkpoint']}：成功率 {result['success_rate']:.2%}")
+
+    curves = {}
+    for run_dir in run_dirs:
+        save_cache(run_dir, caches[run_dir])
+        if not rows[run_dir]:
+            continue
+        curve = pd.DataFrame(rows[run_dir]).sort_values("step")
+        curve = curve[["step", "checkpoint", *CURVE_METRICS, "sha256"]]
+        curve_path = os.path.join(run_dir, CURVE_NAME)
+        curve.to_csv(curve_path, index=False)
+        print(f"📈 學習曲線儲存到 {curve_path}")
+        curves[run_dir] = curve
+    return curves
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("runs", nargs="*", help="訓練 run 資料夾（預設為 runs/train 下全部）")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--max-steps", type=int, default=1000)
+    parser.add_argument("--deterministic", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sweep_runs(args.runs or find_train_runs(), n_episodes=args.episodes, max_steps=args.max_steps,
+               deterministic=args.deterministic, max_workers=args.workers)
@@ -0,0 +1,140 @@
+# checkpoint_writer.py
+# ✅ 非同步 checkpoint：訓練執行緒只在記憶體中快照策略 / 最佳化器狀態，序列化與寫檔交給背景執行緒
+#    - 同時最多一個寫入中（上一個還沒寫完時，下一次儲存會先等它完成）
+#    - 先寫到暫存檔再改名，讀取端永遠不會看到寫到一半的 zip
+#    - 保留策略：最近 keep_last 個 + 每 keep_every 步一個，其餘自動刪除
+#    產生的 zip 與 model.save 格式相同，可直接 PPO.load / load_policy
+
+import os
+import re
+import copy
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import torch as th
+import stable_baselines3 as sb3
+from stable_baselines3.common.save_util import data_to_json
+from stable_baselines3.common.utils import get_system_info
+from run_catalog import record_artifact, remove_artifact
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint_(\d+)\.zip$")
+
+# === 快照（訓練執行緒）===
+def snapshot_model(model):
+    """
+    與 BaseAlgorithm.save 相同的內容，但只在記憶體中複製：
+    類別屬性立即序列化成 JSON 字串，state_dict 深複製，之後訓練繼續更新參數也不影響快照。
+    """
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for torch_var in state_dicts_names + torch_variable_names:
+        exclude.add(torch_var.split(".")[0])
+    for param_name in exclude:
+        data.pop(param_name, None)
+
+    pytorch_variables = {name: copy.deepcopy(_getattr_path(model, name)) for name in torch_variable_names}
+    return {
+        "data": data_to_json(data),
+        "params": copy.deepcopy(model.get_parameters()),
+        "pytorch_variables": pytorch_variables,
+    }
+
+def _getattr_path(obj, name):
+    for attr in name.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+# === 寫檔（背景執行緒）===
+def write_snapshot(snapshot, path):
+    """把快照寫成 SB3 zip：先寫暫存檔，完成後原子改名"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        with zipfile.ZipFile(f, mode="w") as archive:
+            archive.writestr("data", snapshot["data"])
+            if snapshot["pytorch_variables"] is not None:
+                with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as var_file:
+                    th.save(snapshot["pytorch_variables"], var_file)
+            for file_name, state_dict in snapshot["params"].items():
+                with archive.open(file_name + ".pth", mode="w", force_zip64=True) as param_file:
+                    th.save(state_dict, param_file)
+            archive.writestr("_stable_baselines3_version", sb3.__version__)
+            archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+def select_expired(steps, keep_last=None, keep_every=None):
+    """依保留策略回傳要刪除的步數：最近 keep_last 個與 keep_every 的倍數保留，其餘刪除"""
+    if keep_last is None:
+        return []
+    steps = sorted(steps)
+    recent = set(steps[-keep_last:]) if keep_last > 0 else set()
+    return [step for step in steps
+            if step not in recent and not (keep_every and step % keep_every == 0)]
+
+class AsyncCheckpointWriter:
+    """
+    writer = AsyncCheckpointWriter(keep_last=3, keep_every=500_000)
+    writer.save(model, "runs/train_x/checkpoint_100000.zip", step=100_000)   # 只花快照時間
+    writer.close()                                                          # 等待最後一次寫入
+    """
+
+    def __init__(self, keep_last=None, keep_every=None, verbose=1):
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-writer")
+        self.pending = None
+        self.write_seconds = []   # 背景寫入耗時
+        self.failures = 0
+
+    def save(self, model, path, step=None):
+        """快照後交給背景寫入，回傳訓練執行緒被佔用的秒數（含等待上一次寫入）"""
+        started = time.perf_counter()
+        self.wait()
+        snapshot = snapshot_model(model)
+        self.pending = self.pool.submit(self._write, snapshot, path, step)
+        return time.perf_counter() - started
+
+    def _write(self, snapshot, path, step):
+        started = time.perf_counter()
+        try:
+            write_snapshot(snapshot, path)
+            record_artifact(path, kind="checkpoint", step=step)
+            self._apply_retention(os.path.dirname(path))
+        except Exception as e:
+            # 寫入失敗不中斷訓練，只回報
+            self.failures += 1
+            print(f"❌ checkpoint 寫入失敗 {path}：{e}")
+            return
+        self.write_seconds.append(time.perf_counter() - started)
+        if self.verbose:
+            print(f"✅ 自動儲存檢查點：{path}（背景寫入 {self.write_seconds[-1]:.2f}s）")
+
+    def _apply_retention(self, run_dir):
+        checkpoints = {}
+        for name in os.listdir(run_dir):
+            match = CHECKPOINT_PATTERN.fullmatch(name)
+            if match:
+                checkpoints[int(match.group(1))] = os.path.join(run_dir, name)
+        for step in select_expired(checkpoints, self.keep_last, self.keep_every):
+            path = checkpoints[step]
+            os.remove(path)
+            # 由 checkpoint 蒸餾出的策略查表一併刪除
+            table_path = os.path.splitext(path)[0] + ".policy.npz"
+            if os.path.exists(table_path):
+                os.remove(table_path)
+            remove_artifact(path)
+            if self.verbose:
+                print(f"🧹 依保留策略刪除 {path}")
+
+    def wait(self):
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,232 @@
+# columnar_store.py
+# ✅ 欄式二進位格式：metrics / rewards / test_log 每個欄位一個固定型別的 .bin 檔，讀取時直接 memmap
+#    <name>.csv 對應 <name>.cols/（schema.json + 各欄位 .bin），CSV 只是給人看的匯出檔
+#    讀取端一律優先使用欄式檔；若 CSV 比欄式檔新（例如手動編輯過），則改讀 CSV
+#    讀取端也接受 runs/archive 封存內的路徑（經由 run_fs，不必解壓）
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import run_fs
+
+COLUMNAR_SUFFIX = ".cols"
+SCHEMA_FILE = "schema.json"
+
+# === 分析流程中常見欄位的固定型別（型別種類相同時才套用，其餘欄位沿用 DataFrame 的型別）===
+COLUMN_DTYPES = {
+    "episode": np.int64,
+    "step": np.int64,
+    "entropy": np.float64,
+    "wisdom_density": np.float64,
+    "modularity": np.float64,
+    "cycle": np.int64,
+    "terminated": np.bool_,
+    "loop_entry_step": np.int32,
+    "loop_length": np.int32,
+}
+
+# === 路徑 ===
+def columnar_path(path):
+    """runs/x/metrics.csv → runs/x/metrics.cols"""
+    return os.path.splitext(path)[0] + COLUMNAR_SUFFIX
+
+def has_columnar(path):
+    """欄式檔存在，且沒有比它更新的 CSV"""
+    schema_path = os.path.join(columnar_path(path), SCHEMA_FILE)
+    if not run_fs.exists(schema_path):
+        return False
+    return not run_fs.exists(path) or run_fs.getmtime(schema_path) >= run_fs.getmtime(path)
+
+def table_exists(path):
+    return has_columnar(path) or run_fs.exists(path)
+
+def series_index(columns):
+    """metrics 表格的橫軸欄位：滑動 window 的列為 step（window 結尾步數），每回合一列的表格為 episode"""
+    return "step" if "step" in columns else "episode"
+
+def _csv_source(path):
+    # 磁碟上的 CSV 直接交給 pandas；封存內的 CSV 以串流開啟
+    return path if os.path.exists(path) else run_fs.open_file(path)
+
+# === schema ===
+def read_schema(path):
+    return run_fs.read_json(os.path.join(columnar_path(path), SCHEMA_FILE))
+
+def _write_schema(cols_dir, dtypes, rows):
+    schema = {
+        "columns": list(dtypes),
+        "dtypes": {name: np.dtype(dtype).str for name, dtype in dtypes.items()},
+        "rows": int(rows),
+    }
+    tmp_path = os.path.join(cols_dir, SCHEMA_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(cols_dir, SCHEMA_FILE))
+
+def table_columns(path):
+    """只讀欄位名稱（不載入資料）"""
+    if has_columnar(path):
+        return read_schema(path)["columns"]
+    return list(pd.read_csv(_csv_source(path), nrows=0).columns)
+
+# === 寫入端 ===
+class ColumnarAppender:
+    """
+    追加式欄式寫入器：每次 append 把各欄位的位元組接到對應的 .bin 檔尾端，
+    再以原子方式更新 schema.json 的列數。中途當機時，讀取端只看到最後一次完整寫入的列數。
+    """
+
+    def __init__(self, path, columns):
+        self.cols_dir = columnar_path(path)
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.rows = 0
+
+        os.makedirs(self.cols_dir, exist_ok=True)
+        for name in self.dtypes:
+            open(os.path.join(self.cols_dir, f"{name}.bin"), "wb").close()
+        _write_schema(self.cols_dir, self.dtypes, 0)
+
+    def append(self, columns):
+        n = len(columns[next(iter(self.dtypes))])
+        if n == 0:
+            return
+        for name, dtype in self.dtypes.items():
+            with open(os.path.join(self.cols_dir, f"{name}.bin"), "ab") as f:
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self.rows += n
+        _write_schema(self.cols_dir, self.dtypes, self.rows)
+
+def _table_dtypes(df, dtypes=None):
+    dtypes = dtypes or {}
+    result = {}
+    for name in df.columns:
+        if name in dtypes:
+            result[name] = np.dtype(dtypes[name])
+        elif name in COLUMN_DTYPES and np.dtype(COLUMN_DTYPES[name]).kind == df[name].dtype.kind:
+            result[name] = np.dtype(COLUMN_DTYPES[name])
+        elif df[name].dtype == object:
+            result[name] = df[name].to_numpy(dtype=str).dtype  # 固定寬度 unicode
+        else:
+            result[name] = df[name].dtype
+    return result
+
+def _table_columns(df, table_dtypes):
+    return {name: df[name].to_numpy(dtype=str) if dtype.kind == "U" else df[name].to_numpy()
+            for name, dtype in table_dtypes.items()}
+
+def save_table(df, path, dtypes=None, export_csv=True):
+    """
+    把 DataFrame 存成欄式格式；export_csv=True 時同時輸出 CSV。
+    CSV 先寫，schema 最後寫，確保欄式檔的時間戳記不早於 CSV。
+    """
+    if export_csv:
+        df.to_csv(path, index=False)
+    elif os.path.exists(path):
+        os.remove(path)  # 避免留下過時的 CSV
+
+    table_dtypes = _table_dtypes(df, dtypes)
+    ColumnarAppender(path, table_dtypes).append(_table_columns(df, table_dtypes))
+    return columnar_path(path)
+
+def save_table_chunks(chunks, path, dtypes=None, export_csv=True):
+    """
+    分塊寫出整張表（記憶體用量只取決於分塊大小）。先寫到暫存檔，完成後才取代原檔，
+    因此可以一邊讀取同一張表的分塊、一邊寫出新版本。
+    """
+    tmp_path = path + ".tmp"
+    tmp_cols = columnar_path(tmp_path)
+    appender = None
+    csv_file = open(tmp_path, "w", encoding="utf-8", newline="") if export_csv else None
+    try:
+        for chunk in chunks:
+            if appender is None:
+                table_dtypes = _table_dtypes(chunk, dtypes)
+                appender = ColumnarAppender(tmp_path, table_dtypes)
+                if csv_file is not None:
+                    csv_file.write(",".join(chunk.columns) + "\n")
+            if csv_file is not None:
+                chunk.to_csv(csv_file, header=False, index=False)
+            appender.append(_table_columns(chunk, table_dtypes))
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+    if appender is None:
+        raise ValueError(f"❌ 沒有任何資料可寫入：{path}")
+
+    if export_csv:
+        os.replace(tmp_path, path)
+    elif os.path.exists(path):
+        os.remove(path)
+    shutil.rmtree(columnar_path(path), ignore_errors=True)
+    os.replace(tmp_cols, columnar_path(path))
+    os.utime(os.path.join(columnar_path(path), SCHEMA_FILE))
+    return columnar_path(path)
+
+def convert_csv(path, dtypes=None):
+    """把既有 CSV 轉成欄式格式（保留原 CSV）；欄式檔已是最新則略過"""
+    if not has_columnar(path):
+        df = pd.read_csv(path)
+        table_dtypes = _table_dtypes(df, dtypes)
+        ColumnarAppender(path, table_dtypes).append(_table_columns(df, table_dtypes))
+    return columnar_path(path)
+
+# === 讀取端 ===
+def load_columns(path, columns=None):
+    """
+    以 memmap 讀出各欄位（唯讀、不複製；封存內的欄式檔改為唯讀的記憶體陣列）。沒有欄式檔時退回讀 CSV。
+    回傳 {欄位名稱: ndarray}
+    """
+    if not has_columnar(path):
+        df = pd.read_csv(_csv_source(path), usecols=columns)
+        return {name: df[name].to_numpy() for name in (columns or df.columns)}
+
+    schema = read_schema(path)
+    cols_dir = columnar_path(path)
+    rows = schema["rows"]
+    result = {}
+    for name in columns or schema["columns"]:
+        if name not in schema["dtypes"]:
+            raise KeyError(f"❌ 欄位不存在：{name}（{cols_dir}）")
+        dtype = np.dtype(schema["dtypes"][name])
+        bin_path = os.path.join(cols_dir, f"{name}.bin")
+        if rows == 0:
+            result[name] = np.zeros(0, dtype=dtype)
+        elif not os.path.exists(bin_path):
+            result[name] = np.frombuffer(run_fs.read_bytes(bin_path), dtype=dtype, count=rows)
+        else:
+            result[name] = np.memmap(bin_path, dtype=dtype, mode="r", shape=(rows,))
+    return result
+
+def load_table(path, columns=None):
+    """讀成 DataFrame（欄式檔優先）"""
+    if not has_columnar(path):
+        return pd.read_csv(_csv_source(path), usecols=columns)
+    data = load_columns(path, columns)
+    return pd.DataFrame({name: np.array(values) for name, values in data.items()})
+
+def iter_table_chunks(path, chunksize=100_000, columns=None):
+    """分塊讀取，記憶體用量與檔案大小無關"""
+    if not has_columnar(path):
+        yield from pd.read_csv(_csv_source(path), chunksize=chunksize, usecols=columns)
+        return
+    data = load_columns(path, columns)
+    rows = len(next(iter(data.values()))) if data else 0
+    for start in range(0, rows, chunksize):
+        yield pd.DataFrame({name: np.array(values[start:start + chunksize]) for name, values in data.items()},
+                           index=pd.RangeIndex(start, min(start + chunksize, rows)))
+
+def write_csv_export(path, chunksize=100_000):
+    """由欄式檔重新產生 CSV（給人看 / 給外部工具用）"""
+    chunks = iter_table_chunks(path, chunksize=chunksize)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, header=(i == 0), index=False)
+        if f.tell() == 0:
+            f.write(",".join(read_schema(path)["columns"]) + "\n")
+    os.replace(tmp_path, path)
+    # CSV 內容與欄式檔相同，更新 schema 時間戳記讓讀取端繼續使用欄式檔
+    os.utime(os.path.join(columnar_path(path), SCHEMA_FILE))
+    return path
@@ -1,58 +1,54 @@
 # 🧠 cycle_marker_utils.py
-# 進階智慧週期標記器：依據 H / S / terminated 自動切段加入 cycle 編號
+# 進階智慧週期標記器：依據 H / S / terminated 自動切段加入 cycle 編號（切段核心見 cycle_segmentation）
 
-import pandas as pd
 import os
-
-# === 可調參數 ===
-H_THRESHOLD = 0.002       # 若 H 的變化幅度大於此值，視為新 cycle 起點
-S_THRESHOLD = 1e-6        # 若 S 有跳動，也可能視為切段依據
-TERMINATE_SPLIT = True    # 若 terminated=True，自動換 cycle
+from columnar_store import iter_table_chunks, load_table, save_table, save_table_chunks, table_columns, table_exists
+from cycle_segmentation import H_THRESHOLD, S_THRESHOLD, TERMINATE_SPLIT, iter_segmented_chunks, segment_cycles
 
 # === 主邏輯 ===
-def add_cycle_markers(metrics_path):
-    df = pd.read_csv(metrics_path)
-
-    if 'cycle' in df.columns:
+def add_cycle_markers(metrics_path, chunksize=None):
+    """
+    加入 cycle 欄位並寫回 metrics（欄式檔 + CSV 匯出），回傳 cycle 切換點。
+    chunksize：分塊處理（百萬列以上的檔案），記憶體用量只取決於分塊大小。
+    """
+    if 'cycle' in table_columns(metrics_path):
         print("⚠️ 已有 cycle 欄位，將覆寫舊值")
 
-    cycle_id = 1
-    cycle_col = []
-    last_H = df.loc[0, 'entropy']
-    last_S = df.loc[0, 'wisdom_density']
+    thresholds = dict(h_threshold=H_THRESHOLD, s_threshold=S_THRESHOLD, terminate_split=TERMINATE_SPLIT)
 
-    for idx, row in df.iterrows():
-        H_diff = abs(row['entropy'] - last_H)
-        S_diff = abs(row['wisdom_density'] - last_S)
-
-        split = False
-        if H_diff > H_THRESHOLD:
-            split = True
-        if S_diff > S_THRESHOLD:
-            split = True
-        if TERMINATE_SPLIT and row.get('terminated', False):
-            split = True
+    if chunksize is None:
+        df = load_table(metrics_path)
+        cycle_ids, transitions = segment_cycles(df, **thresholds)
+        df['cycle'] = cycle_ids
+        save_table(df, metrics_path)
+        n_cycles = int(cycle_ids[-1]) if len(cycle_ids) else 1
+    else:
+        transitions = []
+        n_cycles = 1
 
-        if split and idx != 0:
-            cycle_id += 1
+        def marked_chunks():
+            nonlocal n_cycles
+            segmented = iter_segmented_chunks(iter_table_chunks(metrics_path, chunksize), **thresholds)
+            for chunk, cycle_ids, chunk_transitions in segmented:
+                chunk['cycle'] = cycle_ids
+                transitions.extend(chunk_transitions)
+                n_cycles = int(cycle_ids[-1])
+                yield chunk
 
-        cycle_col.append(cycle_id)
-        last_H = row['entropy']
-        last_S = row['wisdom_density']
+        save_table_chunks(marked_chunks(), metrics_path)
 
-    df['cycle'] = cycle_col
-    df.to_csv(metrics_path, index=False)
-    print(f"✅ 已加入 cycle 欄位，總共有 {cycle_id} 段。")
+    print(f"✅ 已加入 cycle 欄位，總共有 {n_cycles} 段。")
+    return transitions
 
 
 # === 測試執行（選擇性，可獨立執行） ===
 if __name__ == "__main__":
-    from auto_analyze_latest_run import find_latest_test_dir
+    from run_discovery import find_latest_test_dir
 
     latest_dir = find_latest_test_dir()
     metrics_path = os.path.join(latest_dir, "metrics.csv")
 
-    if not os.path.exists(metrics_path):
+    if not table_exists(metrics_path):
         print(f"❌ 找不到 metrics.csv：{metrics_path}")
     else:
         print(f"📂 載入最新測試資料夾：{latest_dir}")
@@ -0,0 +1,116 @@
+# cycle_segmentation.py
+# ✅ 共用的 cycle 切段核心：以陣列差分 + 累加和，一次算出每列的 cycle 編號與 cycle 切換點表
+#    cycle_marker_utils 與 cycle_transition_detector 共用同一套 H / S / terminated 門檻邏輯
+#    分塊模式只需跨塊攜帶上一列的 H / S 與目前的 cycle 編號，百萬列以上的檔案也只佔固定記憶體
+
+import numpy as np
+from columnar_store import iter_table_chunks, load_table, series_index
+
+# === 可調參數 ===
+H_THRESHOLD = 0.002       # 若 H 的變化幅度大於此值，視為新 cycle 起點
+S_THRESHOLD = 1e-6        # 若 S 有跳動，也可能視為切段依據
+TERMINATE_SPLIT = True    # 若 terminated=True，自動換 cycle
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+class SegmentState:
+    """跨分塊攜帶的狀態：上一列的 H / S（原始型別）與目前的 cycle 編號"""
+
+    def __init__(self):
+        self.last_H = None
+        self.last_S = None
+        self.cycle_id = 1
+
+def _row_values(chunk, column, row_dtype):
+    # 與逐列 iterrows 取得的值型別一致：有非數值欄位時是 Python 物件，否則是所有欄位的共同型別
+    return chunk[column].to_numpy(dtype=row_dtype)
+
+def _shifted(values, last):
+    prev = np.empty_like(values)
+    prev[0] = values[0] if last is None else last
+    prev[1:] = values[:-1]
+    return prev
+
+def segment_chunk(chunk, state=None, h_threshold=H_THRESHOLD, s_threshold=S_THRESHOLD,
+                  terminate_split=TERMINATE_SPLIT):
+    """
+    切段一個 DataFrame 分塊（需含 step 或 episode / entropy / wisdom_density，terminated 可選）。
+    回傳 (cycle_ids, transitions, state)：
+    - cycle_ids：每列的 cycle 編號（從 1 起算）
+    - transitions：cycle 切換點 [{step 或 episode, H_diff, S_diff, terminated}]，數值與逐列版本完全相同
+    """
+    state = state or SegmentState()
+    n = len(chunk)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), [], state
+
+    row_dtype = chunk.iloc[:1].to_numpy().dtype
+    H = _row_values(chunk, 'entropy', row_dtype)
+    S = _row_values(chunk, 'wisdom_density', row_dtype)
+    prev_H = _shifted(H, state.last_H)
+    prev_S = _shifted(S, state.last_S)
+
+    # 切段判斷一律以 float64 陣列運算
+    H_diff = np.abs(H.astype(np.float64) - prev_H.astype(np.float64))
+    S_diff = np.abs(S.astype(np.float64) - prev_S.astype(np.float64))
+    if 'terminated' in chunk.columns:
+        terminated = chunk['terminated'].to_numpy().astype(bool)
+    else:
+        terminated = np.zeros(n, dtype=bool)
+
+    split = (H_diff > h_threshold) | (S_diff > s_threshold)
+    if terminate_split:
+        split |= terminated
+    if state.last_H is None:
+        split[0] = False  # 第一列永遠屬於 cycle 1
+
+    cycle_ids = state.cycle_id + np.cumsum(split, dtype=np.int64)
+
+    # 切換點表：只對切換列用原始型別重算差值與四捨五入，確保與逐列版本逐位相同
+    idx = np.flatnonzero(split)
+    index = series_index(chunk.columns)
+    positions = _row_values(chunk, index, row_dtype)[idx]
+    h_jump = np.abs(H[idx] - prev_H[idx])
+    s_jump = np.abs(S[idx] - prev_S[idx])
+    if row_dtype == object:
+        h_jump = [round(v, 5) for v in h_jump]
+        s_jump = [round(v, 8) for v in s_jump]
+    else:
+        h_jump = np.round(h_jump, 5)
+        s_jump = np.round(s_jump, 8)
+    transitions = [
+        {index: pos, "H_diff": h, "S_diff": s, "terminated": bool(t)}
+        for pos, h, s, t in zip(positions, h_jump, s_jump, terminated[idx])
+    ]
+
+    state.last_H = H[-1]
+    state.last_S = S[-1]
+    state.cycle_id = int(cycle_ids[-1])
+    return cycle_ids, transitions, state
+
+def iter_segmented_chunks(chunks, **thresholds):
+    """逐塊切段：yield (chunk, cycle_ids, transitions)"""
+    state = SegmentState()
+    for chunk in chunks:
+        cycle_ids, transitions, state = segment_chunk(chunk, state, **thresholds)
+        yield chunk, cycle_ids, transitions
+
+def segment_cycles(df, **thresholds):
+    """一次切段整個 DataFrame，回傳 (cycle_ids, transitions)"""
+    cycle_ids, transitions, _ = segment_chunk(df, **thresholds)
+    return cycle_ids, transitions
+
+def segment_file(metrics_path, chunksize=None, **thresholds):
+    """
+    切段 metrics 檔案（欄式檔優先）。chunksize=None 時一次載入；
+    指定 chunksize 時分塊讀取，只保留 cycle 編號與切換點。
+    """
+    if chunksize is None:
+        return segment_cycles(load_table(metrics_path), **thresholds)
+
+    all_ids, all_transitions = [], []
+    for _, cycle_ids, transitions in iter_segmented_chunks(iter_table_chunks(metrics_path, chunksize), **thresholds):
+        all_ids.append(cycle_ids)
+        all_transitions.extend(transitions)
+    cycle_ids = np.concatenate(all_ids) if all_ids else np.zeros(0, dtype=np.int64)
+    return cycle_ids, all_transitions
@@ -3,60 +3,15 @@
 
 import pandas as pd
 import os
-
-# === 可調參數 ===
-H_THRESHOLD = 0.002         # entropy 變動門檻
-S_THRESHOLD = 1e-6          # wisdom density 跳動門檻
-TERMINATE_SPLIT = True      # 是否依照 terminated 判斷切段
-
-# === 自動找出最新資料夾 ===
-def find_latest_test_dir(base_dir="runs"):
-    all_dirs = []
-    for category in ["test", "test_many", "fast"]:
-        cat_path = os.path.join(base_dir, category)
-        if not os.path.exists(cat_path):
-            continue
-        for name in os.listdir(cat_path):
-            sub_path = os.path.join(cat_path, name)
-            if os.path.isdir(sub_path) and name.startswith(category):
-                all_dirs.append(sub_path)
-    if not all_dirs:
-        raise FileNotFoundError("❌ 找不到任何 test 類別的資料夾")
-    return sorted(all_dirs)[-1]
-
+from columnar_store import table_exists
+from cycle_segmentation import H_THRESHOLD, S_THRESHOLD, TERMINATE_SPLIT, segment_file
+from run_discovery import find_latest_test_dir
 
 # === 主邏輯：標記 cycle 切換事件 ===
-def detect_cycle_transitions(metrics_path):
-    df = pd.read_csv(metrics_path)
-    transitions = []
-
-    last_H = df.loc[0, 'entropy']
-    last_S = df.loc[0, 'wisdom_density']
-
-    for idx, row in df.iterrows():
-        H_diff = abs(row['entropy'] - last_H)
-        S_diff = abs(row['wisdom_density'] - last_S)
-        terminated = bool(row.get('terminated', False))
-
-        split = False
-        if H_diff > H_THRESHOLD:
-            split = True
-        if S_diff > S_THRESHOLD:
-            split = True
-        if TERMINATE_SPLIT and terminated:
-            split = True
-
-        if split and idx != 0:
-            transitions.append({
-                "episode": row['episode'],
-                "H_diff": round(H_diff, 5),
-                "S_diff": round(S_diff, 8),
-                "terminated": terminated
-            })
-
-        last_H = row['entropy']
-        last_S = row['wisdom_density']
-
+def detect_cycle_transitions(metrics_path, chunksize=None):
+    """chunksize：分塊讀取（百萬列以上的檔案），只保留切換點"""
+    _, transitions = segment_file(metrics_path, chunksize=chunksize, h_threshold=H_THRESHOLD,
+                                  s_threshold=S_THRESHOLD, terminate_split=TERMINATE_SPLIT)
     return transitions
 
 
@@ -65,7 +20,7 @@ if __name__ == "__main__":
     latest_dir = find_latest_test_dir()
     test_metrics = os.path.join(latest_dir, "metrics.csv")
 
-    if not os.path.exists(test_metrics):
+    if not table_exists(test_metrics):
         raise FileNotFoundError(f"❌ 找不到 metrics.csv：{test_metrics}")
 
     result = detect_cycle_transitions(test_metrics)
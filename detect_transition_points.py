@@ -4,70 +4,66 @@
 import pandas as pd
 import numpy as np
 import os
+from columnar_store import load_table, series_index, table_columns
+from run_discovery import find_latest_test_dir
 
 # === 可調參數 ===
 ENTROPY_JUMP = 0.05          # 如果 H 的變化大於這個值，視為轉變點
 WISDOM_MIN_JUMP = 1e-5       # 如果 S 突然上升（或下降）
 WINDOW_SIZE = 3              # 使用滑動窗口平滑資料
-
-# === 自動尋找最新測試資料夾 ===
-def find_latest_test_dir(base_dir="runs"):
-    all_dirs = []
-    for category in ["test", "test_many", "fast"]:
-        cat_path = os.path.join(base_dir, category)
-        if not os.path.isdir(cat_path): continue
-        for f in os.listdir(cat_path):
-            full_path = os.path.join(cat_path, f)
-            if os.path.isdir(full_path):
-                all_dirs.append(full_path)
-    return sorted(all_dirs)[-1] if all_dirs else None
+TRANSITION_COLUMNS = ['h', 's', 'h_jump', 's_jump', 'reason']   # 前面再加上位置欄位（step 或 episode）
 
 # === 計算移動平均 ===
 def smooth(values, window=3):
     return np.convolve(values, np.ones(window)/window, mode='same')
 
-# === 偵測轉變點 ===
-def detect_transitions(metrics_path, save_path=None):
-    df = pd.read_csv(metrics_path)
-
-    H = df['entropy'].values
-    S = df['wisdom_density'].values
-    episodes = df['episode'].values
-
+# === 由 H / S 陣列找出轉變點（event_extraction 也直接呼叫）===
+def find_transitions(positions, H, S, index="episode"):
+    """positions 為各列的位置（index 欄位：episode，或滑動 window metrics 的 step）"""
     H_smooth = smooth(H, WINDOW_SIZE)
     S_smooth = smooth(S, WINDOW_SIZE)
 
-    transition_points = []
+    # 第 i 列與第 i-1 列的平滑值差
+    h_diff = np.abs(np.diff(H_smooth))
+    s_diff = np.abs(np.diff(S_smooth))
+    h_hit = h_diff > ENTROPY_JUMP
+    s_hit = s_diff > WISDOM_MIN_JUMP
+    idx = np.flatnonzero(h_hit | s_hit)
+    if len(idx) == 0:
+        return pd.DataFrame(columns=[index] + TRANSITION_COLUMNS)  # 沒有轉變點時仍寫出欄位名稱
 
-    for i in range(1, len(H_smooth)):
-        h_diff = abs(H_smooth[i] - H_smooth[i-1])
-        s_diff = abs(S_smooth[i] - S_smooth[i-1])
+    rows = idx + 1
+    return pd.DataFrame({
+        index: np.asarray(positions)[rows].astype(np.int64),
+        'h': H[rows],
+        's': S[rows],
+        'h_jump': np.round(h_diff[idx], 5),
+        's_jump': np.round(s_diff[idx], 8),
+        'reason': np.where(h_hit[idx] & s_hit[idx], 'H + S', np.where(h_hit[idx], 'H', 'S')),
+    })
 
-        if h_diff > ENTROPY_JUMP or s_diff > WISDOM_MIN_JUMP:
-            transition_points.append({
-                'episode': int(episodes[i]),
-                'h': H[i],
-                's': S[i],
-                'h_jump': round(h_diff, 5),
-                's_jump': round(s_diff, 8),
-                'reason': f"{'H' if h_diff > ENTROPY_JUMP else ''}{' + ' if h_diff > ENTROPY_JUMP and s_diff > WISDOM_MIN_JUMP else ''}{'S' if s_diff > WISDOM_MIN_JUMP else ''}"
-            })
+# === 偵測轉變點 ===
+def detect_transitions(metrics_path, save_path=None):
+    index = series_index(table_columns(metrics_path))
+    df = load_table(metrics_path, columns=[index, 'entropy', 'wisdom_density'])
+    result_df = find_transitions(df[index].values, df['entropy'].values, df['wisdom_density'].values, index=index)
+    save_transitions(result_df, save_path)
+    return result_df
 
-    result_df = pd.DataFrame(transition_points)
+def save_transitions(result_df, save_path=None):
     if save_path:
         result_df.to_csv(save_path, index=False)
         print(f"✅ 轉變點已儲存：{save_path}")
     else:
         print("✅ 偵測完成，未指定儲存路徑。")
 
-    return result_df
-
 # === 主程式入口 ===
 if __name__ == "__main__":
-    latest_dir = find_latest_test_dir()
-    if latest_dir:
+    try:
+        latest_dir = find_latest_test_dir()
+    except FileNotFoundError:
+        print("❌ 找不到任何測試資料夾！")
+    else:
         metrics_path = os.path.join(latest_dir, "metrics.csv")
         output_path = os.path.join(latest_dir, "transition_points.csv")
         detect_transitions(metrics_path, save_path=output_path)
-    else:
-        print("❌ 找不到任何測試資料夾！")
@@ -0,0 +1,53 @@
+# event_extraction.py
+# ✅ 一次讀取 metrics，產出所有事件表：
+#    - transition_points.csv（H / S 平滑後的跳動，detect_transition_points）
+#    - cycle_transition_points.csv（cycle 切換點，cycle_segmentation）
+#    - q_events.json（modularity Q 的轉變，q_event_logger；沒有 modularity 欄位時略過）
+#    各事件族的判斷都是陣列運算，輸出與個別模組單獨執行時逐位元相同
+
+import os
+import pandas as pd
+from columnar_store import load_table, series_index
+from cycle_segmentation import H_THRESHOLD, S_THRESHOLD, TERMINATE_SPLIT, segment_cycles
+from detect_transition_points import find_transitions, save_transitions
+from q_event_logger import find_q_events, save_q_events
+from run_discovery import find_latest_test_dir
+
+TRANSITIONS_NAME = "transition_points.csv"
+CYCLE_TRANSITIONS_NAME = "cycle_transition_points.csv"
+Q_EVENTS_NAME = "q_events.json"
+CYCLE_TRANSITION_COLUMNS = ["H_diff", "S_diff", "terminated"]   # 前面再加上位置欄位（step 或 episode）
+
+def extract_events(metrics_path):
+    """
+    回傳 {"index": 位置欄位, "transitions": DataFrame, "cycle_transitions": [dict], "q_events": [dict] 或 None}。
+    cycle 切段使用完整的表格（數值型別與 detect_cycle_transitions 一致）
+    """
+    df = load_table(metrics_path)
+    index = series_index(df.columns)
+    positions = df[index].values
+    _, cycle_transitions = segment_cycles(df, h_threshold=H_THRESHOLD, s_threshold=S_THRESHOLD,
+                                          terminate_split=TERMINATE_SPLIT)
+    q_events = None
+    if 'modularity' in df.columns:
+        q_events = find_q_events(positions, df['modularity'].values, index=index)
+    return {
+        "index": index,
+        "transitions": find_transitions(positions, df['entropy'].values, df['wisdom_density'].values, index=index),
+        "cycle_transitions": cycle_transitions,
+        "q_events": q_events,
+    }
+
+def save_events(events, run_dir):
+    save_transitions(events["transitions"], os.path.join(run_dir, TRANSITIONS_NAME))
+    print(f"🌀 共偵測到 {len(events['cycle_transitions'])} 個 cycle transition")
+    pd.DataFrame(events["cycle_transitions"], columns=[events["index"]] + CYCLE_TRANSITION_COLUMNS).to_csv(
+        os.path.join(run_dir, CYCLE_TRANSITIONS_NAME), index=False)
+    if events["q_events"] is None:
+        print("⏭️ metrics 沒有 modularity 欄位，略過 Q 事件")
+    else:
+        save_q_events(events["q_events"], os.path.join(run_dir, Q_EVENTS_NAME))
+
+if __name__ == "__main__":
+    latest_dir = find_latest_test_dir()
+    save_events(extract_events(os.path.join(latest_dir, "metrics.csv")), latest_dir)
@@ -1,29 +1,93 @@
 import os
+import multiprocessing
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
+from concurrent.futures import ProcessPoolExecutor
+from columnar_store import load_table, series_index, table_columns
+
+# === 可調參數 ===
+R_MIN, R_MAX = 2.5, 4.0
+N_GRID = 5000              # 粗搜尋：與原本逐一嘗試相同的 r 網格
+REFINE_LEVELS = 2          # 細搜尋層數：每層在目前最佳 r 的 ±1 格內再切 REFINE_POINTS 份
+REFINE_POINTS = 65
+PARALLEL_MIN_WORK = 5_000_000  # 總疊代量（序列長度 × 網格點數）低於此值時不開行程池
+# 圖例最多列出幾個 cycle：每個 cycle 佔兩個圖例項目，上千個 cycle 時 matplotlib 排版圖例要數分鐘且完全看不清，
+# 超過時不畫圖例（各 cycle 的 r 仍完整寫在 logistic_fit_summary.csv）；None = 一律畫圖例（舊行為）
+LEGEND_MAX_CYCLES = 20
 
 def logistic_map(x, r):
     return r * x * (1 - x)
 
-def fit_logistic(H_sequence):
-    x0 = H_sequence[0]
-    y_true = H_sequence[1:]
-
-    def loss(r):
-        x = x0
-        return sum(((x := logistic_map(x, r)) - y)**2 for y in y_true)
-
-    r_values = np.linspace(2.5, 4.0, 5000)
-    losses = [loss(r) for r in r_values]
-    best_r = r_values[np.argmin(losses)]
+def logistic_losses(H_sequence, r_values):
+    """
+    對所有候選 r 同時疊代 logistic map（每個時間步一次陣列運算），回傳各 r 的平方誤差總和。
+    累加順序與逐一計算相同，因此數值完全一致。
+    """
+    r_values = np.asarray(r_values, dtype=np.float64)
+    x = np.full(r_values.shape, H_sequence[0], dtype=np.float64)
+    losses = np.zeros(r_values.shape)
+    with np.errstate(over="ignore", invalid="ignore"):
+        for y in H_sequence[1:]:
+            x = logistic_map(x, r_values)
+            losses += (x - y) ** 2
+    return losses
+
+def fit_logistic(H_sequence, r_min=R_MIN, r_max=R_MAX, n_grid=N_GRID,
+                 refine_levels=REFINE_LEVELS, refine_points=REFINE_POINTS):
+    """
+    粗到細搜尋最佳 r：先在完整網格上找最小誤差，再於最佳點附近逐層加密。
+    細搜尋只接受誤差更小的 r，因此結果與純網格搜尋相差不超過一個網格間距。
+    """
+    r_values = np.linspace(r_min, r_max, n_grid)
+    losses = logistic_losses(H_sequence, r_values)
+    best = np.argmin(losses)
+    best_r, best_loss = r_values[best], losses[best]
+
+    step = r_values[1] - r_values[0] if n_grid > 1 else 0.0
+    for _ in range(refine_levels):
+        if not np.isfinite(best_loss) or step == 0.0:
+            break
+        fine = np.linspace(max(best_r - step, r_min), min(best_r + step, r_max), refine_points)
+        fine_losses = logistic_losses(H_sequence, fine)
+        best = np.argmin(fine_losses)
+        if fine_losses[best] < best_loss:
+            best_r, best_loss = fine[best], fine_losses[best]
+        step = fine[1] - fine[0]
     return best_r
 
-def fit_logistic_map(metrics_csv_path, output_path):
-    df = pd.read_csv(metrics_csv_path)
-    if 'cycle' not in df.columns:
+def _fit_cycle(H_sequence):
+    try:
+        return fit_logistic(H_sequence), None
+    except Exception as e:
+        return None, str(e)
+
+def fit_cycles(sequences, max_workers=None):
+    """
+    擬合多個獨立 cycle，回傳 [(best_r, error)]。
+    計算量夠大時分散到多個 CPU 核心，短序列則直接在本行程計算。
+    已在子行程中（例如 batch_analyze 的每個 run）時不再開巢狀行程池。
+    """
+    work = sum(len(seq) for seq in sequences) * N_GRID
+    if max_workers == 1 or len(sequences) < 2 or work < PARALLEL_MIN_WORK \
+            or multiprocessing.parent_process() is not None:
+        return [_fit_cycle(seq) for seq in sequences]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(sequences) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_fit_cycle, sequences, chunksize=chunksize))
+
+def fit_logistic_map(metrics_csv_path, output_path, max_workers=None, legend_max_cycles=LEGEND_MAX_CYCLES):
+    """
+    回傳 logistic_fit_summary.csv 的路徑；沒有可擬合的 cycle 時不產生輸出，回傳 None。
+    有效 cycle 超過 legend_max_cycles 個時圖上不畫圖例（None = 一律畫）
+    """
+    columns = table_columns(metrics_csv_path)
+    if 'cycle' not in columns:
         raise ValueError("❌ 缺少 'cycle' 欄位，請先執行語法標記器加入 cycle 編號。")
+    index = series_index(columns)   # 滑動 window 的 metrics 以 step 為橫軸
+    df = load_table(metrics_csv_path, columns=[index, 'entropy', 'cycle'])
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     result_records = []
@@ -31,19 +95,26 @@ def fit_logistic_map(metrics_csv_path, output_path):
 
     valid_cycle_count = 0  # 計數有效 cycle
 
+    groups = []
     for cycle_id, group in df.groupby('cycle'):
         H_seq = group['entropy'].values  # 👈 記得是 entropy，不是 h
         if len(H_seq) < 2:
             print(f"⚠️ Cycle {cycle_id} 太短（{len(H_seq)} 筆），跳過。")
             continue
+        groups.append((cycle_id, group, H_seq))
 
+    # 各 cycle 彼此獨立，先平行擬合，再依序繪圖與彙整
+    fits = fit_cycles([H_seq for _, _, H_seq in groups], max_workers=max_workers)
+
+    for (cycle_id, group, H_seq), (r, error) in zip(groups, fits):
         try:
-            r = fit_logistic(H_seq)
+            if error is not None:
+                raise RuntimeError(error)
             x_fit = [H_seq[0]]
             for _ in range(len(H_seq) - 1):
                 x_fit.append(logistic_map(x_fit[-1], r))
 
-            episodes = group['episode'].values
+            episodes = group[index].values
             plt.plot(episodes, H_seq, 'o-', label=f"Cycle {cycle_id} H")
             plt.plot(episodes, x_fit, '--', label=f"Fit r={r:.3f}")
 
@@ -51,8 +122,8 @@ def fit_logistic_map(metrics_csv_path, output_path):
                 "cycle": cycle_id,
                 "best_r": r,
                 "length": len(H_seq),
-                "episode_start": episodes[0],
-                "episode_end": episodes[-1]
+                f"{index}_start": episodes[0],
+                f"{index}_end": episodes[-1]
             })
 
             valid_cycle_count += 1
@@ -62,17 +133,23 @@ def fit_logistic_map(metrics_csv_path, output_path):
 
     if valid_cycle_count == 0:
         print("⚠️ 無有效 cycle 可擬合，未產生圖像。")
-        return
+        plt.close()
+        return None
+
+    summary_path = os.path.join(os.path.dirname(output_path), "logistic_fit_summary.csv")
+    pd.DataFrame(result_records).to_csv(summary_path, index=False)
 
-    plt.xlabel("Episode")
+    plt.xlabel(index.title())
     plt.ylabel("Entropy H")
     plt.title("H Curve Logistic Fitting Across Cycles")
-    plt.legend()
+    if legend_max_cycles is None or valid_cycle_count <= legend_max_cycles:
+        plt.legend()
+    else:
+        print(f"ℹ️ 共 {valid_cycle_count} 個 cycle，超過 {legend_max_cycles} 個，圖上不畫圖例")
     plt.grid(True)
     plt.tight_layout()
     plt.savefig(output_path)
     plt.close()
 
-    summary_path = os.path.join(os.path.dirname(output_path), "logistic_fit_summary.csv")
-    pd.DataFrame(result_records).to_csv(summary_path, index=False)
     print(f"✅ Logistic H 擬合完成，圖像儲存於 {output_path}，統計儲存於 {summary_path}")
+    return summary_path
@@ -1,33 +1,105 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.integrate import odeint
+from concurrent.futures import ThreadPoolExecutor
 from scipy.optimize import curve_fit
+from columnar_store import load_columns
+
+# === 擬合參數界限 (k, C, epsilon) ===
+BOUNDS = ([0, 0, 0], [10, 1, 0.5])
+SERIES_THRESHOLD = 1e-3   # |a| * t_max 小於此值時，h 對 a 的導數改用泰勒展開，避免相消誤差
 
 # === S 成長模型 ===
 def s_growth(S, t, k, C, epsilon):
     return k * S * (1 - S / C) - epsilon * S
 
-def s_growth_wrapper(t, k, C, epsilon):
+# === 解析解 ===
+# dS/dt = k S (1 - S/C) - ε S 是 logistic 方程：令 a = k - ε、b = k / C，
+#   S(t) = S0 / D(t)，D(t) = e^{-at} + b·S0·h(t)，h(t) = (1 - e^{-at}) / a（a = 0 時 h = t）
+# 以 e^{-at} 表示時 a > 0 不會溢位；a < 0 且 t 很大時 D → ∞，S → 0 與 ODE 相同
+def _growth_terms(t, k, C, epsilon, S0):
+    t = np.asarray(t, dtype=np.float64)
+    C = max(C, np.finfo(np.float64).tiny)
+    a = k - epsilon
+    b = k / C
+    with np.errstate(over="ignore", invalid="ignore"):
+        F = np.exp(-a * t)
+        h = -np.expm1(-a * t) / a if a != 0 else t.copy()
+        D = F + b * S0 * h
+    return t, a, b, C, F, h, D
+
+def s_growth_curve(t, k, C, epsilon, S0):
+    """S(t) 的解析解，S0 = S(t[0] = 0)"""
+    *_, D = _growth_terms(t, k, C, epsilon, S0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        S = S0 / D
+    return np.where(np.isfinite(D), S, 0.0)
+
+def s_growth_jacobian(t, k, C, epsilon, S0):
+    """S(t) 對 (k, C, epsilon) 的解析偏導數，形狀 (len(t), 3)"""
+    t, a, b, C, F, h, D = _growth_terms(t, k, C, epsilon, S0)
+    t_max = float(np.max(np.abs(t))) if t.size else 0.0
+
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        if abs(a) * t_max < SERIES_THRESHOLD:
+            dh_da = -t ** 2 / 2 + a * t ** 3 / 3 - a ** 2 * t ** 4 / 8
+        else:
+            dh_da = (t * F - h) / a
+        dD_da = -t * F + b * S0 * dh_da
+        dD_db = S0 * h
+        dS_dD = -S0 / D ** 2
+        dS_da = dS_dD * dD_da
+        dS_db = dS_dD * dD_db
+
+    jac = np.column_stack([
+        dS_da + dS_db / C,        # ∂S/∂k（a 與 b 都含 k）
+        dS_db * (-k / C ** 2),    # ∂S/∂C
+        -dS_da,                   # ∂S/∂ε
+    ])
+    jac[~np.isfinite(D)] = 0.0    # S 已衰減為 0 的區段
+    return np.nan_to_num(jac, nan=0.0, posinf=0.0, neginf=0.0)
+
+# === 擬合引擎：資料以參數傳入，不使用全域變數，可安全地多執行緒並行 ===
+def fit_s_growth_curve(S_data, t=None, p0=None):
+    """擬合單一 S 序列，回傳 (k, C, epsilon)"""
+    S_data = np.asarray(S_data, dtype=np.float64)
+    t = np.arange(len(S_data), dtype=np.float64) if t is None else np.asarray(t, dtype=np.float64)
     S0 = S_data[0]
-    result = odeint(s_growth, S0, t, args=(k, C, epsilon)).flatten()
-    return result
+
+    popt, _ = curve_fit(
+        lambda t, k, C, epsilon: s_growth_curve(t, k, C, epsilon, S0),
+        t, S_data, p0=p0, bounds=BOUNDS,
+        jac=lambda t, k, C, epsilon: s_growth_jacobian(t, k, C, epsilon, S0),
+    )
+    return popt
+
+def _fit_or_none(S_data):
+    try:
+        return fit_s_growth_curve(S_data)
+    except Exception:
+        return None
+
+def fit_s_growth_batch(sequences, max_workers=None):
+    """一次擬合多個 run / cycle 的 S 序列，回傳 [popt 或 None（擬合失敗）]"""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_fit_or_none, sequences))
 
 # === 主函數：用於 auto_analyze ===
 def fit_s_growth(metrics_path, output_path="fit_S_growth.png"):
-    df = pd.read_csv(metrics_path)
-    global S_data
-    S_data = df["wisdom_density"].values
+    """回傳圖檔路徑；資料點不足或擬合不收斂時不產生輸出，回傳 None"""
+    S_data = np.array(load_columns(metrics_path, ["wisdom_density"])["wisdom_density"])
     t = np.arange(len(S_data))
 
+    if len(S_data) < len(BOUNDS[0]):
+        print(f"⚠️ 資料點不足（{len(S_data)} 筆），略過擬合")
+        return None
     try:
-        popt, _ = curve_fit(s_growth_wrapper, t, S_data, bounds=([0, 0, 0], [10, 1, 0.5]))
-        k, C, epsilon = popt
-    except:
-        print("⚠️ 擬合失敗")
-        return
+        popt = fit_s_growth_curve(S_data, t)
+    except (RuntimeError, ValueError) as e:
+        # curve_fit 不收斂（RuntimeError）或資料含 NaN / inf（ValueError）
+        print(f"⚠️ 擬合失敗：{e}")
+        return None
 
-    fitted_S = s_growth_wrapper(t, *popt)
+    fitted_S = s_growth_curve(t, *popt, S_data[0])
 
     plt.figure(figsize=(8, 5))
     plt.plot(t, S_data, 'bo-', label="Actual S")
@@ -41,4 +113,4 @@ def fit_s_growth(metrics_path, output_path="fit_S_growth.png"):
     plt.close()
 
     print(f"✅ 成功擬合並儲存圖檔：{output_path}")
-
+    return output_path
@@ -0,0 +1,109 @@
+# loop_detector.py
+# ✅ 迴圈偵測：環境是確定性的，若迴圈上每一步的動作都是必然選擇（機率 1），重複出現的 (state, action) 就代表無限迴圈，可提早結束回合
+#    - 確定性策略：每一步都是必然選擇，第一次重複即證實迴圈
+#    - 隨機策略：只有整個迴圈上的 (state, action) 在策略查表中機率皆為 1 才證實；
+#      否則只記錄「疑似迴圈」（相同週期連續重複 STOCHASTIC_PATIENCE 次），回合繼續進行
+
+import numpy as np
+
+# 隨機策略下需連續觀察到幾次相同週期才記錄為疑似迴圈
+STOCHASTIC_PATIENCE = 10
+
+def action_is_certain(policy, obs, action):
+    """策略在 obs 選 action 的機率是否為 1（只有提供 action_probabilities 的查表策略能判斷，其餘視為否）"""
+    if not hasattr(policy, "action_probabilities"):
+        return False
+    return bool(policy.action_probabilities(obs)[int(action)] >= 1.0)
+
+class LoopDetector:
+    """
+    單一回合的迴圈偵測器。每一步以 update(step, state, action, certain) 更新，證實迴圈時回傳 True。
+    - deterministic=True：每一步都是必然選擇，第一次重複的 (state, action) 即證實迴圈
+    - deterministic=False：certain 表示這一步的動作機率是否為 1；重複的 (state, action) 之間每一步都必然時才證實。
+      未證實但以相同週期連續重複 patience 次時記錄於 suspected_entry_step / suspected_length
+    step 為 1-based 步數（與 test_log.csv 的 step 欄位一致）。
+    """
+
+    def __init__(self, deterministic=True, patience=None):
+        self.deterministic = deterministic
+        self.patience = patience or STOCHASTIC_PATIENCE
+        self.last_visit = {}
+        self.period = {}
+        self.repeats = {}
+        self.last_uncertain_step = 0
+        self.loop_entry_step = None
+        self.loop_length = None
+        self.suspected_entry_step = None
+        self.suspected_length = None
+
+    def update(self, step, state, action, certain=None):
+        key = (tuple(np.asarray(state).reshape(-1).tolist()), int(action))
+        if not (self.deterministic or certain):
+            self.last_uncertain_step = step
+        last = self.last_visit.get(key)
+        self.last_visit[key] = step
+        if last is None:
+            return False
+
+        period = step - last
+        if self.last_uncertain_step < last:
+            # 從上次出現到現在每一步都是必然選擇：之後會完全重複這段路徑
+            self.loop_length = period
+            self.loop_entry_step = last
+            return True
+
+        repeats = self.repeats.get(key, 0) + 1 if self.period.get(key) == period else 1
+        self.period[key] = period
+        self.repeats[key] = repeats
+        if repeats >= self.patience and self.suspected_length is None:
+            self.suspected_length = period
+            self.suspected_entry_step = step - period * repeats
+        return False
+
+class BatchLoopDetector:
+    """
+    批次版本：n_episodes 個回合同步偵測，狀態以整數 key（cell * n_actions + action）表示。
+    loop_entry_step / loop_length（證實）與 suspected_entry_step / suspected_length（疑似）為 -1 代表沒有。
+    """
+
+    def __init__(self, n_episodes, n_keys, deterministic=True, patience=None):
+        self.deterministic = deterministic
+        self.patience = patience or STOCHASTIC_PATIENCE
+        self.last_visit = np.full((n_episodes, n_keys), -1, dtype=np.int32)
+        if not deterministic:
+            self.period = np.zeros((n_episodes, n_keys), dtype=np.int32)
+            self.repeats = np.zeros((n_episodes, n_keys), dtype=np.int32)
+        self.last_uncertain_step = np.zeros(n_episodes, dtype=np.int32)
+        self.loop_entry_step = np.full(n_episodes, -1, dtype=np.int32)
+        self.loop_length = np.full(n_episodes, -1, dtype=np.int32)
+        self.suspected_entry_step = np.full(n_episodes, -1, dtype=np.int32)
+        self.suspected_length = np.full(n_episodes, -1, dtype=np.int32)
+
+    def update(self, step, idx, keys, certain=None):
+        """
+        idx：本步仍在進行的回合編號；certain：各回合這一步的動作機率是否為 1（隨機策略時使用，None = 皆否）。
+        回傳與 idx 等長的布林陣列，標記剛被證實為迴圈的回合
+        """
+        if not self.deterministic:
+            uncertain = idx if certain is None else idx[~np.asarray(certain, dtype=bool)]
+            self.last_uncertain_step[uncertain] = step
+        last = self.last_visit[idx, keys]
+        self.last_visit[idx, keys] = step
+        seen = last >= 0
+        period = np.where(seen, step - last, 0)
+
+        looped = seen & (self.last_uncertain_step[idx] < last)
+        hit = idx[looped]
+        self.loop_length[hit] = period[looped]
+        self.loop_entry_step[hit] = last[looped]
+
+        if not self.deterministic:
+            same = seen & (self.period[idx, keys] == period)
+            repeats = np.where(same, self.repeats[idx, keys] + 1, np.where(seen, 1, 0))
+            self.period[idx, keys] = period
+            self.repeats[idx, keys] = repeats
+            suspected = ~looped & (repeats >= self.patience) & (self.suspected_length[idx] < 0)
+            first = idx[suspected]
+            self.suspected_length[first] = period[suspected]
+            self.suspected_entry_step[first] = step - period[suspected] * repeats[suspected]
+        return looped
@@ -5,41 +5,14 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import os
 from datetime import datetime
-import glob
-from stable_baselines3 import PPO
-from stable_baselines3.common.callbacks import BaseCallback
+import argparse
 from maze_env.maze_env import MazeEnv
-
-# === Reward Logger（訓練時記錄總回報）===
-class RewardLoggerCallback(BaseCallback):
-    def __init__(self):
-        super().__init__()
-        self.episode_rewards = []
-        self.current_rewards = 0.0
-
-    def _on_step(self) -> bool:
-        rewards = self.locals.get("rewards")
-        if rewards is not None:
-            self.current_rewards += rewards[0]
-        dones = self.locals.get("dones")
-        if dones is not None and dones[0]:
-            self.episode_rewards.append(self.current_rewards)
-            self.current_rewards = 0.0
-        return True
-
-# === 每10萬步儲存 checkpoint ===
-class CheckpointCallback(BaseCallback):
-    def __init__(self, save_freq, save_path, verbose=0):
-        super().__init__(verbose)
-        self.save_freq = save_freq
-        self.save_path = save_path
-
-    def _on_step(self) -> bool:
-        if self.num_timesteps % self.save_freq == 0:
-            model_path = os.path.join(self.save_path, f"checkpoint_{self.num_timesteps}.zip")
-            self.model.save(model_path)
-            print(f"✅ 自動儲存檢查點：{model_path}")
-        return True
+from batch_evaluator import evaluate_and_save
+from loop_detector import LoopDetector, action_is_certain
+from policy_table import load_policy
+from run_logger import StreamingTableWriter, TEST_LOG_COLUMNS, read_column
+from run_catalog import headline_metrics, record_artifact, record_metrics, register_run
+from run_discovery import find_latest_model
 
 def moving_average(data, window_size=50):
     return np.convolve(data, np.ones(window_size) / window_size, mode='valid')
@@ -58,15 +31,11 @@ def plot_rewards(rewards, save_path=None):
         print(f"🎨 Reward 曲線圖儲存到 {save_path}")
     plt.show()
 
-def save_rewards_to_csv(rewards, save_path):
-    df = pd.DataFrame({"episode": np.arange(1, len(rewards) + 1), "reward": rewards})
-    df.to_csv(save_path, index=False)
-    print(f"📄 Rewards CSV 儲存到 {save_path}")
-
 def create_run_folder(prefix="train"):
     now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     run_dir = os.path.join("runs", f"{prefix}_{now}")
     os.makedirs(run_dir, exist_ok=True)
+    register_run(run_dir)
     return run_dir
 
 def plot_path(path, save_dir):
@@ -92,24 +61,35 @@ def plot_path(path, save_dir):
     print(f"🛤️ 路徑圖儲存到 {path_plot_path}")
     plt.show()
 
-def find_latest_model():
-    train_dirs = sorted(glob.glob("runs/train_*"), reverse=True)
-    for dir in train_dirs:
-        model_path = os.path.join(dir, "ppo_maze.zip")  # ⬅ 改這裡
-        if os.path.exists(model_path):
-            print(f"✅ 載入最新模型：{model_path}")
-            return model_path
-    raise FileNotFoundError("❌ 找不到模型 ppo_maze.zip")
-
-
-def train_maze_agent():
-    env = MazeEnv()
+def make_train_env(n_envs=1, subproc=False):
+    """
+    建立訓練環境：
+    - n_envs == 1：單一 MazeEnv（與原本行為相同）
+    - subproc=True：每個環境一個子行程（SubprocVecEnv）
+    - 其他：同行程批次環境 VecMazeEnv
+    """
+    if n_envs == 1 and not subproc:
+        return MazeEnv()
+    # SB3（與 torch）只在訓練時載入，評估 / 測試模式不需要
+    from stable_baselines3.common.env_util import make_vec_env
+    from stable_baselines3.common.vec_env import SubprocVecEnv, VecMonitor
+    from maze_env.vec_maze_env import VecMazeEnv
+    if subproc:
+        return make_vec_env(MazeEnv, n_envs=n_envs, vec_env_cls=SubprocVecEnv)
+    return VecMonitor(VecMazeEnv(n_envs))
+
+def train_maze_agent(n_envs=1, subproc=False, profile_every=10_000, keep_last=None, keep_every=None):
+    from stable_baselines3 import PPO
+    from training_callbacks import CheckpointCallback, RewardLoggerCallback
+    from training_profiler import TrainingProfilerCallback, PROFILE_NAME
+
+    env = make_train_env(n_envs, subproc)
     model = PPO(
         "MlpPolicy",
         env,
         verbose=1,
         learning_rate=3e-4,
-        n_steps=2048,
+        n_steps=max(2048 // n_envs, 64),  # 每次 rollout 總步數維持約 2048
         batch_size=64,
         gae_lambda=0.95,
         gamma=0.99,
@@ -120,67 +100,123 @@ def train_maze_agent():
     )
 
     run_dir = create_run_folder(prefix="train")
-    reward_logger = RewardLoggerCallback()
-    checkpoint_callback = CheckpointCallback(save_freq=100_000, save_path=run_dir, verbose=1)
-
-    model.learn(total_timesteps=2_000_000, callback=[reward_logger, checkpoint_callback])
-    model.save(os.path.join(run_dir, "ppo_maze.zip"))
+    rewards_path = os.path.join(run_dir, "rewards.csv")
+    reward_logger = RewardLoggerCallback(rewards_path)
+    checkpoint_callback = CheckpointCallback(save_freq=100_000, save_path=run_dir,
+                                             keep_last=keep_last, keep_every=keep_every, verbose=1)
+    # 剖析 callback 包住其他 callback，量測 env / 前向 / 更新 / 各 callback 的時間
+    profiler = TrainingProfilerCallback(run_dir, [reward_logger, checkpoint_callback], interval=profile_every)
+
+    model.learn(total_timesteps=2_000_000, callback=profiler)
+    model_path = os.path.join(run_dir, "ppo_maze.zip")
+    model.save(model_path)
+    record_artifact(model_path, kind="model")
+    record_artifact(rewards_path)
+    record_artifact(os.path.join(run_dir, PROFILE_NAME))
+    record_metrics(run_dir, headline_metrics(run_dir))
+    env.close()
     print(f"✅ 訓練完成，模型儲存到 {run_dir}")
 
-    save_rewards_to_csv(reward_logger.episode_rewards, os.path.join(run_dir, "rewards.csv"))
-    plot_rewards(reward_logger.episode_rewards, save_path=os.path.join(run_dir, "reward_curve.png"))
+    print(f"📄 Rewards CSV 儲存到 {rewards_path}")
+    plot_rewards(read_column(rewards_path, "reward"), save_path=os.path.join(run_dir, "reward_curve.png"))
 
-def test_maze_agent(fast_mode=False):
-    model_path = find_latest_model()
-    model = PPO.load(model_path)
+def test_maze_agent(fast_mode=False, model=None, deterministic=False):
     env = MazeEnv()
+    if model is None:
+        model = load_policy(find_latest_model(), env)
     obs, _ = env.reset()
+    loop_detector = LoopDetector(deterministic=deterministic)
 
-    test_log = []
+    run_dir = create_run_folder(prefix="test")
+    test_log = StreamingTableWriter(os.path.join(run_dir, "test_log.csv"), TEST_LOG_COLUMNS)
     path = []
+    success = False
 
     for step in range(10000):
-        action, _ = model.predict(obs)
+        action, _ = model.predict(obs, deterministic=deterministic)
+        certain = deterministic or action_is_certain(model, obs, action)
+        if loop_detector.update(step + 1, obs, action, certain):
+            print(f"🔁 偵測到迴圈：第 {loop_detector.loop_entry_step} 步進入，長度 {loop_detector.loop_length}，提早結束")
+            break
+
         obs, reward, terminated, truncated, info = env.step(action)
         x, y = int(obs[0]), int(obs[1])
         path.append((x, y))
 
-        print(f"第 {step+1} 步：位置 ({x},{y})，動作 {int(action)}，獎勵 {reward}")
+        if not fast_mode:
+            print(f"第 {step+1} 步：位置 ({x},{y})，動作 {int(action)}，獎勵 {reward}")
 
-        test_log.append({
-            "step": step + 1,
-            "position_x": x,
-            "position_y": y,
-            "action": int(action),
-            "reward": reward,
-            "terminated": terminated
-        })
+        test_log.append(
+            step=step + 1,
+            position_x=x,
+            position_y=y,
+            action=int(action),
+            reward=reward,
+            terminated=terminated
+        )
 
         if not fast_mode:
             time.sleep(0.03)
-        env.render()
+            env.render()
 
         if terminated:
+            success = True
             print("🎉 成功到達終點！")
             break
 
-    run_dir = create_run_folder(prefix="test")
-    pd.DataFrame(test_log).to_csv(os.path.join(run_dir, "test_log.csv"), index=False)
+    test_log.close()
+    record_artifact(test_log.path)
+    record_metrics(run_dir, {"test_steps": len(test_log), "success": success})
+    pd.DataFrame([{
+        "steps": len(test_log),
+        "success": success,
+        "loop_entry_step": loop_detector.loop_entry_step or -1,
+        "loop_length": loop_detector.loop_length or -1,
+        "suspected_loop_entry_step": loop_detector.suspected_entry_step or -1,
+        "suspected_loop_length": loop_detector.suspected_length or -1
+    }]).to_csv(os.path.join(run_dir, "episode_summary.csv"), index=False)
     print(f"📄 測試紀錄儲存到 {run_dir}")
     plot_path(path, save_dir=run_dir)
 
-# === 批次測試（multi 模式）===
+# === 批次測試（multi 模式）：模型只載入一次 ===
 def test_multiple_times(n=10):
+    model = load_policy(find_latest_model())
     for i in range(n):
         print(f"\n——— 第 {i+1}/{n} 次測試 ———")
-        test_maze_agent(fast_mode=True)
+        test_maze_agent(fast_mode=True, model=model)
+
+# === 無畫面批次評估（eval 模式）：所有回合同步推進，只輸出彙總結果 ===
+def evaluate_agent(n_episodes=10_000, max_steps=1000, deterministic=False, render_every=0):
+    model = load_policy(find_latest_model())
+    run_dir = create_run_folder(prefix="eval")
+    return evaluate_and_save(model, run_dir, n_episodes=n_episodes, max_steps=max_steps,
+                             deterministic=deterministic, render_every=render_every)
 
 # === 主程式入口 ===
 if __name__ == "__main__":
-    mode = input("輸入 'train' 開始訓練，輸入 'test' 單次測試，輸入 'fast' 快速測試，輸入 'multi' 多次測試：").strip().lower()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", nargs="?", help="train / test / fast / multi / eval（省略則互動輸入）")
+    parser.add_argument("--n-envs", "--workers", dest="n_envs", type=int, default=1,
+                        help="訓練時平行環境數量")
+    parser.add_argument("--subproc", action="store_true",
+                        help="每個環境使用獨立子行程（預設為同行程批次環境）")
+    parser.add_argument("--profile-every", type=int, default=10_000, help="訓練剖析每隔幾步寫一列 profile.csv")
+    parser.add_argument("--keep-last", type=int, default=None, help="只保留最近幾個 checkpoint（預設全部保留）")
+    parser.add_argument("--keep-every", type=int, default=None,
+                        help="搭配 --keep-last：每隔幾個 checkpoint 永久保留一個")
+    parser.add_argument("--episodes", type=int, default=10_000, help="eval 模式的回合數")
+    parser.add_argument("--max-steps", type=int, default=1000, help="eval 模式每回合步數上限")
+    parser.add_argument("--deterministic", action="store_true", help="eval 模式使用確定性策略")
+    parser.add_argument("--render-every", type=int, default=0,
+                        help="eval 模式每隔 k 回合保留並顯示一條軌跡（0 = 不顯示）")
+    args = parser.parse_args()
+
+    mode = args.mode or input("輸入 'train' 開始訓練，輸入 'test' 單次測試，輸入 'fast' 快速測試，輸入 'multi' 多次測試，輸入 'eval' 批次評估：")
+    mode = mode.strip().lower()
 
     if mode == "train":
-        train_maze_agent()
+        train_maze_agent(n_envs=args.n_envs, subproc=args.subproc, profile_every=args.profile_every,
+                         keep_last=args.keep_last, keep_every=args.keep_every)
     elif mode == "test":
         test_maze_agent(fast_mode=False)
     elif mode == "fast":
@@ -191,5 +227,8 @@ if __name__ == "__main__":
             test_multiple_times(int(n))
         else:
             print("請輸入有效數字！")
+    elif mode == "eval":
+        evaluate_agent(n_episodes=args.episodes, max_steps=args.max_steps,
+                       deterministic=args.deterministic, render_every=args.render_every)
     else:
-        print("請正確輸入 'train'、'test'、'fast' 或 'multi'！")
+        print("請正確輸入 'train'、'test'、'fast'、'multi' 或 'eval'！")
@@ -2,68 +2,152 @@ import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 
+# 動作 → (列位移, 行位移)：0 上, 1 下, 2 左, 3 右
+ACTION_DELTAS = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]], dtype=np.int32)
+
+# 超過此格數時不建立 Python list 鏡像（大迷宮改走 NumPy 查表以節省記憶體）
+SCALAR_MIRROR_MAX_CELLS = 100_000
+
+# 預設 10x10 迷宮
+DEFAULT_MAZE = np.array([
+    [2, 0, 1, 0, 0, 0, 0, 0, 0, 0],
+    [1, 0, 1, 0, 1, 1, 1, 0, 1, 0],
+    [1, 0, 1, 0, 0, 0, 1, 0, 1, 0],
+    [1, 0, 0, 0, 1, 0, 1, 0, 1, 0],
+    [1, 1, 1, 1, 1, 0, 1, 0, 1, 0],
+    [0, 0, 0, 0, 0, 0, 1, 0, 1, 0],
+    [1, 1, 1, 1, 1, 0, 1, 0, 1, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 1, 0],
+    [1, 1, 1, 1, 1, 1, 1, 0, 1, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0, 0, 3]
+])
+# 0: 空地, 1: 障礙物, 2: 起點, 3: 終點
+
+def build_transition_table(maze):
+    """
+    將迷宮格子編譯成 (cells × 4) → next cell 的轉移表。
+    cell id = row * n_cols + col；撞牆或出界時停留在原地，與 MazeEnv.step 規則一致。
+    """
+    n_rows, n_cols = maze.shape
+    cell_dtype = np.int32 if maze.size < 2**31 else np.int64
+    cells = np.arange(maze.size, dtype=cell_dtype)
+    rows, cols = np.divmod(cells, cell_dtype(n_cols))
+
+    next_rows = np.clip(rows[:, None] + ACTION_DELTAS[:, 0], 0, n_rows - 1)
+    next_cols = np.clip(cols[:, None] + ACTION_DELTAS[:, 1], 0, n_cols - 1)
+    blocked = maze[next_rows, next_cols] == 1
+
+    next_cells = next_rows * cell_dtype(n_cols) + next_cols
+    np.copyto(next_cells, cells[:, None], where=blocked)
+    return next_cells
+
+def compile_maze_tables(maze, goal_reward=1.0, step_reward=-0.01):
+    """
+    一次編譯迷宮的所有查表（皆以 cell id 索引），可供 planner / 分析腳本直接重用：
+        next_state[cell, action] → 下一個 cell
+        reward[cell]             → 進入該 cell 的獎勵
+        done[cell]               → 進入該 cell 是否結束
+        positions[cell]          → (row, col)
+    """
+    next_state = build_transition_table(maze)
+
+    # 與 MazeEnv 相同：只有第一個終點 (3) 會結束回合
+    done = np.zeros(maze.size, dtype=bool)
+    done[np.flatnonzero(maze.ravel() == 3)[:1]] = True
+    reward = np.where(done, goal_reward, step_reward)
+
+    cell_dtype = next_state.dtype.type
+    positions = np.stack(np.divmod(np.arange(maze.size, dtype=cell_dtype), cell_dtype(maze.shape[1])), axis=1)
+    return next_state, reward, done, positions
+
 class MazeEnv(gym.Env):
-    def __init__(self):
+    def __init__(self, maze=None, distance_field=None):
         super().__init__()
 
+        self.maze = DEFAULT_MAZE.copy() if maze is None else np.asarray(maze)
         self.action_space = spaces.Discrete(4)  # 上下左右四個動作
-        self.observation_space = spaces.Box(low=0, high=9, shape=(2,), dtype=np.float32)  # 10x10 → max index = 9
-
-        self.maze = np.array([
-            [2, 0, 1, 0, 0, 0, 0, 0, 0, 0],
-            [1, 0, 1, 0, 1, 1, 1, 0, 1, 0],
-            [1, 0, 1, 0, 0, 0, 1, 0, 1, 0],
-            [1, 0, 0, 0, 1, 0, 1, 0, 1, 0],
-            [1, 1, 1, 1, 1, 0, 1, 0, 1, 0],
-            [0, 0, 0, 0, 0, 0, 1, 0, 1, 0],
-            [1, 1, 1, 1, 1, 0, 1, 0, 1, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0, 1, 0],
-            [1, 1, 1, 1, 1, 1, 1, 0, 1, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0, 0, 3]
-        ])
-        # 0: 空地, 1: 障礙物, 2: 起點, 3: 終點
+        # 預設 10x10 → max index = 9
+        self.observation_space = spaces.Box(low=0, high=max(self.maze.shape) - 1, shape=(2,), dtype=np.float32)
 
         self.start_pos = np.argwhere(self.maze == 2)[0]
         self.goal_pos = np.argwhere(self.maze == 3)[0]
-        self.state = self.start_pos.copy()
+
+        # 建構時一次編譯查表，step 只剩三次陣列讀取
+        (self.next_state_table, self.reward_table,
+         self.done_table, self.positions) = compile_maze_tables(self.maze)
+        self.obs_table = self.positions.astype(np.float32)
+        # 單步 step 走 Python list 鏡像，避開 NumPy 純量索引的額外開銷
+        if self.maze.size <= SCALAR_MIRROR_MAX_CELLS:
+            self._next_rows = self.next_state_table.tolist()
+            self._rewards = self.reward_table.tolist()
+            self._dones = self.done_table.tolist()
+            self._obs_rows = list(self.obs_table)
+            self._position_rows = list(self.positions)
+        else:
+            self._next_rows = self.next_state_table
+            self._rewards = self.reward_table
+            self._dones = self.done_table
+            self._obs_rows = self.obs_table
+            self._position_rows = self.positions
+        self._distance_field = distance_field
+        self.n_cols = self.maze.shape[1]
+        self.start_cell = self.cell_id(self.start_pos)
+        self.goal_cell = self.cell_id(self.goal_pos)
+        self.cell = self.start_cell
+
+    @classmethod
+    def generated(cls, height, width, seed=0, wall_density=1.0, cache_dir=None):
+        """由程序化迷宮產生器建立環境（迷宮與距離場皆從磁碟快取讀取）"""
+        from maze_env.maze_generator import load_or_generate_maze
+        maze, distance = load_or_generate_maze(height, width, seed=seed,
+                                               wall_density=wall_density, cache_dir=cache_dir)
+        return cls(maze=maze, distance_field=distance)
+
+    @property
+    def distance_field(self):
+        """到終點的 BFS 最短距離（-1 = 牆或無法抵達），未提供時首次存取才計算"""
+        if self._distance_field is None:
+            from maze_env.maze_generator import compute_distance_field
+            self._distance_field = compute_distance_field(self.maze)
+        return self._distance_field
+
+    @property
+    def optimal_path_length(self):
+        return int(self.distance_field[tuple(self.start_pos)])
+
+    def cell_id(self, position):
+        return int(position[0]) * self.n_cols + int(position[1])
+
+    @property
+    def state(self):
+        return self.positions[self.cell].copy()
+
+    @state.setter
+    def state(self, position):
+        self.cell = self.cell_id(position)
 
     def reset(self, *, seed=None, options=None):
         super().reset(seed=seed)
-        self.state = self.start_pos.copy()
-        return self.state.astype(np.float32), {}
+        self.cell = self.start_cell
+        return self.obs_table[self.cell].copy(), {}
 
     def step(self, action):
-        next_state = self.state.copy()
-        max_row, max_col = self.maze.shape[0] - 1, self.maze.shape[1] - 1
-
-        if action == 0:  # 上
-            next_state[0] = max(self.state[0] - 1, 0)
-        elif action == 1:  # 下
-            next_state[0] = min(self.state[0] + 1, max_row)
-        elif action == 2:  # 左
-            next_state[1] = max(self.state[1] - 1, 0)
-        elif action == 3:  # 右
-            next_state[1] = min(self.state[1] + 1, max_col)
-
-        if self.maze[next_state[0], next_state[1]] != 1:
-            self.state = next_state
+        cell = self._next_rows[self.cell][int(action)]
+        self.cell = cell
+        terminated = bool(self._dones[cell])
+        reward = float(self._rewards[cell])
 
-        terminated = np.array_equal(self.state, self.goal_pos)
-        reward = 1.0 if terminated else -0.01
+        return self._obs_rows[cell].copy(), reward, terminated, False, {"position": self._position_rows[cell].copy()}
 
-        return self.state.astype(np.float32), reward, terminated, False, {"position": self.state.copy()}
+    def render_text(self, path=None):
+        """以字元陣列組出迷宮畫面（A 目前位置、G 終點、# 牆、* 走過的路徑）"""
+        grid = np.where(self.maze == 1, "#", ".")
+        if path is not None:
+            path = np.asarray(path).reshape(-1, 2)
+            grid[path[:, 0], path[:, 1]] = "*"
+        grid[tuple(self.goal_pos)] = "G"
+        grid[tuple(self.state)] = "A"
+        return "\n".join("".join(row) for row in grid) + "\n"
 
     def render(self):
-        display = ""
-        for i in range(self.maze.shape[0]):
-            for j in range(self.maze.shape[1]):
-                if (i, j) == tuple(self.state):
-                    display += "A"
-                elif (i, j) == tuple(self.goal_pos):
-                    display += "G"
-                elif self.maze[i, j] == 1:
-                    display += "#"
-                else:
-                    display += "."
-            display += "\n"
-        print(display)
+        print(self.render_text())
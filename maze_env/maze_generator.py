@@ -0,0 +1,128 @@
+# maze_generator.py
+# ✅ 程序化迷宮產生器（recursive backtracker）+ BFS 到終點距離場，結果依 seed / 尺寸快取在磁碟
+
+import os
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import shortest_path
+
+DEFAULT_CACHE_DIR = os.path.join("runs", "maze_cache")
+
+# === 產生迷宮 ===
+def generate_maze(height, width, seed=None, wall_density=1.0):
+    """
+    以 recursive backtracker（迭代版，顯式堆疊）產生迷宮。
+    邏輯格位於偶數座標，牆位於兩格之間；起點 (0, 0)，終點為右下角最後一個邏輯格。
+    wall_density：保留的內牆比例，1.0 = 完美迷宮（唯一路徑），越小迴路越多。
+    回傳 int8 陣列（0 空地、1 牆、2 起點、3 終點）。
+    """
+    if height < 1 or width < 1:
+        raise ValueError("❌ 迷宮尺寸必須為正整數")
+
+    rng = np.random.default_rng(seed)
+    cell_rows, cell_cols = (height + 1) // 2, (width + 1) // 2
+    n_cells = cell_rows * cell_cols
+
+    # 用 bytearray 操作，避免逐格 NumPy 純量寫入的開銷
+    grid = bytearray(b"\x01" * (height * width))
+    visited = bytearray(n_cells)
+    choices = rng.random(n_cells)  # 每次挖牆消耗一個亂數，最多 n_cells - 1 次
+    n_choices = 0
+
+    visited[0] = 1
+    grid[0] = 0
+    stack = [0]
+    while stack:
+        cell = stack[-1]
+        r, c = divmod(cell, cell_cols)
+
+        neighbors = []
+        if r > 0 and not visited[cell - cell_cols]:
+            neighbors.append(cell - cell_cols)
+        if r < cell_rows - 1 and not visited[cell + cell_cols]:
+            neighbors.append(cell + cell_cols)
+        if c > 0 and not visited[cell - 1]:
+            neighbors.append(cell - 1)
+        if c < cell_cols - 1 and not visited[cell + 1]:
+            neighbors.append(cell + 1)
+
+        if not neighbors:
+            stack.pop()
+            continue
+
+        nxt = neighbors[int(choices[n_choices] * len(neighbors))]
+        n_choices += 1
+        nr, nc = divmod(nxt, cell_cols)
+
+        # 打通兩格之間的牆，以及目標格本身
+        grid[(r + nr) * width + (c + nc)] = 0
+        grid[2 * nr * width + 2 * nc] = 0
+        visited[nxt] = 1
+        stack.append(nxt)
+
+    maze = np.frombuffer(bytes(grid), dtype=np.int8).reshape(height, width).copy()
+
+    if wall_density < 1.0:
+        # 內牆：恰好一個座標為奇數、且兩側都是邏輯格的牆
+        rows, cols = np.nonzero(maze == 1)
+        between = ((rows % 2) + (cols % 2) == 1) & (rows < 2 * cell_rows - 1) & (cols < 2 * cell_cols - 1)
+        rows, cols = rows[between], cols[between]
+        n_remove = int(round(len(rows) * (1.0 - max(wall_density, 0.0))))
+        picked = rng.choice(len(rows), size=n_remove, replace=False)
+        maze[rows[picked], cols[picked]] = 0
+
+    maze[0, 0] = 2
+    maze[2 * (cell_rows - 1), 2 * (cell_cols - 1)] = 3
+    return maze
+
+# === BFS 距離場 ===
+def compute_distance_field(maze):
+    """
+    每一格到終點的最短步數（-1 = 牆或無法抵達）。
+    只建立右 / 下方向的無向邊稀疏圖，交給 scipy 的 BFS（unweighted shortest path）計算，
+    10^6 格迷宮也只需數十 MB 記憶體。
+    """
+    n_rows, n_cols = maze.shape
+    open_cells = maze != 1
+    ids = np.arange(maze.size, dtype=np.int32).reshape(n_rows, n_cols)
+
+    right = open_cells[:, :-1] & open_cells[:, 1:]
+    down = open_cells[:-1, :] & open_cells[1:, :]
+    src = np.concatenate([ids[:, :-1][right], ids[:-1, :][down]])
+    dst = np.concatenate([ids[:, 1:][right], ids[1:, :][down]])
+    graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(maze.size, maze.size)).tocsr()
+
+    goal = int(np.flatnonzero(maze.ravel() == 3)[0])
+    dist = shortest_path(graph, directed=False, unweighted=True, indices=goal)
+
+    distance = np.full(maze.size, -1, dtype=np.int32)
+    reachable = np.isfinite(dist)
+    distance[reachable] = dist[reachable].astype(np.int32)
+    return distance.reshape(n_rows, n_cols)
+
+# === 磁碟快取 ===
+def maze_cache_path(height, width, seed, wall_density=1.0, cache_dir=None):
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    return os.path.join(cache_dir, f"maze_{height}x{width}_seed{seed}_d{wall_density:g}.npz")
+
+def load_or_generate_maze(height, width, seed=0, wall_density=1.0, cache_dir=None):
+    """讀取快取的迷宮與距離場；不存在時產生、計算一次並寫入快取。"""
+    path = maze_cache_path(height, width, seed, wall_density, cache_dir)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return data["maze"], data["distance"]
+
+    maze = generate_maze(height, width, seed=seed, wall_density=wall_density)
+    distance = compute_distance_field(maze)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, maze=maze, distance=distance)
+    os.replace(tmp_path, path)
+    print(f"🧩 迷宮快取已儲存：{path}")
+    return maze, distance
+
+if __name__ == "__main__":
+    for size in [10, 50, 200]:
+        maze, distance = load_or_generate_maze(size, size, seed=0)
+        print(f"📐 {size}x{size}：最短路徑 {distance[0, 0]} 步")
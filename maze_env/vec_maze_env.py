@@ -0,0 +1,71 @@
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+from maze_env.maze_env import MazeEnv
+
+class VecMazeEnv(VecEnv):
+    """
+    批次化迷宮環境：一次 NumPy 呼叫推進 N 個 agent。
+    所有 agent 位置存在同一個 int 陣列（cell id），動作透過預先編譯的轉移表套用，
+    reward / terminated / auto-reset 全部以陣列運算完成。
+    產生的軌跡與 DummyVecEnv([MazeEnv] * N) 完全相同。
+    """
+
+    def __init__(self, num_envs=1, maze=None):
+        # 範本環境：提供迷宮設定與編譯好的查表，並支援 get_attr / env_method
+        self._env = MazeEnv(maze=maze)
+        self.start_cell = self._env.start_cell
+        self.next_cells = self._env.next_state_table
+        self.reward_table = self._env.reward_table.astype(np.float32)
+        self.done_table = self._env.done_table
+        self.positions = self._env.positions
+        self.obs_table = self._env.obs_table
+
+        super().__init__(num_envs, self._env.observation_space, self._env.action_space)
+
+        self.cells = np.full(num_envs, self.start_cell, dtype=np.int64)
+        self._actions = np.zeros(num_envs, dtype=np.int64)
+
+    def reset(self):
+        self.cells[:] = self.start_cell
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        self._reset_seeds()
+        self._reset_options()
+        return self.obs_table[self.cells]
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+
+    def step_wait(self):
+        self.cells = self.next_cells[self.cells, self._actions]
+        dones = self.done_table[self.cells]
+        rewards = self.reward_table[self.cells]
+
+        obs = self.obs_table[self.cells]
+        positions = self.positions[self.cells]
+        infos = [{"position": position, "TimeLimit.truncated": False} for position in positions]
+
+        # 自動重置：到達終點的 agent 回到起點，終點觀測值存進 info
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                infos[i]["terminal_observation"] = obs[i].copy()
+                self.reset_infos[i] = {}
+            self.cells[dones] = self.start_cell
+            obs[dones] = self.obs_table[self.start_cell]
+
+        return obs, rewards, dones, infos
+
+    def close(self):
+        self._env.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self._env, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self._env, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self._env, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
@@ -0,0 +1,220 @@
+# metrics_engine.py
+# ✅ 由 test_log 串流計算 H（行動熵）與 S（智慧密度）：
+#    - 每回合一列：episode_metrics.csv
+#    - 滑動 window：每 stride 步以最近 window 步計算一次，寫入 metrics.csv（有位置欄位時一併計算 modularity Q，
+#      回合結束到下一回合起點不算轉移）。step 為 window 結尾步數，episode 為該步所屬的回合編號
+#    各 window 的行動次數 = 累計次數的兩列相減，每個 window 只需 O(動作數)；test_log 分塊讀取，記憶體與長度無關
+#    步數太少時自動縮小 stride，讓 metrics.csv 至少有 MIN_WINDOW_ROWS 列（cycle 切段與擬合需要足夠的點）
+#    distinct=True 時與上一列完全相同的 window 不重複輸出
+
+import numpy as np
+from batch_evaluator import entropy_from_counts
+from columnar_store import iter_table_chunks, load_columns, table_columns
+from modularity import DEFAULT_STRIDE, DEFAULT_WINDOW, WindowedModularity
+from run_logger import StreamingTableWriter
+
+PARAMS = 1e5                 # 智慧密度的參數量（與舊版 calculate_metrics 相同）
+SUCCESS_REWARD = 0.5         # reward 大於此值的步視為成功
+DEFAULT_CHUNKSIZE = 1_000_000
+MIN_WINDOW_ROWS = 100        # 步數不足 MIN_WINDOW_ROWS * stride 時，stride 縮小為 步數 // MIN_WINDOW_ROWS（至少 1）
+
+WINDOW_METRICS_COLUMNS = {
+    "step": np.int64,             # window 結尾的步數
+    "episode": np.int64,          # window 結尾那一步所屬的回合（1 起算）
+    "entropy": np.float64,
+    "wisdom_density": np.float64,
+    "terminated": np.bool_,       # 與上一列之間有回合結束
+}
+
+EPISODE_METRICS_COLUMNS = {
+    "episode": np.int64,
+    "steps": np.int64,
+    "entropy": np.float64,
+    "wisdom_density": np.float64,
+    "terminated": np.bool_,       # False = 記錄結束時仍未到達終點
+}
+
+def _density(success, steps, params):
+    return success / (np.maximum(steps, 1) * params)
+
+class MetricsEngine:
+    """
+    engine = MetricsEngine(n_actions, n_cells=...)
+    for chunk in ...:
+        window_rows, episode_rows = engine.update(actions, rewards, terminated, cells)
+    window_rows, episode_rows = engine.close()
+    回傳的 rows 為 {欄位: ndarray}。累計表每列為 [各動作次數..., 成功步數, 回合結束數]。
+    """
+
+    def __init__(self, n_actions, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE, params=PARAMS, n_cells=None,
+                 distinct=False):
+        self.n_actions = n_actions
+        self.window = window
+        self.stride = stride
+        self.params = params
+        self.distinct = distinct
+        self.span = max(window, stride)
+        # 最近 span + 1 步的累計表（第一列為步數 history_start 的累計值）
+        self.history = np.zeros((1, n_actions + 2), dtype=np.int64)
+        self.history_start = 0
+        self.steps = 0
+        self.last_evaluated = 0
+        self.episode_id = 0
+        self.episode_start = 0
+        self.episode_start_cum = np.zeros(n_actions + 2, dtype=np.int64)
+        self.modularity = WindowedModularity(n_cells, window=window, stride=stride) if n_cells else None
+        self.last_row = None
+
+    def _window_rows(self, full, ends, q_values):
+        """full 為步數 history_start 起的累計表，ends 為要計算的 window 結尾步數"""
+        start = np.maximum(ends - self.window, 0)
+        counts = full[ends - self.history_start] - full[start - self.history_start]
+        block = full[ends - self.history_start] - full[np.maximum(ends - self.stride, self.last_evaluated)
+                                                        - self.history_start]
+        length = ends - start
+        # 第 end 步之前結束的回合數 + 1（第 end 步本身結束時仍屬於該回合）
+        finished = full[ends - 1 - self.history_start, self.n_actions + 1]
+        rows = {
+            "step": ends,
+            "episode": finished + 1,
+            "entropy": entropy_from_counts(counts[:, :self.n_actions]),
+            "wisdom_density": _density(counts[:, self.n_actions], length, self.params),
+            "terminated": block[:, self.n_actions + 1] > 0,
+        }
+        if self.modularity is not None:
+            rows["modularity"] = q_values
+        return self._distinct(rows) if self.distinct else rows
+
+    def _distinct(self, rows):
+        """去掉與前一列（含上一塊最後一列）除了 step 以外完全相同的列"""
+        n = len(rows["step"])
+        if n == 0:
+            return rows
+        names = [name for name in rows if name != "step"]
+        changed = np.zeros(n, dtype=bool)
+        for name in names:
+            values = rows[name]
+            prev = np.empty_like(values)
+            prev[1:] = values[:-1]
+            if self.last_row is not None:
+                prev[0] = self.last_row[name]
+            changed |= values != prev
+        if self.last_row is None:
+            changed[0] = True
+        self.last_row = {name: rows[name][-1] for name in names}
+        return {name: values[changed] for name, values in rows.items()}
+
+    def _episode_rows(self, full, ends, close_open=False):
+        n = len(ends)
+        starts = np.concatenate(([self.episode_start], ends[:-1]))[:n]
+        end_cum = full[ends - self.history_start]
+        start_cum = np.vstack([self.episode_start_cum[None, :], end_cum[:-1]])[:n]
+        counts = end_cum - start_cum
+        steps = ends - starts
+        rows = {
+            "episode": self.episode_id + 1 + np.arange(n),
+            "steps": steps,
+            "entropy": entropy_from_counts(counts[:, :self.n_actions]),
+            "wisdom_density": _density(counts[:, self.n_actions], steps, self.params),
+            "terminated": np.full(n, not close_open),
+        }
+        if n:
+            self.episode_id += n
+            self.episode_start = int(ends[-1])
+            self.episode_start_cum = end_cum[-1].copy()
+        return rows
+
+    def update(self, actions, rewards, terminated, cells=None):
+        actions = np.asarray(actions, dtype=np.int64)
+        n = len(actions)
+        if n == 0:
+            return self._empty_rows()
+        terminated = np.asarray(terminated).astype(bool)
+        table = np.zeros((n, self.n_actions + 2), dtype=np.int64)
+        table[np.arange(n), actions] = 1
+        table[:, self.n_actions] = np.asarray(rewards) > SUCCESS_REWARD
+        table[:, self.n_actions + 1] = terminated
+        np.cumsum(table, axis=0, out=table)
+        table += self.history[-1]
+        full = np.vstack([self.history, table])
+
+        first = self.steps + 1
+        self.steps += n
+        ends = np.arange((first + self.stride - 1) // self.stride * self.stride, self.steps + 1, self.stride)
+        q_values = None
+        if self.modularity is not None:
+            q_values = np.array([q for _, q in self.modularity.update(cells, terminated)], dtype=np.float64)
+        window_rows = self._window_rows(full, ends, q_values)
+        if len(ends):
+            self.last_evaluated = int(ends[-1])
+
+        episode_rows = self._episode_rows(full, first + np.flatnonzero(terminated))
+
+        # 只保留下一塊需要的累計列（window 起點 / 上次計算點 / 回合起點都在 span 步以內或另外攜帶）
+        keep_from = max(self.history_start, self.steps - self.span)
+        self.history = full[keep_from - self.history_start:].copy()
+        self.history_start = keep_from
+        return window_rows, episode_rows
+
+    def close(self):
+        """最後不足 stride 的 window 與未結束的回合"""
+        full = self.history
+        window_rows = self._empty_rows()[0]
+        if self.steps > self.last_evaluated:
+            ends = np.array([self.steps])
+            q_values = None
+            if self.modularity is not None:
+                q_values = np.array([q for _, q in self.modularity.flush()], dtype=np.float64)
+            window_rows = self._window_rows(full, ends, q_values)
+            self.last_evaluated = self.steps
+        episode_rows = self._empty_rows()[1]
+        if self.steps > self.episode_start:
+            episode_rows = self._episode_rows(full, np.array([self.steps]), close_open=True)
+        return window_rows, episode_rows
+
+    def _empty_rows(self):
+        window_columns = dict(WINDOW_METRICS_COLUMNS)
+        if self.modularity is not None:
+            window_columns["modularity"] = np.float64
+        return ({name: np.zeros(0, dtype=dtype) for name, dtype in window_columns.items()},
+                {name: np.zeros(0, dtype=dtype) for name, dtype in EPISODE_METRICS_COLUMNS.items()})
+
+def effective_stride(n_steps, stride=DEFAULT_STRIDE, min_rows=MIN_WINDOW_ROWS):
+    """短 log 改用較小的 stride，讓 window 列數至少有 min_rows（步數本身更少時為每步一列）"""
+    return max(1, min(stride, n_steps // min_rows))
+
+def compute_metrics(test_log_path, metrics_path, episode_path, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE,
+                    chunksize=DEFAULT_CHUNKSIZE, distinct=False):
+    """分塊讀取 test_log，寫出 metrics（滑動 window）與 episode_metrics（每回合），回傳 (window 列數, 回合數)"""
+    columns = table_columns(test_log_path)
+    if "action" not in columns:
+        raise ValueError(f"❌ test_log 沒有 action 欄位，無法計算 H / S：{test_log_path}")
+    has_positions = {"position_x", "position_y"} <= set(columns)
+    # 先掃一次（memmap，不複製）取得步數、動作數與格子範圍
+    ranges = load_columns(test_log_path, ["action"] + (["position_x", "position_y"] if has_positions else []))
+    stride = effective_stride(len(ranges["action"]), stride)
+    n_actions = int(ranges["action"].max()) + 1 if len(ranges["action"]) else 1
+    n_cells = None
+    if has_positions and len(ranges["action"]):
+        n_cols = int(ranges["position_y"].max()) + 1
+        n_cells = (int(ranges["position_x"].max()) + 1) * n_cols
+
+    engine = MetricsEngine(n_actions, window=window, stride=stride, n_cells=n_cells, distinct=distinct)
+    window_columns = dict(WINDOW_METRICS_COLUMNS)
+    if n_cells:
+        window_columns["modularity"] = np.float64
+    read_columns = ["action", "reward"] + (["terminated"] if "terminated" in columns else []) + \
+                   (["position_x", "position_y"] if has_positions else [])
+
+    with StreamingTableWriter(metrics_path, window_columns) as metrics_writer, \
+            StreamingTableWriter(episode_path, EPISODE_METRICS_COLUMNS) as episode_writer:
+        for chunk in iter_table_chunks(test_log_path, chunksize=chunksize, columns=read_columns):
+            terminated = chunk["terminated"].values if "terminated" in chunk else np.zeros(len(chunk), dtype=bool)
+            cells = chunk["position_x"].values * n_cols + chunk["position_y"].values if n_cells else None
+            window_rows, episode_rows = engine.update(chunk["action"].values, chunk["reward"].values, terminated, cells)
+            metrics_writer.extend(**window_rows)
+            episode_writer.extend(**episode_rows)
+        window_rows, episode_rows = engine.close()
+        metrics_writer.extend(**window_rows)
+        episode_writer.extend(**episode_rows)
+        return len(metrics_writer), len(episode_writer)
@@ -0,0 +1,303 @@
+# modularity.py
+# ✅ 由軌跡建立「格子轉移圖」並計算模組化程度 Q（Newman modularity）
+#    - 圖以排序的邊 key + 權重陣列存放（稀疏），整批轉移以 NumPy 累加 / 扣除，可隨步數串流更新
+#    - 分群使用 Louvain 的局部移動階段，每次都從上一個 window（或上一回合）的分群開始，通常一輪即收斂
+#    - 每次計算只處理目前圖上有邊的節點（重新編號後的小 CSR），與迷宮格子總數無關
+#    - 回合結束（terminated）後的下一步是重設回起點，不算一次移動，不形成轉移
+#    - Q 的定義與 networkx.algorithms.community.modularity 相同（自迴圈權重計入度數兩次）
+
+from collections import deque
+import numpy as np
+from scipy.sparse import coo_matrix
+
+DEFAULT_WINDOW = 1000   # 滑動 window 包含的轉移數
+DEFAULT_STRIDE = 100    # 每隔幾步重新計算一次 Q
+MAX_PASSES = 8          # 局部移動的最多輪數
+
+# === 轉移圖 ===
+class TransitionGraph:
+    """
+    無向加權圖：節點為格子編號（0 ~ n_nodes-1），邊權重為兩格之間的轉移次數。
+    撞牆停在原地的步視為自迴圈。
+    """
+
+    def __init__(self, n_nodes):
+        self.n_nodes = n_nodes
+        self.keys = np.zeros(0, dtype=np.int64)        # u * n_nodes + v（u <= v），排序
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.degree = np.zeros(n_nodes, dtype=np.float64)
+        self.total = 0.0                               # 總邊權重 m
+
+    def _update(self, src, dst, sign):
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        if len(src) == 0:
+            return
+        u, v = np.minimum(src, dst), np.maximum(src, dst)
+        keys, counts = np.unique(u * self.n_nodes + v, return_counts=True)
+        missing = keys[~np.isin(keys, self.keys, assume_unique=True)]
+        if len(missing):
+            self.keys = np.concatenate([self.keys, missing])
+            order = np.argsort(self.keys, kind="stable")
+            self.keys = self.keys[order]
+            self.weights = np.concatenate([self.weights, np.zeros(len(missing))])[order]
+        self.weights[np.searchsorted(self.keys, keys)] += sign * counts
+        np.add.at(self.degree, u, sign)
+        np.add.at(self.degree, v, sign)
+        self.total += sign * len(src)
+        if sign < 0:
+            # 權重歸零的邊移出，edges() 的成本只取決於目前 window 內的邊數
+            present = self.weights > 0
+            self.keys, self.weights = self.keys[present], self.weights[present]
+
+    def add_transitions(self, src, dst):
+        self._update(src, dst, 1)
+
+    def remove_transitions(self, src, dst):
+        self._update(src, dst, -1)
+
+    def edges(self):
+        """(u, v, w)，只含權重 > 0 的邊"""
+        present = self.weights > 0
+        keys = self.keys[present]
+        return keys // self.n_nodes, keys % self.n_nodes, self.weights[present]
+
+    def adjacency(self):
+        """對稱的 CSR 稀疏矩陣（自迴圈放在對角線）"""
+        u, v, w = self.edges()
+        off = u != v
+        rows = np.concatenate([u, v[off]])
+        cols = np.concatenate([v, u[off]])
+        data = np.concatenate([w, w[off]])
+        return coo_matrix((data, (rows, cols)), shape=(self.n_nodes, self.n_nodes)).tocsr()
+
+    def nodes(self):
+        return np.flatnonzero(self.degree > 0)
+
+    def subgraph(self):
+        """
+        只含有邊節點的對稱 CSR，回傳 (nodes, adj)：nodes 為排序的原始節點編號，adj 以 nodes 的位置為索引。
+        成本只取決於邊數，與 n_nodes 無關
+        """
+        u, v, w = self.edges()
+        nodes = np.unique(np.concatenate([u, v]))
+        lu, lv = np.searchsorted(nodes, u), np.searchsorted(nodes, v)
+        off = lu != lv
+        rows = np.concatenate([lu, lv[off]])
+        cols = np.concatenate([lv, lu[off]])
+        data = np.concatenate([w, w[off]])
+        return nodes, coo_matrix((data, (rows, cols)), shape=(len(nodes), len(nodes))).tocsr()
+
+# === Q 與分群 ===
+def modularity(graph, labels):
+    """指定分群下的 Q；labels 為每個節點的群編號（未出現的節點不影響結果）"""
+    if graph.total <= 0:
+        return 0.0
+    u, v, w = graph.edges()
+    nodes = np.unique(np.concatenate([u, v]))
+    return _modularity(graph, u, v, w, nodes, np.asarray(labels)[nodes])
+
+def _modularity(graph, u, v, w, nodes, node_labels):
+    """nodes 為有邊的節點，node_labels 為其群編號"""
+    lu, lv = np.searchsorted(nodes, u), np.searchsorted(nodes, v)
+    inside = node_labels[lu] == node_labels[lv]
+    _, community = np.unique(node_labels, return_inverse=True)
+    degree_sum = np.bincount(community, weights=graph.degree[nodes])
+    m = graph.total
+    return float(w[inside].sum() / m - np.sum((degree_sum / (2 * m)) ** 2))
+
+def _move_nodes(adj, degree, node_labels, two_m, max_passes):
+    """Louvain 局部移動（節點以 0..k-1 編號）：每個節點移到增益最大的相鄰群，直到沒有節點移動"""
+    indptr, indices, data = adj.indptr.tolist(), adj.indices.tolist(), adj.data.tolist()
+    degree = degree.tolist()
+    lab = node_labels.tolist()
+    tot = {}
+    for i, c in enumerate(lab):
+        tot[c] = tot.get(c, 0.0) + degree[i]
+
+    for _ in range(max_passes):
+        moved = 0
+        for i in range(len(lab)):
+            current = lab[i]
+            k_i = degree[i]
+            links = {}
+            for p in range(indptr[i], indptr[i + 1]):
+                j = indices[p]
+                if j != i:
+                    links[lab[j]] = links.get(lab[j], 0.0) + data[p]
+            tot[current] -= k_i
+            # 增益（乘上 m）：移入 c 後群內邊權重增加 links[c]，期望值增加 k_i * tot[c] / 2m
+            best, best_gain = current, links.get(current, 0.0) - k_i * tot[current] / two_m
+            for c, w in links.items():
+                gain = w - k_i * tot[c] / two_m
+                if gain > best_gain + 1e-12:
+                    best, best_gain = c, gain
+            tot[best] += k_i
+            if best != current:
+                lab[i] = best
+                moved += 1
+        if not moved:
+            break
+    return np.asarray(lab, dtype=np.int64)
+
+class Partition:
+    """
+    跨 window / 回合沿用的分群：labels 只在建立時配置一次，之後每次只讀寫目前有邊的節點；
+    新出現的節點各自成一群，群編號由 next_label 遞增，不必掃描整個陣列
+    """
+
+    def __init__(self, n_nodes):
+        self.labels = np.full(n_nodes, -1, dtype=np.int64)
+        self.next_label = 0
+
+    def update(self, graph, max_passes=MAX_PASSES):
+        """以上一次的分群為起點對目前的圖做局部移動，回傳 Q"""
+        if graph.total <= 0:
+            return 0.0
+        u, v, w = graph.edges()
+        nodes, adj = graph.subgraph()
+        node_labels = self.labels[nodes]
+        fresh = node_labels < 0
+        node_labels[fresh] = np.arange(self.next_label, self.next_label + fresh.sum())
+        self.next_label += int(fresh.sum())
+        node_labels = _move_nodes(adj, graph.degree[nodes], node_labels, 2 * graph.total, max_passes)
+        self.labels[nodes] = node_labels
+        return _modularity(graph, u, v, w, nodes, node_labels)
+
+def local_moving(graph, labels=None, max_passes=MAX_PASSES):
+    """
+    Louvain 局部移動：每個節點移到增益最大的相鄰群，直到沒有節點移動。
+    labels 為上一次的分群（-1 / 新出現的節點各自成一群），回傳新的 labels（長度 n_nodes，未出現的節點為 -1）。
+    串流計算請改用 Partition（不必每次配置整個 labels 陣列）
+    """
+    partition = Partition(graph.n_nodes)
+    if labels is not None:
+        labels = np.asarray(labels)
+        partition.next_label = int(labels.max()) + 1 if len(labels) else 0
+        # 這次沒出現的節點不保留舊分群（與回傳「未出現為 -1」一致）
+        nodes = graph.nodes()
+        partition.labels[nodes] = labels[nodes]
+    partition.update(graph, max_passes)
+    return partition.labels
+
+# === 串流：滑動 window ===
+class WindowedModularity:
+    """
+    逐步送入格子編號，每 stride 步以最近 window 步的轉移計算一次 Q：
+        wm = WindowedModularity(n_nodes)
+        for chunk in ...:
+            for step, q in wm.update(chunk, terminated): ...
+        wm.flush()   # 最後不足 stride 的部分
+    每次只把新進入 / 離開 window 的轉移加減到圖上，分群沿用上一個 window 的結果。
+    terminated 標記回合結束的步：該步到下一步（下一回合起點）之間不形成轉移。
+    """
+
+    def __init__(self, n_nodes, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE, max_passes=MAX_PASSES):
+        self.graph = TransitionGraph(n_nodes)
+        self.partition = Partition(n_nodes)
+        self.window = window
+        self.stride = stride
+        self.max_passes = max_passes
+        self.chunks = deque()      # window 內每一步的 (src, dst, valid)，依時間順序
+        self.in_window = 0
+        self.prev_cell = None
+        self.prev_terminated = False
+        self.steps = 0
+        self.evaluated_step = 0
+        self.q = 0.0
+
+    def _push(self, cells, terminated):
+        if self.prev_cell is None:
+            # 第一步沒有前一格，不形成轉移
+            src, dst, valid = cells[:-1], cells[1:], ~terminated[:-1]
+        else:
+            src = np.concatenate(([self.prev_cell], cells[:-1]))
+            dst = cells
+            valid = ~np.concatenate(([self.prev_terminated], terminated[:-1]))
+        self.prev_cell = cells[-1]
+        self.prev_terminated = bool(terminated[-1])
+        self.steps += len(cells)
+        self.graph.add_transitions(src[valid], dst[valid])
+        self.chunks.append((src, dst, valid))
+        self.in_window += len(src)
+
+        # 移出 window 的最舊轉移
+        excess = self.in_window - self.window
+        while excess > 0:
+            src, dst, valid = self.chunks[0]
+            k = min(excess, len(src))
+            self.graph.remove_transitions(src[:k][valid[:k]], dst[:k][valid[:k]])
+            if k == len(src):
+                self.chunks.popleft()
+            else:
+                self.chunks[0] = (src[k:], dst[k:], valid[k:])
+            self.in_window -= k
+            excess -= k
+
+    def _evaluate(self):
+        self.q = self.partition.update(self.graph, self.max_passes)
+        self.evaluated_step = self.steps
+        return self.steps, self.q
+
+    def update(self, cells, terminated=None):
+        """送入一段格子編號（與對應的 terminated 旗標），回傳這段期間完成的 [(步數, Q)]"""
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1)
+        if terminated is None:
+            terminated = np.zeros(len(cells), dtype=bool)
+        else:
+            terminated = np.asarray(terminated, dtype=bool).reshape(-1)
+        results = []
+        start = 0
+        while start < len(cells):
+            k = min(self.stride - (self.steps - self.evaluated_step), len(cells) - start)
+            self._push(cells[start:start + k], terminated[start:start + k])
+            start += k
+            if self.steps - self.evaluated_step == self.stride:
+                results.append(self._evaluate())
+        return results
+
+    def flush(self):
+        if self.steps > self.evaluated_step:
+            return [self._evaluate()]
+        return []
+
+def window_modularity(cells, window=DEFAULT_WINDOW, stride=DEFAULT_STRIDE, n_nodes=None, terminated=None):
+    """
+    整段軌跡每一步的 Q：每 stride 步為一段，同一段的步共用段尾那次計算的 Q（最近 window 步）
+    """
+    cells = np.asarray(cells, dtype=np.int64).reshape(-1)
+    q = np.zeros(len(cells), dtype=np.float64)
+    if len(cells) == 0:
+        return q
+    wm = WindowedModularity(n_nodes or int(cells.max()) + 1, window=window, stride=stride)
+    results = wm.update(cells, terminated) + wm.flush()
+    ends = np.array([step for step, _ in results])
+    values = np.array([value for _, value in results])
+    # 第 t 步（1 起算）屬於第一個 >= t 的計算點
+    q[:] = values[np.searchsorted(ends, np.arange(1, len(cells) + 1))]
+    return q
+
+# === 每回合一張圖 ===
+class EpisodeModularity:
+    """每個回合的轉移圖各自計算 Q，分群沿用上一回合的結果（這回合沒走到的格子保留原分群）"""
+
+    def __init__(self, n_nodes, max_passes=MAX_PASSES):
+        self.n_nodes = n_nodes
+        self.partition = Partition(n_nodes)
+        self.max_passes = max_passes
+
+    def episode(self, cells):
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1)
+        graph = TransitionGraph(self.n_nodes)
+        graph.add_transitions(cells[:-1], cells[1:])
+        return self.partition.update(graph, self.max_passes)
+
+def position_cells(x, y):
+    """(x, y) 座標 → 緊密的格子編號，回傳 (cells, n_nodes)"""
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    if len(x) == 0:
+        return np.zeros(0, dtype=np.int64), 0
+    keys = x * (int(y.max()) + 1) + y
+    unique, cells = np.unique(keys, return_inverse=True)
+    return cells.reshape(-1), len(unique)
@@ -1,20 +1,166 @@
 import os
+import json
+import gzip
+import time
 import shutil
+import hashlib
+import argparse
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from run_catalog import RUN_CATEGORIES, run_category, run_timestamp
+from run_fs import BLOB_DIR, MANIFEST_DIR, MANIFEST_VERSION, blob_path, load_archive_manifest, manifest_path
 
-def organize_runs(root_dir="runs"):
+# === 封存格式 ===
+# runs/archive/blobs/<sha256 前兩碼>/<sha256>[.gz]：以內容雜湊命名的檔案本體，相同內容（例如重複的 checkpoint）只存一份
+# runs/archive/manifests/<run 名稱>.json：run 內每個檔案對應的 blob，以及判斷是否需要重新封存的 (大小, 修改時間)
+# 舊的 runs/archive/*.zip 保持原樣；兩種封存都可以透過 run_fs 直接讀取，格式定義也放在 run_fs
+RAW_EXTENSIONS = {".zip", ".npz", ".png", ".gz", ".sqlite"}   # 已壓縮 / 不值得再壓縮的檔案直接存原檔（.npz 為 savez_compressed 的 zip）
+SKIP_SUFFIXES = (".tmp",)
+GC_GRACE_SECONDS = 3600   # 最近這段時間內寫入 / 沿用的 blob 不回收（可能屬於其他行程尚未寫出 manifest 的封存）
+
+def _save_manifest(archive_dir, manifest):
+    path = manifest_path(archive_dir, manifest["run"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# === 掃描 run 內容（只 stat，不讀檔）===
+def run_files(run_dir):
+    """{相對路徑: (大小, 修改時間 ns)}，包含欄式檔等子資料夾"""
+    files = {}
+    for dirpath, _, filenames in os.walk(run_dir):
+        for filename in filenames:
+            if filename.endswith(SKIP_SUFFIXES):
+                continue
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            files[os.path.relpath(path, run_dir).replace(os.sep, "/")] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def is_up_to_date(run_dir, manifest):
+    if manifest is None:
+        return False
+    archived = {name: (entry["size"], entry["mtime_ns"]) for name, entry in manifest["files"].items()}
+    return archived == run_files(run_dir)
+
+# === 封存單一 run（在子行程中執行）===
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _write_blob(archive_dir, path, sha256, codec):
+    target = blob_path(archive_dir, sha256, codec)
+    if os.path.exists(target):
+        os.utime(target)  # 更新修改時間：在 manifest 寫出前不會被其他行程的回收刪掉
+        return 0
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # 先寫到各行程專屬的暫存檔再改名：多個行程同時寫入同一個 blob 也安全
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(path, "rb") as src:
+        if codec == "gzip":
+            with gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        else:
+            with open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_path, target)
+    return os.path.getsize(target)
+
+def archive_run(run_dir, archive_dir, timestamp):
     """
-    將 runs/ 資料夾內的 train_ / test_ / test_many_ 類別自動分類到對應資料夾，
-    並將其壓縮封存至 archive/，同時紀錄操作日誌。
+    依內容雜湊封存 run 資料夾，回傳 (manifest, 新增 blob 數, 新增位元組)。
+    (大小, 修改時間) 與上次 manifest 相同的檔案沿用舊雜湊，不重新讀取。
     """
-    folders = sorted(os.listdir(root_dir))
+    run_name = os.path.basename(os.path.normpath(run_dir))
+    previous = (load_archive_manifest(archive_dir, run_name) or {}).get("files", {})
+    entries = {}
+    new_blobs = new_bytes = 0
+
+    for name, (size, mtime_ns) in sorted(run_files(run_dir).items()):
+        path = os.path.join(run_dir, name)
+        old = previous.get(name)
+        if old and old["size"] == size and old["mtime_ns"] == mtime_ns:
+            sha256, codec = old["sha256"], old["codec"]
+        else:
+            sha256 = _file_sha256(path)
+            codec = "raw" if os.path.splitext(name)[1].lower() in RAW_EXTENSIONS else "gzip"
+        written = _write_blob(archive_dir, path, sha256, codec)
+        if written:
+            new_blobs += 1
+            new_bytes += written
+        entries[name] = {"sha256": sha256, "codec": codec, "size": size, "mtime_ns": mtime_ns}
 
-    # 對應分類規則
-    category_map = {
-        "train_": "train",
-        "test_": "test",
-        "test_many_": "test_many"
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "run": run_name,
+        "category": run_category(run_name),
+        "created": run_timestamp(run_name),
+        "archived": timestamp,
+        "files": entries,
     }
+    _save_manifest(archive_dir, manifest)
+    return manifest, new_blobs, new_bytes
+
+def restore_run(archive_dir, run_name, target_dir):
+    """由 manifest 與 blob 還原整個 run 資料夾"""
+    manifest = load_archive_manifest(archive_dir, run_name)
+    if manifest is None:
+        raise FileNotFoundError(f"❌ 找不到封存紀錄：{manifest_path(archive_dir, run_name)}")
+    for name, entry in manifest["files"].items():
+        target = os.path.join(target_dir, *name.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        source = blob_path(archive_dir, entry["sha256"], entry["codec"])
+        with (gzip.open(source, "rb") if entry["codec"] == "gzip" else open(source, "rb")) as src, \
+                open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.utime(target, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    return target_dir
+
+# === 回收不再被任何 manifest 參照的 blob（mark-and-sweep）===
+def referenced_blobs(archive_dir):
+    """所有 manifest（含其他版本）參照到的 blob 路徑"""
+    referenced = set()
+    manifest_dir = os.path.join(archive_dir, MANIFEST_DIR)
+    if not os.path.isdir(manifest_dir):
+        return referenced
+    for filename in os.listdir(manifest_dir):
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(manifest_dir, filename), encoding="utf-8") as f:
+            manifest = json.load(f)
+        for entry in manifest.get("files", {}).values():
+            referenced.add(os.path.normpath(blob_path(archive_dir, entry["sha256"], entry["codec"])))
+    return referenced
+
+def collect_garbage(archive_dir, grace_seconds=GC_GRACE_SECONDS):
+    """刪除沒有任何 manifest 參照、且超過 grace_seconds 未寫入的 blob，回傳 (刪除數, 釋放位元組)"""
+    referenced = referenced_blobs(archive_dir)
+    cutoff = time.time() - grace_seconds
+    removed = freed = 0
+    for dirpath, _, filenames in os.walk(os.path.join(archive_dir, BLOB_DIR)):
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(dirpath, filename))
+            if path in referenced or filename.endswith(SKIP_SUFFIXES):
+                continue
+            stat = os.stat(path)
+            if stat.st_mtime >= cutoff:
+                continue
+            os.remove(path)
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+def organize_runs(root_dir="runs", max_workers=None):
+    """
+    將 runs/ 資料夾內的 train_ / test_ / test_many_ 類別自動分類到對應資料夾，
+    並以內容雜湊增量封存至 archive/（只封存內容有變動的 run，多個 run 平行壓縮），同時紀錄操作日誌。
+    """
+    folders = sorted(os.listdir(root_dir))
 
     log_lines = []
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -23,29 +169,49 @@ def organize_runs(root_dir="runs"):
 
     for folder in folders:
         folder_path = os.path.join(root_dir, folder)
-        if not os.path.isdir(folder_path):
+        # 判斷分類（取最長的前綴，test_many_ 不會被歸到 test/）
+        category = run_category(folder)
+        if not os.path.isdir(folder_path) or not category or folder == category:
             continue
 
-        # 判斷分類
-        for prefix, category in category_map.items():
-            if folder.startswith(prefix):
-                target_dir = os.path.join(root_dir, category)
-                os.makedirs(target_dir, exist_ok=True)
-                target_path = os.path.join(target_dir, folder)
-
-                # 避免覆蓋
-                if not os.path.exists(target_path):
-                    shutil.move(folder_path, target_path)
-                    log_lines.append(f"[{timestamp}] ✅ 移動 {folder} → {category}/")
-                else:
-                    log_lines.append(f"[{timestamp}] ⚠️ 已存在 {category}/{folder}，略過")
-
-                # 壓縮封存
-                zip_name = f"{folder}_{timestamp}.zip"
-                zip_base = os.path.join(archive_dir, zip_name.replace(".zip", ""))
-                shutil.make_archive(zip_base, 'zip', target_path)
-                log_lines.append(f"[{timestamp}] 📦 封存 {zip_name}")
-                break  # 分類完成後退出內層迴圈
+        target_dir = os.path.join(root_dir, category)
+        os.makedirs(target_dir, exist_ok=True)
+        target_path = os.path.join(target_dir, folder)
+
+        # 避免覆蓋
+        if not os.path.exists(target_path):
+            shutil.move(folder_path, target_path)
+            log_lines.append(f"[{timestamp}] ✅ 移動 {folder} → {category}/")
+        else:
+            log_lines.append(f"[{timestamp}] ⚠️ 已存在 {category}/{folder}，略過")
+
+    # 增量封存：只處理沒有 manifest 或檔案 (大小, 修改時間) 有變動的 run
+    run_dirs = []
+    for category in RUN_CATEGORIES:
+        category_path = os.path.join(root_dir, category)
+        if os.path.isdir(category_path):
+            run_dirs += [os.path.join(category_path, f) for f in sorted(os.listdir(category_path))
+                         if run_category(f) and run_timestamp(f) and os.path.isdir(os.path.join(category_path, f))]
+    pending = [d for d in run_dirs if not is_up_to_date(d, load_archive_manifest(archive_dir, os.path.basename(d)))]
+    print(f"📦 共 {len(run_dirs)} 個 run，{len(pending)} 個需要封存")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(archive_run, run_dir, archive_dir, timestamp): run_dir for run_dir in pending}
+            for future in as_completed(futures):
+                run_name = os.path.basename(futures[future])
+                try:
+                    manifest, new_blobs, new_bytes = future.result()
+                except Exception as e:
+                    log_lines.append(f"[{timestamp}] ❌ 封存 {run_name} 失敗：{e}")
+                    continue
+                log_lines.append(f"[{timestamp}] 📦 封存 {run_name}：{len(manifest['files'])} 個檔案，"
+                                 f"新增 {new_blobs} 個 blob（{new_bytes / 1e6:.2f} MB）")
+
+    # manifest 全部寫出後，回收重新封存後已不再被參照的舊 blob
+    removed, freed = collect_garbage(archive_dir)
+    if removed:
+        log_lines.append(f"[{timestamp}] 🧹 回收 {removed} 個不再使用的 blob（{freed / 1e6:.2f} MB）")
 
     # 寫入整理日誌
     log_path = os.path.join(root_dir, "整理日誌.log")
@@ -56,5 +222,8 @@ def organize_runs(root_dir="runs"):
     print(f"✅ 整理完成，共記錄 {len(log_lines)} 項操作。詳見：{log_path}")
 
 if __name__ == "__main__":
-    organize_runs()
-
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="runs")
+    parser.add_argument("--workers", type=int, default=None, help="同時封存的 run 數（預設為 CPU 核心數）")
+    args = parser.parse_args()
+    organize_runs(args.root, max_workers=args.workers)
@@ -1,15 +1,17 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+from columnar_store import series_index
 
 def plot_hs_curve(df, save_path="hs_curve_many.png"):
+    index = series_index(df.columns)   # 滑動 window 的 metrics 以 step 為橫軸
     fig, ax1 = plt.subplots()
-    ax1.plot(df['episode'], df['entropy'], 'b-', label='Entropy (H)')
-    ax1.set_xlabel('Episode')
+    ax1.plot(df[index], df['entropy'], 'b-', label='Entropy (H)')
+    ax1.set_xlabel(index.title())
     ax1.set_ylabel('Entropy', color='b')
     ax1.tick_params(axis='y', labelcolor='b')
 
     ax2 = ax1.twinx()
-    ax2.plot(df['episode'], df['wisdom_density'], 'r-', label='Wisdom Density (S)')
+    ax2.plot(df[index], df['wisdom_density'], 'r-', label='Wisdom Density (S)')
     ax2.set_ylabel('Wisdom Density', color='r')
     ax2.tick_params(axis='y', labelcolor='r')
 
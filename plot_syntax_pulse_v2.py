@@ -1,15 +1,16 @@
 # Final integrated version of plot_syntax_pulse_v2.py with function definition
 
 def plot_syntax_pulse(df, event_path, save_path):
-    import json
     import matplotlib.pyplot as plt
     import numpy as np
     import pandas as pd
     import os
+    from syntax_event_logger import load_events
 
-    # === 讀取語法事件日誌 ===
-    with open(event_path, encoding='utf-8') as f:
-        event_log = json.load(f)
+    # === 讀取語法事件日誌（任一格式，也可以是封存內的路徑）===
+    events = load_events(event_path)
+    index = events.columns[0]   # 事件位置：episode 或 step（滑動 window 的 metrics）
+    event_log = events.to_dict("records")
 
     # === 初步處理 ===
     cycles = []
@@ -37,7 +38,7 @@ def plot_syntax_pulse(df, event_path, save_path):
     for cycle in cycles:
         if not cycle:
             continue
-        episodes = [e['episode'] for e in cycle]
+        episodes = [e[index] for e in cycle]
         H = [e['h'] for e in cycle]
         S = [e['s'] for e in cycle]
 
@@ -48,7 +49,7 @@ def plot_syntax_pulse(df, event_path, save_path):
         plt.plot(episodes, H, label=f"Cycle {cycle[0]['cycle']} (H)")
         plt.plot(episodes, S, linestyle='--', alpha=0.5)
 
-    plt.xlabel('Episode')
+    plt.xlabel(index.title())
     plt.ylabel('H (solid) / S (dashed)')
     plt.title('Syntax Pulse Map V2 — Recursive Tracking')
     plt.grid(True)
@@ -70,12 +71,12 @@ def plot_syntax_pulse(df, event_path, save_path):
         num_omega = sum(1 for e in cycle if e['event'] == "Ω")
         num_break = sum(1 for e in cycle if e['event'] == "⊖")
         num_suspect = sum(1 for e in cycle if e['event'] == "≈")
-        episodes = [e['episode'] for e in cycle]
+        episodes = [e[index] for e in cycle]
 
         summary.append({
             "cycle_id": cycle[0]['cycle'],
-            "start_episode": episodes[0],
-            "end_episode": episodes[-1],
+            f"start_{index}": episodes[0],
+            f"end_{index}": episodes[-1],
             "length": episodes[-1] - episodes[0] + 1,
             "avg_H": avg_h,
             "avg_S": avg_s,
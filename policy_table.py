@@ -0,0 +1,124 @@
+# policy_table.py
+# ✅ 將訓練好的 PPO 策略蒸餾成 state → action 機率查表，評估時以 NumPy 查表取代 torch 前向運算
+
+import os
+import sys
+import hashlib
+import numpy as np
+import run_fs
+from maze_env.maze_env import MazeEnv
+
+# === 檔案雜湊（模型檔變更時查表自動失效）===
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with run_fs.open_file(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def maze_sha256(maze):
+    return hashlib.sha256(np.ascontiguousarray(maze).tobytes() + str(maze.shape).encode()).hexdigest()
+
+def policy_table_path(model_path):
+    # ppo_maze.zip → ppo_maze.policy.npz（與模型放在同一資料夾）
+    return os.path.splitext(model_path)[0] + ".policy.npz"
+
+# === 查表策略：與 SB3 model.predict 相同介面 ===
+class TabularPolicy:
+    def __init__(self, probs, n_cols, seed=None):
+        self.probs = probs
+        self.n_cols = n_cols
+        self.greedy_actions = probs.argmax(axis=1)
+        self.cumulative = np.cumsum(probs, axis=1)
+        self.rng = np.random.default_rng(seed)
+
+    def action_probabilities(self, obs):
+        obs = np.asarray(obs)
+        cells = obs[..., 0].astype(np.int64) * self.n_cols + obs[..., 1].astype(np.int64)
+        return self.probs[cells]
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        obs = np.asarray(observation)
+        cells = obs[..., 0].astype(np.int64) * self.n_cols + obs[..., 1].astype(np.int64)
+
+        if deterministic:
+            actions = self.greedy_actions[cells]
+        else:
+            u = self.rng.random(np.shape(cells))
+            cumulative = self.cumulative[cells]
+            actions = (u[..., None] >= cumulative).sum(axis=-1)
+            actions = np.minimum(actions, self.probs.shape[1] - 1)
+        return actions, None
+
+# === 由模型建立查表 ===
+def build_policy_table(model, env=None, batch_size=65_536):
+    """枚舉迷宮中所有非牆格子，記錄策略在每個狀態的動作分佈（牆格子維持全 0）"""
+    import torch
+
+    env = env or MazeEnv()
+    valid = np.flatnonzero(env.maze.ravel() != 1)
+    probs = np.zeros((env.maze.size, env.action_space.n), dtype=np.float32)
+
+    with torch.no_grad():
+        for start in range(0, len(valid), batch_size):
+            cells = valid[start:start + batch_size]
+            obs_tensor, _ = model.policy.obs_to_tensor(env.obs_table[cells])
+            dist = model.policy.get_distribution(obs_tensor)
+            probs[cells] = dist.distribution.probs.cpu().numpy()
+    return probs
+
+def save_policy_table(model_path, env=None, model=None):
+    env = env or MazeEnv()
+    if model is None:
+        from stable_baselines3 import PPO
+        model = PPO.load(model_path)
+
+    probs = build_policy_table(model, env)
+    table_path = policy_table_path(model_path)
+    tmp_path = table_path + ".tmp.npz"
+    np.savez_compressed(tmp_path, probs=probs, model_sha256=file_sha256(model_path),
+                        maze_sha256=maze_sha256(env.maze))
+    os.replace(tmp_path, table_path)
+    print(f"🗂️ 策略查表儲存到 {table_path}")
+    return probs
+
+def load_policy_table(model_path, env=None, seed=None):
+    """查表存在且模型 / 迷宮雜湊相符時回傳 TabularPolicy，否則回傳 None"""
+    env = env or MazeEnv()
+    table_path = policy_table_path(model_path)
+    if not run_fs.exists(table_path):
+        return None
+
+    with np.load(run_fs.open_file(table_path)) as data:
+        if str(data["model_sha256"]) != file_sha256(model_path) or str(data["maze_sha256"]) != maze_sha256(env.maze):
+            print(f"♻️ 模型或迷宮已變更，策略查表失效：{table_path}")
+            return None
+        probs = data["probs"]
+    return TabularPolicy(probs, env.maze.shape[1], seed=seed)
+
+# === 評估 / 服務入口：優先使用查表，沒有時才載入 torch 模型並建立查表 ===
+# model_path 也可以是 runs/archive 封存內的模型（直接由封存串流載入，查表只建在記憶體中）
+def load_policy(model_path, env=None, seed=None, build=True):
+    env = env or MazeEnv()
+    policy = load_policy_table(model_path, env, seed=seed)
+    if policy is not None:
+        print(f"⚡ 使用策略查表：{policy_table_path(model_path)}")
+        return policy
+
+    from stable_baselines3 import PPO
+    archived = not os.path.exists(model_path)
+    model = PPO.load(run_fs.open_file(model_path) if archived else model_path)
+    if not build:
+        return model
+    if archived:
+        return TabularPolicy(build_policy_table(model, env), env.maze.shape[1], seed=seed)
+    probs = save_policy_table(model_path, env, model=model)
+    return TabularPolicy(probs, env.maze.shape[1], seed=seed)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        target = sys.argv[1]
+    else:
+        from run_discovery import find_latest_model
+        target = find_latest_model()
+    save_policy_table(target)
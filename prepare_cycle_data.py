@@ -1,12 +1,11 @@
 # prepare_cycle_data.py
 
 import pandas as pd
-import json
 import os
+from syntax_event_logger import event_log_path, load_events
 
 # === 載入語法事件日誌
-with open('wisdom_rhythm.json', 'r') as f:
-    event_log = json.load(f)
+event_log = load_events(event_log_path(".")).to_dict("records")
 
 # === 整理資料
 cycles = []
@@ -0,0 +1,356 @@
+# run_catalog.py
+# ✅ run 目錄索引（runs/run_catalog.sqlite）：記錄每個 run 的類型、時間、產出檔（路徑 / 大小 / 雜湊）與重點指標
+#    「最新模型」「最新測試 run」「某 run 的所有 checkpoint」都改成索引查詢，不必每次 listdir 整個 runs/
+#    create_run_folder、model.save、checkpoint、calculate_metrics 與分析 stage 產出檔案時即時寫入；
+#    其他方式放進 runs/ 的資料夾（舊 run、organize_runs 搬移）以資料夾修改時間偵測，只重新掃描有變動的那一層；
+#    直接複製進既有 run 的檔案不會改變上層資料夾，需以 rescan_run 或 python run_catalog.py --rescan 重新掃描
+#    （run_checkpoints 只查一個 run，會順便檢查該 run 資料夾）
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import contextlib
+import numpy as np
+import pandas as pd
+import run_fs
+from columnar_store import COLUMNAR_SUFFIX, load_columns, table_columns, table_exists
+from syntax_event_logger import event_counts, event_log_path
+
+CATALOG_NAME = "run_catalog.sqlite"
+RUN_CATEGORIES = ("train", "test", "test_many", "fast", "eval")
+MODEL_NAME = "ppo_maze.zip"
+
+_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}")
+_CHECKPOINT = re.compile(r"checkpoint_(\d+)\.zip$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id   TEXT PRIMARY KEY,          -- 資料夾名稱，例如 train_2025-04-29_15-03-26
+    category TEXT NOT NULL,
+    created  TEXT NOT NULL,             -- 資料夾名稱中的時間戳記
+    path     TEXT NOT NULL,             -- 相對於 runs/ 的路徑
+    mtime_ns INTEGER                    -- 上次掃描產出檔時的資料夾修改時間（NULL = 尚未掃描）
+);
+CREATE INDEX IF NOT EXISTS runs_by_category ON runs (category, created);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id   TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    name     TEXT NOT NULL,             -- 相對於 run 資料夾的檔名
+    kind     TEXT NOT NULL,             -- model / checkpoint / table / plot / report / other
+    step     INTEGER,                   -- checkpoint 的訓練步數
+    size     INTEGER,
+    mtime_ns INTEGER,
+    sha256   TEXT,                      -- 掃描發現的檔案不計算雜湊（NULL）
+    recorded REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS artifacts_by_kind ON artifacts (kind, run_id, step);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    name   TEXT NOT NULL,
+    value  REAL,
+    PRIMARY KEY (run_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS scanned_dirs (
+    path     TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+# === 名稱解析 ===
+def run_timestamp(run_dir):
+    """資料夾名稱中的第一個時間戳記（train_2025-04-29_15-03-26 → 2025-04-29_15-03-26）"""
+    match = _TIMESTAMP.search(os.path.basename(os.path.normpath(run_dir)))
+    return match.group(0) if match else ""
+
+def run_category(run_dir):
+    name = os.path.basename(os.path.normpath(run_dir))
+    return max((c for c in RUN_CATEGORIES if name.startswith(c + "_")), key=len, default="")
+
+def run_base_dir(run_dir):
+    """run 所屬的 runs/ 根目錄：runs/train/train_x 與 runs/train_x 都對應 runs"""
+    parent = os.path.dirname(os.path.normpath(run_dir))
+    if os.path.basename(parent) in RUN_CATEGORIES:
+        return os.path.dirname(parent) or "."
+    return parent or "."
+
+def artifact_kind(name):
+    if name == MODEL_NAME:
+        return "model"
+    if _CHECKPOINT.search(name):
+        return "checkpoint"
+    ext = os.path.splitext(name)[1].lower()
+    return {".csv": "table", ".png": "plot", ".json": "report", ".jsonl": "report", ".txt": "report"}.get(ext, "other")
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# === 連線 ===
+@contextlib.contextmanager
+def open_catalog(base_dir="runs"):
+    """開啟（必要時建立）目錄索引；區塊正常結束時 commit。多個行程可同時使用（WAL）"""
+    os.makedirs(base_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(base_dir, CATALOG_NAME), timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _migrate(conn):
+    """舊版索引的 runs 表沒有 mtime_ns 欄位：補上後所有 run 會在下次同步時重新掃描一次"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    if "mtime_ns" not in columns:
+        conn.execute("ALTER TABLE runs ADD COLUMN mtime_ns INTEGER")
+
+def _upsert_run(conn, base_dir, run_dir):
+    run_id = os.path.basename(os.path.normpath(run_dir))
+    conn.execute(
+        "INSERT INTO runs (run_id, category, created, path) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (run_id) DO UPDATE SET category = excluded.category, path = excluded.path",
+        (run_id, run_category(run_dir), run_timestamp(run_dir), os.path.relpath(run_dir, base_dir)),
+    )
+    return run_id
+
+def _upsert_artifact(conn, run_id, run_dir, name, kind=None, step=None, sha256=None):
+    stat = os.stat(os.path.join(run_dir, name))
+    if step is None and (match := _CHECKPOINT.search(name)):
+        step = int(match.group(1))
+    conn.execute(
+        "INSERT OR REPLACE INTO artifacts (run_id, name, kind, step, size, mtime_ns, sha256, recorded) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (run_id, name, kind or artifact_kind(name), step, stat.st_size, stat.st_mtime_ns, sha256, time.time()),
+    )
+
+# === 寫入端（各產出點呼叫）===
+def register_run(run_dir):
+    """create_run_folder 建立資料夾後呼叫"""
+    with open_catalog(run_base_dir(run_dir)) as conn:
+        _upsert_run(conn, run_base_dir(run_dir), run_dir)
+
+def record_artifact(path, kind=None, step=None, sha256=None, run_dir=None):
+    """
+    記錄 run 資料夾內的一個產出檔（模型、checkpoint、表格、圖檔…）。
+    sha256 未提供時計算檔案雜湊；表格可傳入 analysis_pipeline 已算好的內容雜湊。
+    """
+    run_dir = run_dir or os.path.dirname(path)
+    name = os.path.relpath(path, run_dir).replace(os.sep, "/")
+    if sha256 is None and os.path.isfile(path):
+        sha256 = _file_sha256(path)
+    with open_catalog(run_base_dir(run_dir)) as conn:
+        run_id = _upsert_run(conn, run_base_dir(run_dir), run_dir)
+        _upsert_artifact(conn, run_id, run_dir, name, kind=kind, step=step, sha256=sha256)
+
+def remove_artifact(path, run_dir=None):
+    """產出檔被刪除時（例如 checkpoint 保留策略）同步移除索引紀錄"""
+    run_dir = run_dir or os.path.dirname(path)
+    name = os.path.relpath(path, run_dir).replace(os.sep, "/")
+    with open_catalog(run_base_dir(run_dir)) as conn:
+        conn.execute("DELETE FROM artifacts WHERE run_id = ? AND name = ?",
+                     (os.path.basename(os.path.normpath(run_dir)), name))
+
+def record_metrics(run_dir, metrics):
+    """記錄 run 的重點指標（{名稱: 數值}，None / NaN 略過）"""
+    values = [(name, float(value)) for name, value in metrics.items()
+              if value is not None and not pd.isna(value)]
+    with open_catalog(run_base_dir(run_dir)) as conn:
+        run_id = _upsert_run(conn, run_base_dir(run_dir), run_dir)
+        conn.executemany("INSERT OR REPLACE INTO metrics (run_id, name, value) VALUES (?, ?, ?)",
+                         [(run_id, name, value) for name, value in values])
+
+def headline_metrics(run_dir):
+    """由 run 資料夾內已產生的檔案整理重點指標（缺少的項目為 None）；封存的 run 直接讀取封存內容"""
+    def table_rows(path):
+        if not table_exists(path):
+            return None
+        try:
+            column = table_columns(path)[0]
+        except pd.errors.EmptyDataError:
+            return 0  # 沒有任何轉變點時輸出的是沒有欄位的空檔
+        return len(load_columns(path, [column])[column])
+
+    summary = {}
+    metrics_path = os.path.join(run_dir, "metrics.csv")
+    if table_exists(metrics_path):
+        columns = table_columns(metrics_path)
+        data = load_columns(metrics_path, [c for c in ("entropy", "wisdom_density", "cycle") if c in columns])
+        H = np.asarray(data["entropy"], dtype=np.float64)
+        S = np.asarray(data["wisdom_density"], dtype=np.float64)
+        summary["episodes"] = len(H)
+        if len(H):
+            summary.update({
+                "entropy_mean": H.mean(), "entropy_final": H[-1],
+                "wisdom_density_mean": S.mean(), "wisdom_density_final": S[-1],
+            })
+        if "cycle" in data:
+            summary["cycles"] = len(np.unique(data["cycle"]))
+    # metrics.csv 為滑動 window 的列；有每回合 metrics 時以實際回合數為準
+    episodes = table_rows(os.path.join(run_dir, "episode_metrics.csv"))
+    if episodes is not None:
+        summary["episodes"] = episodes
+
+    summary["transitions"] = table_rows(os.path.join(run_dir, "transition_points.csv"))
+    summary["cycle_transitions"] = table_rows(os.path.join(run_dir, "cycle_transition_points.csv"))
+
+    rhythm_path = event_log_path(run_dir)
+    if rhythm_path is not None:
+        counts = event_counts(rhythm_path)
+        summary.update({f"event_{symbol}": count for symbol, count in sorted(counts.items())})
+
+    logistic_path = os.path.join(run_dir, "logistic_fit_summary.csv")
+    if run_fs.exists(logistic_path):
+        best_r = pd.read_csv(run_fs.open_file(logistic_path), usecols=["best_r"])["best_r"]
+        summary["logistic_r_mean"] = best_r.mean()
+
+    rewards_path = os.path.join(run_dir, "rewards.csv")
+    if table_exists(rewards_path):
+        rewards = np.asarray(load_columns(rewards_path, ["reward"])["reward"], dtype=np.float64)
+        if len(rewards):
+            summary.update({"reward_mean": rewards.mean(), "reward_final": rewards[-1]})
+
+    summary["test_steps"] = table_rows(os.path.join(run_dir, "test_log.csv"))
+    return summary
+
+# === 與磁碟同步（只掃描修改時間有變的資料夾）===
+def _scan_dirs(base_dir):
+    return [base_dir] + [os.path.join(base_dir, c) for c in RUN_CATEGORIES if os.path.isdir(os.path.join(base_dir, c))]
+
+def _scan_run_artifacts(conn, run_id, run_dir, mtime_ns):
+    """
+    與 run 資料夾內容對齊：新增或大小 / 修改時間有變的檔案重新登記（保留未變動檔案已記錄的雜湊），
+    已不存在的檔案移除紀錄
+    """
+    known = {name: (size, mtime) for name, size, mtime in
+             conn.execute("SELECT name, size, mtime_ns FROM artifacts WHERE run_id = ?", (run_id,))}
+    present = set()
+    for name in sorted(os.listdir(run_dir)):
+        path = os.path.join(run_dir, name)
+        if not os.path.isfile(path) or name.endswith(COLUMNAR_SUFFIX):
+            continue
+        present.add(name)
+        stat = os.stat(path)
+        if known.get(name) != (stat.st_size, stat.st_mtime_ns):
+            _upsert_artifact(conn, run_id, run_dir, name)
+    # 只檢查 run 資料夾第一層的紀錄（record_artifact 也可能記錄子資料夾內的檔案）
+    gone = [name for name in known if "/" not in name and name not in present]
+    conn.executemany("DELETE FROM artifacts WHERE run_id = ? AND name = ?", [(run_id, name) for name in gone])
+    conn.execute("UPDATE runs SET mtime_ns = ? WHERE run_id = ?", (mtime_ns, run_id))
+
+def _refresh_run(conn, base_dir, run_dir, force=False):
+    """run 資料夾修改時間與上次掃描不同（或尚未掃描）時重新掃描產出檔"""
+    run_id = _upsert_run(conn, base_dir, run_dir)
+    mtime_ns = os.stat(run_dir).st_mtime_ns
+    scanned = conn.execute("SELECT mtime_ns FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+    if force or scanned != mtime_ns:
+        _scan_run_artifacts(conn, run_id, run_dir, mtime_ns)
+    return run_id
+
+def sync_catalog(conn, base_dir="runs", force=False):
+    """
+    把 runs/ 與 runs/<類別>/ 中新增、搬移、刪除的 run 同步進索引。
+    每次查詢只 stat 這幾層資料夾，與 run 數量無關；修改時間有變的那一層才 listdir，
+    並只掃描其中新出現或修改時間有變的 run。force=True 時重新掃描所有 run 的產出檔。
+    """
+    scanned = dict(conn.execute("SELECT path, mtime_ns FROM scanned_dirs"))
+    changed = {}
+    for scan_dir in _scan_dirs(base_dir):
+        rel = os.path.relpath(scan_dir, base_dir)
+        mtime_ns = os.stat(scan_dir).st_mtime_ns
+        if force or scanned.get(rel) != mtime_ns:
+            changed[rel] = mtime_ns
+    if not changed:
+        return
+
+    # 先加入 / 更新所有看得到的 run，再刪除已不存在的（搬移過的 run 路徑已更新，不會被刪）
+    seen = set()
+    for rel in changed:
+        scan_dir = os.path.join(base_dir, rel)
+        for name in os.listdir(scan_dir):
+            run_dir = os.path.join(scan_dir, name)
+            if run_category(name) and run_timestamp(name) and os.path.isdir(run_dir):
+                seen.add(_refresh_run(conn, base_dir, run_dir, force=force))
+    gone = [run_id for run_id, path in conn.execute("SELECT run_id, path FROM runs").fetchall()
+            if run_id not in seen and (os.path.dirname(path) or ".") in changed
+            and not os.path.isdir(os.path.join(base_dir, path))]
+    conn.executemany("DELETE FROM runs WHERE run_id = ?", [(run_id,) for run_id in gone])
+    conn.executemany("INSERT OR REPLACE INTO scanned_dirs (path, mtime_ns) VALUES (?, ?)", changed.items())
+
+def rescan_run(run_dir, force=True):
+    """重新掃描單一 run 的產出檔（手動複製檔案進既有 run 之後呼叫）"""
+    base_dir = run_base_dir(run_dir)
+    with open_catalog(base_dir) as conn:
+        _refresh_run(conn, base_dir, run_dir, force=force)
+
+# === 查詢 ===
+def find_runs(base_dir="runs", categories=RUN_CATEGORIES):
+    """符合類別的 run 資料夾，由舊到新排序"""
+    if not os.path.isdir(base_dir):
+        return []
+    categories = list(categories)
+    with open_catalog(base_dir) as conn:
+        sync_catalog(conn, base_dir)
+        rows = conn.execute(
+            f"SELECT path FROM runs WHERE category IN ({','.join('?' * len(categories))}) ORDER BY created, path",
+            categories,
+        ).fetchall()
+    return [os.path.join(base_dir, path) for path, in rows]
+
+def latest_run(base_dir="runs", categories=RUN_CATEGORIES):
+    runs = find_runs(base_dir, categories)
+    return runs[-1] if runs else None
+
+def latest_model(base_dir="runs"):
+    """最新一個有 ppo_maze.zip 的訓練 run 的模型路徑；找不到時回傳 None"""
+    if not os.path.isdir(base_dir):
+        return None
+    with open_catalog(base_dir) as conn:
+        sync_catalog(conn, base_dir)
+        rows = conn.execute(
+            "SELECT r.path FROM runs r JOIN artifacts a ON a.run_id = r.run_id "
+            "WHERE r.category = 'train' AND a.kind = 'model' ORDER BY r.created DESC, r.path DESC"
+        ).fetchall()
+    for path, in rows:
+        model_path = os.path.join(base_dir, path, MODEL_NAME)
+        if os.path.exists(model_path):
+            return model_path
+    return None
+
+def run_checkpoints(run_dir):
+    """某個 run 的所有 checkpoint：[(step, 路徑)]，依步數排序"""
+    base_dir = run_base_dir(run_dir)
+    with open_catalog(base_dir) as conn:
+        sync_catalog(conn, base_dir)
+        if os.path.isdir(run_dir) and run_category(run_dir) and run_timestamp(run_dir):
+            _refresh_run(conn, base_dir, run_dir)
+        rows = conn.execute(
+            "SELECT a.step, a.name FROM artifacts a JOIN runs r ON a.run_id = r.run_id "
+            "WHERE r.run_id = ? AND a.kind = 'checkpoint' ORDER BY a.step",
+            (os.path.basename(os.path.normpath(run_dir)),),
+        ).fetchall()
+    return [(step, os.path.join(run_dir, name)) for step, name in rows
+            if os.path.exists(os.path.join(run_dir, name))]
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-dir", default="runs")
+    parser.add_argument("--rescan", action="store_true", help="忽略資料夾修改時間，重新掃描全部")
+    args = parser.parse_args()
+
+    with open_catalog(args.base_dir) as conn:
+        sync_catalog(conn, args.base_dir, force=args.rescan)
+        for category, count in conn.execute("SELECT category, COUNT(*) FROM runs GROUP BY category ORDER BY category"):
+            print(f"📂 {category}：{count} 個 run")
+    print(f"✅ 目錄索引：{os.path.join(args.base_dir, CATALOG_NAME)}")
@@ -0,0 +1,29 @@
+# run_discovery.py
+# ✅ 統一的 run 資料夾搜尋（取代各分析腳本各自複製的 find_latest_test_dir）
+#    同時涵蓋 organize_runs 之後的 runs/<類別>/<類別>_* 與整理前的 runs/<類別>_*，依資料夾名稱中的時間排序
+#    實際查詢交給 run_catalog 的 SQLite 索引，不再每次 listdir
+
+from run_catalog import find_runs, latest_model, run_category, run_timestamp
+
+TEST_CATEGORIES = ("test", "test_many", "fast")
+BATCH_CATEGORIES = ("test", "test_many", "train")
+
+def find_run_dirs(base_dir="runs", categories=TEST_CATEGORIES):
+    """所有符合類別的 run 資料夾，由舊到新排序"""
+    return find_runs(base_dir, categories)
+
+def find_latest_test_dir(base_dir="runs", categories=TEST_CATEGORIES):
+    run_dirs = find_run_dirs(base_dir, categories)
+    if not run_dirs:
+        raise FileNotFoundError("❌ 找不到任何 test、test_many 或 fast 類型的測試資料夾。")
+
+    latest_dir = run_dirs[-1]
+    print("📂 最新測試資料夾：", latest_dir)
+    return latest_dir
+
+def find_latest_model(base_dir="runs"):
+    model_path = latest_model(base_dir)
+    if model_path is None:
+        raise FileNotFoundError("❌ 找不到模型 ppo_maze.zip")
+    print(f"✅ 載入最新模型：{model_path}")
+    return model_path
@@ -0,0 +1,273 @@
+# run_fs.py
+# ✅ 虛擬 run 檔案系統：直接讀取 runs/archive 中封存的 run，不必先解壓到磁碟
+#    - 舊格式 zip：runs/archive/<run>_<封存時間>.zip/metrics.csv
+#    - blob 封存（organize_runs）：runs/archive/<run>/metrics.csv，依 manifests/<run>.json 對應到 blobs/
+#    磁碟上存在的路徑一律直接讀檔；封存成員以串流讀取，較小的成員整份放進 LRU 快取，重複讀取不再解壓
+
+import io
+import os
+import re
+import json
+import gzip
+import time
+import zipfile
+import threading
+from collections import OrderedDict
+
+# === 封存格式（organize_runs 寫入端共用）===
+BLOB_DIR = "blobs"
+MANIFEST_DIR = "manifests"
+MANIFEST_VERSION = 1
+
+CACHE_BYTES = 256 << 20         # LRU 快取上限（位元組）
+MAX_CACHED_MEMBER = 64 << 20    # 超過此大小的成員不進快取，每次串流讀取
+
+_ARCHIVE_RUN = re.compile(r"^(.*?\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})")
+
+def blob_path(archive_dir, sha256, codec):
+    name = sha256 + (".gz" if codec == "gzip" else "")
+    return os.path.join(archive_dir, BLOB_DIR, sha256[:2], name)
+
+def manifest_path(archive_dir, run_name):
+    return os.path.join(archive_dir, MANIFEST_DIR, f"{run_name}.json")
+
+def load_archive_manifest(archive_dir, run_name):
+    path = manifest_path(archive_dir, run_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+# === LRU 快取 ===
+class MemberCache:
+    """以位元組數為上限的 LRU 快取：key → bytes"""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+_cache = MemberCache()
+_zip_files = {}        # zip 路徑 → (修改時間 ns, ZipFile)，中央目錄只讀一次
+_manifests = {}        # manifest 路徑 → (修改時間 ns, manifest)
+_lock = threading.Lock()
+
+def cache_info():
+    return {"hits": _cache.hits, "misses": _cache.misses, "bytes": _cache.size, "entries": len(_cache.entries)}
+
+def clear_cache():
+    _cache.clear()
+
+# === 封存容器 ===
+def _open_zip(path):
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _zip_files.get(path)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        zf = zipfile.ZipFile(path)
+        _zip_files[path] = (mtime_ns, zf)
+        return zf
+
+def _blob_manifest(container):
+    archive_dir, run_name = os.path.split(container)
+    path = manifest_path(archive_dir, run_name)
+    if not os.path.isfile(path):
+        return None
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _manifests.get(path)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+    manifest = load_archive_manifest(archive_dir, run_name)
+    with _lock:
+        _manifests[path] = (mtime_ns, manifest)
+    return manifest
+
+def split_virtual(path):
+    """
+    把封存內的路徑拆成 (種類, 容器, 成員)；不是封存路徑時回傳 None。
+    runs/archive/x.zip/metrics.csv → ("zip", "runs/archive/x.zip", "metrics.csv")
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    for i in range(len(parts) - 1, 0, -1):
+        container = os.sep.join(parts[:i])
+        member = "/".join(parts[i:])
+        if container.endswith(".zip") and os.path.isfile(container):
+            return "zip", container, member
+        if _blob_manifest(container) is not None:
+            return "blob", container, member
+    return None
+
+def _member_info(path):
+    """(種類, 容器, 成員, 資訊)；資訊為 ZipInfo 或 manifest 的檔案紀錄，不存在時回傳 None"""
+    virtual = split_virtual(path)
+    if virtual is None:
+        return None
+    kind, container, member = virtual
+    if kind == "zip":
+        try:
+            info = _open_zip(container).getinfo(member)
+        except KeyError:
+            return None
+    else:
+        info = _blob_manifest(container)["files"].get(member)
+        if info is None:
+            return None
+    return kind, container, member, info
+
+def _member_names(path):
+    virtual = split_virtual(os.path.join(path, "_"))
+    if virtual is None:
+        return []
+    kind, container, _ = virtual
+    prefix = os.path.relpath(path, container).replace(os.sep, "/")
+    prefix = "" if prefix == "." else prefix + "/"
+    if kind == "zip":
+        names = _open_zip(container).namelist()
+    else:
+        names = _blob_manifest(container)["files"].keys()
+    return [name[len(prefix):] for name in names if name.startswith(prefix) and not name.endswith("/")]
+
+# === 與 os.path / open 對應的介面 ===
+def exists(path):
+    return os.path.exists(path) or _member_info(path) is not None or bool(_member_names(path))
+
+def isfile(path):
+    return os.path.isfile(path) or _member_info(path) is not None
+
+def isdir(path):
+    return os.path.isdir(path) or bool(_member_names(path))
+
+def listdir(path):
+    if os.path.isdir(path):
+        return os.listdir(path)
+    names = _member_names(path)
+    if not names:
+        raise FileNotFoundError(path)
+    return sorted({name.split("/")[0] for name in names})
+
+def getmtime(path):
+    if os.path.exists(path):
+        return os.path.getmtime(path)
+    member = _member_info(path)
+    if member is None:
+        raise FileNotFoundError(path)
+    kind, _, _, info = member
+    if kind == "zip":
+        return time.mktime(info.date_time + (0, 0, -1))
+    return info["mtime_ns"] / 1e9
+
+def getsize(path):
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    member = _member_info(path)
+    if member is None:
+        raise FileNotFoundError(path)
+    kind, _, _, info = member
+    return info.file_size if kind == "zip" else info["size"]
+
+def _open_member(kind, container, member, info):
+    if kind == "zip":
+        return _open_zip(container).open(member)
+    source = blob_path(os.path.dirname(container), info["sha256"], info["codec"])
+    return gzip.open(source, "rb") if info["codec"] == "gzip" else open(source, "rb")
+
+def open_file(path, mode="rb", encoding="utf-8"):
+    """開啟磁碟或封存內的檔案（唯讀）。mode 為 "r" 時回傳文字串流"""
+    if mode not in ("r", "rb"):
+        raise ValueError(f"❌ 封存內的檔案只能讀取：{mode}")
+    if os.path.exists(path):
+        return open(path, mode, encoding=encoding if mode == "r" else None)
+
+    member = _member_info(path)
+    if member is None:
+        raise FileNotFoundError(path)
+    kind, container, name, info = member
+    # blob 以內容雜湊為 key，不同 run 的相同檔案共用同一份快取
+    key = ("blob", info["sha256"]) if kind == "blob" else ("zip", container, os.stat(container).st_mtime_ns, name)
+    size = getsize(path)
+
+    data = _cache.get(key)
+    if data is None and size <= MAX_CACHED_MEMBER:
+        with _open_member(kind, container, name, info) as f:
+            data = f.read()
+        _cache.put(key, data)
+    stream = io.BytesIO(data) if data is not None else _open_member(kind, container, name, info)
+    return io.TextIOWrapper(stream, encoding=encoding) if mode == "r" else stream
+
+def read_bytes(path):
+    with open_file(path, "rb") as f:
+        return f.read()
+
+def read_json(path):
+    with open_file(path, "r") as f:
+        return json.load(f)
+
+# === 封存 run 列表 ===
+def archive_run_name(run_dir):
+    """train_2025-04-30_11-02-15_2025-05-04_16-07-34.zip → train_2025-04-30_11-02-15"""
+    name = os.path.basename(os.path.normpath(run_dir))
+    match = _ARCHIVE_RUN.match(name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+def archived_runs(base_dir="runs"):
+    """
+    封存中的每個 run 各取一份可直接讀取的虛擬資料夾（{run 名稱: 路徑}）：
+    blob 封存優先，其次是封存時間最新的舊格式 zip；
+    整個分類資料夾打包成的 zip（內含多個 run 資料夾）會展開成各個 run
+    """
+    archive_dir = os.path.join(base_dir, "archive")
+    runs = {}
+    if not os.path.isdir(archive_dir):
+        return runs
+    for name in sorted(os.listdir(archive_dir)):
+        if not name.endswith(".zip"):
+            continue
+        path = os.path.join(archive_dir, name)
+        subdirs = {member.split("/")[0] for member in _open_zip(path).namelist() if "/" in member}
+        if subdirs and all(_ARCHIVE_RUN.match(d) for d in subdirs):
+            runs.update({d: os.path.join(path, d) for d in subdirs})
+        else:
+            runs[archive_run_name(name)] = path
+    manifest_dir = os.path.join(archive_dir, MANIFEST_DIR)
+    if os.path.isdir(manifest_dir):
+        for name in sorted(os.listdir(manifest_dir)):
+            if name.endswith(".json"):
+                run_name = name[:-len(".json")]
+                runs[run_name] = os.path.join(archive_dir, run_name)
+    return runs
@@ -0,0 +1,103 @@
+# run_logger.py
+# ✅ 串流寫入 rewards / test_log / metrics：固定大小 NumPy 緩衝區，每 N 筆追加寫入磁碟
+#    主要格式為欄式二進位檔（columnar_store），CSV 為選擇性的匯出檔
+#    中途當機最多只遺失最後一個緩衝區，讀取端也以分塊方式串流，記憶體用量與 run 長度無關
+
+import os
+import numpy as np
+import pandas as pd
+from columnar_store import ColumnarAppender, load_columns
+
+DEFAULT_FLUSH_EVERY = 10_000
+
+# === 各檔案欄位與型別 ===
+REWARDS_COLUMNS = {
+    "episode": np.int64,
+    "reward": np.float32,
+}
+
+TEST_LOG_COLUMNS = {
+    "step": np.int64,
+    "position_x": np.int64,
+    "position_y": np.int64,
+    "action": np.int64,
+    "reward": np.float64,
+    "terminated": np.bool_,
+}
+
+TEST_MANY_METRICS_COLUMNS = {
+    "episode": np.int64,
+    "entropy": np.float64,
+    "wisdom_density": np.float64,
+    "loop_entry_step": np.int32,  # -1 = 未偵測到迴圈
+    "loop_length": np.int32,
+    "modularity": np.float64,     # 該回合格子轉移圖的 Q
+}
+
+class StreamingTableWriter:
+    """
+    追加式表格寫入器。資料先放進固定大小的結構化 NumPy 緩衝區，
+    滿 flush_every 筆（或 close 時）才一次追加到欄式檔（以及 export_csv=True 時的 CSV）。
+    """
+
+    def __init__(self, path, columns, flush_every=DEFAULT_FLUSH_EVERY, export_csv=True):
+        self.path = path
+        self.columns = list(columns)
+        self.buffer = np.zeros(flush_every, dtype=np.dtype([(name, dtype) for name, dtype in columns.items()]))
+        self.size = 0
+        self.rows_written = 0
+        self.export_csv = export_csv
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if export_csv:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                f.write(",".join(self.columns) + "\n")
+        elif os.path.exists(path):
+            os.remove(path)  # 避免留下過時的 CSV
+        # 欄式檔在 CSV 之後建立與更新，時間戳記永遠不早於 CSV
+        self.appender = ColumnarAppender(path, columns)
+
+    def append(self, **row):
+        self.buffer[self.size] = tuple(row[name] for name in self.columns)
+        self.size += 1
+        if self.size == len(self.buffer):
+            self.flush()
+
+    def extend(self, **columns):
+        """一次追加多筆（各欄位為等長陣列）"""
+        n = len(columns[self.columns[0]])
+        start = 0
+        while start < n:
+            take = min(n - start, len(self.buffer) - self.size)
+            for name in self.columns:
+                self.buffer[name][self.size:self.size + take] = columns[name][start:start + take]
+            self.size += take
+            start += take
+            if self.size == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+        chunk = self.buffer[:self.size]
+        if self.export_csv:
+            pd.DataFrame(chunk).to_csv(self.path, mode="a", header=False, index=False)
+        self.appender.append({name: chunk[name] for name in self.columns})
+        self.rows_written += self.size
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+    def __len__(self):
+        return self.rows_written + self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# === 讀取端：欄式檔直接 memmap 單一欄位，沒有欄式檔時才解析 CSV ===
+def read_column(path, column):
+    return np.array(load_columns(path, [column])[column])
@@ -2,36 +2,39 @@
 
 import pandas as pd
 import matplotlib.pyplot as plt
-import json
 import os
+from columnar_store import load_table, series_index, table_columns
+from syntax_event_logger import event_log_path, load_events
 
 # === 📦 載入資料 ===
 metrics_path = "runs/latest_test/metrics.csv"  # TODO: 改成你最新的路徑
-event_path = "runs/latest_test/wisdom_rhythm.json"
+event_path = event_log_path("runs/latest_test")
 
-metrics = pd.read_csv(metrics_path)
-with open(event_path, "r") as f:
-    events = json.load(f)
+index = series_index(table_columns(metrics_path))   # 滑動 window 的 metrics 以 step 為橫軸
+metrics = load_table(metrics_path, columns=[index, "entropy", "wisdom_density"])
+events = load_events(event_path)
+event_index = events.columns[0]
+events = events.to_dict("records")
 
 # === 🎨 畫圖區 ===
 fig, ax1 = plt.subplots(figsize=(12, 6))
 
 # 📈 H 曲線（藍）
-ax1.plot(metrics["episode"], metrics["entropy"], label="Entropy (H)", color="blue")
-ax1.set_xlabel("Episode")
+ax1.plot(metrics[index], metrics["entropy"], label="Entropy (H)", color="blue")
+ax1.set_xlabel(index.title())
 ax1.set_ylabel("Entropy (H)", color="blue")
 ax1.tick_params(axis='y', labelcolor='blue')
 
 # 🎯 畫出每個轉變點符號
 for e in events:
     symbol = e["event"]
-    ep = e["episode"]
+    ep = e[event_index]
     h = e["h"]
     ax1.text(ep, h + 0.01, symbol, fontsize=12, color="black", ha='center')
 
 # 📉 S 曲線（紅）
 ax2 = ax1.twinx()
-ax2.plot(metrics["episode"], metrics["wisdom_density"], label="Wisdom Density (S)", color="red")
+ax2.plot(metrics[index], metrics["wisdom_density"], label="Wisdom Density (S)", color="red")
 ax2.set_ylabel("Wisdom Density (S)", color="red")
 ax2.tick_params(axis='y', labelcolor='red')
 
@@ -2,25 +2,33 @@
 # ✅ 產出智慧訓練與語法事件的分析總結報告（純文字）
 
 import os
-import json
 import pandas as pd
+import run_fs
+from columnar_store import load_table, table_exists
+from syntax_event_logger import EVENT_SYMBOLS, event_counts, event_log_path
 
-def generate_summary_report(run_dir):
+def generate_summary_report(run_dir, report_path=None):
+    """run_dir 也可以是 runs/archive 內的封存 run（此時需指定 report_path）"""
     lines = []
     lines.append("\n📘 智慧節奏分析報告")
     lines.append(f"\n📂 測試資料夾：{os.path.basename(run_dir)}")
 
     metrics_path = os.path.join(run_dir, "metrics.csv")
-    rhythm_path = os.path.join(run_dir, "wisdom_rhythm.json")
+    rhythm_path = event_log_path(run_dir)
     transition_path = os.path.join(run_dir, "transition_points.csv")
     q_event_path = os.path.join(run_dir, "q_events.json")
 
     # Step 1: metrics 檢查與事件統計
-    if os.path.exists(metrics_path):
-        df = pd.read_csv(metrics_path)
+    if table_exists(metrics_path):
+        df = load_table(metrics_path)
         df = df.rename(columns={"entropy": "h", "wisdom_density": "s"})  # ⬅️ 欄位轉換以避免錯誤
         lines.append(f"\n1. 語法事件統計：")
-        lines.append(f"   - 總回合數：{len(df)}")
+        if "step" in df.columns:
+            # 滑動 window 的 metrics：每列是一個 window，episode 為 window 結尾所屬的回合
+            lines.append(f"   - 總回合數：{int(df['episode'].max()) if len(df) else 0}")
+            lines.append(f"   - 滑動 window 列數：{len(df)}")
+        else:
+            lines.append(f"   - 總回合數：{len(df)}")
         if "cycle" in df.columns:
             lines.append(f"   - cycle 欄位：✅ 已加入")
             lines.append(f"   - 總週期數：{df['cycle'].nunique()}")
@@ -30,30 +38,28 @@ def generate_summary_report(run_dir):
         lines.append("\n1. 語法事件統計：❌ 找不到 metrics.csv")
 
     # Step 2: wisdom_rhythm 統計
-    if os.path.exists(rhythm_path):
-        with open(rhythm_path, encoding="utf-8") as f:
-            events = json.load(f)
-        counts = {}
-        for e in events:
-            counts[e["event"]] = counts.get(e["event"], 0) + 1
+    if rhythm_path is not None:
+        counts = event_counts(rhythm_path)
         lines.append("\n2. 語法節奏分佈：")
-        for k in ["∅", "Σ", "Δ", "Ω", "⊖", "≈"]:
+        for k in EVENT_SYMBOLS:
             v = counts.get(k, 0)
             lines.append(f"   - {k}：{v} 回合")
     else:
-        lines.append("\n2. 語法節奏分佈：❌ 找不到 wisdom_rhythm.json")
+        lines.append("\n2. 語法節奏分佈：❌ 找不到 wisdom_rhythm 事件日誌")
 
     # Step 3: transition point
-    if os.path.exists(transition_path):
-        df_trans = pd.read_csv(transition_path)
-        lines.append(f"\n3. 結構轉變點：{len(df_trans)} 個轉折點偵測到 ✅")
+    if run_fs.exists(transition_path):
+        try:
+            n_transitions = len(pd.read_csv(run_fs.open_file(transition_path)))
+        except pd.errors.EmptyDataError:
+            n_transitions = 0   # 舊版沒有轉變點時寫出的空檔（沒有欄位名稱）
+        lines.append(f"\n3. 結構轉變點：{n_transitions} 個轉折點偵測到 ✅")
     else:
         lines.append("\n3. 結構轉變點：❌ 找不到 transition_points.csv")
 
     # Step 4: Q事件
-    if os.path.exists(q_event_path):
-        with open(q_event_path, encoding="utf-8") as f:
-            q_events = json.load(f)
+    if run_fs.exists(q_event_path):
+        q_events = run_fs.read_json(q_event_path)
         lines.append(f"\n4. 模組化 Q 值事件：{len(q_events)} 筆 ✅")
     else:
         lines.append("\n4. 模組化 Q 值事件：❌ 無資料或未執行")
@@ -62,13 +68,13 @@ def generate_summary_report(run_dir):
     lines.append("\n5. 圖片輸出：")
     for fig in ["syntax_pulse_v2.png", "fit_H_logistic.png", "fit_S_growth.png"]:
         fig_path = os.path.join(run_dir, fig)
-        if os.path.exists(fig_path):
+        if run_fs.exists(fig_path):
             lines.append(f"   - {fig}：✅")
         else:
             lines.append(f"   - {fig}：❌ 未生成")
 
     # 輸出報告
-    report_path = os.path.join(run_dir, "summary_report.txt")
+    report_path = report_path or os.path.join(run_dir, "summary_report.txt")
     with open(report_path, "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
 
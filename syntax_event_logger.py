@@ -1,48 +1,171 @@
 # syntax_event_logger.py（簡化版本）
+# ✅ 事件以整數代碼存放（EVENT_SYMBOLS 為代碼表），整批 H / S / Q 陣列可一次向量化分類（log_batch）
+#    輸出格式依副檔名：.jsonl（第一行為代碼表，其後每行一個事件）、.csv（欄式二進位檔 .cols）、.json（舊格式陣列）
+#    第一個欄位是事件在 metrics 上的位置：滑動 window 的 metrics 為 step，每回合一列的 metrics 為 episode
 
+import os
 import json
+import numpy as np
+import pandas as pd
+import run_fs
+from columnar_store import load_columns, save_table, table_exists
+
+EVENT_SYMBOLS = ("∅", "Σ", "Δ", "Ω", "⊖", "≈")
+NO_EVENT = -1
+EMPTY, SIGMA, DELTA, OMEGA, BREAK, APPROX = range(len(EVENT_SYMBOLS))
+
+RHYTHM_NAME = "wisdom_rhythm.jsonl"
+RHYTHM_NAMES = (RHYTHM_NAME, "wisdom_rhythm.csv", "wisdom_rhythm.json")   # 讀取時的優先順序（.csv 指欄式檔）
+
+def event_columns(index="episode"):
+    return {index: np.int64, "code": np.int8, "h": np.float64, "s": np.float64, "q": np.float64}
+
+EVENT_COLUMNS = event_columns()
 
 class SyntaxEventLogger:
-    def __init__(self, h_threshold=0.8, s_threshold=0.5, q_threshold=0.3):
+    def __init__(self, h_threshold=0.8, s_threshold=0.5, q_threshold=0.3, index="episode"):
+        self.index = index
+        self.dtypes = event_columns(index)
         self.h_threshold = h_threshold
         self.s_threshold = s_threshold
         self.q_threshold = q_threshold
-        self.event_log = []
+        self.chunks = []          # [{欄位: ndarray}]，每次 log_batch 一塊
         self.prev_h = None
         self.prev_s = None
         self.prev_event = None
 
-    def log_event(self, episode, h, s, q, terminated):
-        event = None
-
-        if h < 0.5 and s < 0.2:
-            event = "∅"
-        elif 0.5 <= h < self.h_threshold:
-            event = "Σ"
-        elif h >= self.h_threshold:
-            event = "Δ"
-        if terminated and s >= self.s_threshold:
-            event = "Ω"
-
-        if self.prev_s is not None and s < self.prev_s:
-            event = "⊖"
-        if self.prev_h is not None and h > self.prev_h and self.prev_event == "⊖":
-            event = "≈"
-
-        if event:
-            self.event_log.append({
-                "episode": int(episode),
-                "event": event,
-                "h": float(h),
-                "s": float(s),
-                "q": float(q)
-            })
-
-        self.prev_h = h
-        self.prev_s = s
-        self.prev_event = event
-
-    def save_log(self, save_path="wisdom_rhythm.json"):
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(self.event_log, f, indent=4, ensure_ascii=False)
-        print(f"✅ 智慧節奏日誌已儲存到 {save_path}")
+    def log_event(self, position, h, s, q, terminated):
+        self.log_batch([position], [h], [s], [q], [terminated])
+
+    def classify(self, h, s, terminated):
+        """
+        與逐筆規則相同的向量化分類，回傳每一列的事件代碼（NO_EVENT 表示無事件）。
+        ⊖ / ≈ 依賴前一列的事件：⊖ 只在「S 下降且不是 ≈」時成立，而 ≈ 需要前一列是 ⊖，
+        連續「S 下降且 H 上升」的區段內兩者交替出現，因此以區段起點的狀態加上區段內位置的奇偶決定。
+        """
+        n = len(h)
+        codes = np.full(n, NO_EVENT, dtype=np.int8)
+        with np.errstate(invalid="ignore"):
+            codes[(h >= 0.5) & (h < self.h_threshold)] = SIGMA
+            codes[h >= self.h_threshold] = DELTA
+            codes[(h < 0.5) & (s < 0.2)] = EMPTY
+            codes[terminated & (s >= self.s_threshold)] = OMEGA
+
+            # 前一列（第一列接續上一次呼叫的狀態；沒有前一列時以 NaN 比較，結果為 False）
+            prev_h = np.empty(n)
+            prev_s = np.empty(n)
+            prev_h[0] = np.nan if self.prev_h is None else self.prev_h
+            prev_s[0] = np.nan if self.prev_s is None else self.prev_s
+            prev_h[1:] = h[:-1]
+            prev_s[1:] = s[:-1]
+            s_down = s < prev_s
+            h_up = h > prev_h
+
+        both = s_down & h_up
+        idx = np.arange(n)
+        # 每一列之前（含本身）最後一個不屬於「S 降且 H 升」的位置；-1 代表上一次呼叫的最後一列
+        anchor = np.maximum.accumulate(np.where(both, -1, idx))
+        anchor_break = np.where(anchor >= 0, s_down[np.maximum(anchor, 0)] & ~h_up[np.maximum(anchor, 0)],
+                                self.prev_event == EVENT_SYMBOLS[BREAK])
+        is_break = np.where(both, anchor_break ^ ((idx - anchor - 1) % 2 == 0), s_down)
+        prev_break = np.empty(n, dtype=bool)
+        prev_break[0] = self.prev_event == EVENT_SYMBOLS[BREAK]
+        prev_break[1:] = is_break[:-1]
+
+        codes[s_down] = BREAK
+        codes[h_up & prev_break] = APPROX
+        return codes
+
+    def log_batch(self, positions, h, s, q, terminated):
+        """整批記錄（例如 metrics 表格的整個欄位），結果與逐筆呼叫 log_event 相同"""
+        h = np.asarray(h, dtype=np.float64)
+        s = np.asarray(s, dtype=np.float64)
+        n = len(h)
+        if n == 0:
+            return
+        q = np.broadcast_to(np.asarray(q, dtype=np.float64), (n,))
+        terminated = np.broadcast_to(np.asarray(terminated).astype(bool), (n,))
+        positions = np.asarray(positions).astype(np.int64)
+
+        codes = self.classify(h, s, terminated)
+        keep = codes != NO_EVENT
+        self.chunks.append({self.index: positions[keep], "code": codes[keep], "h": h[keep], "s": s[keep], "q": q[keep]})
+
+        self.prev_h = h[-1]
+        self.prev_s = s[-1]
+        self.prev_event = EVENT_SYMBOLS[codes[-1]] if codes[-1] != NO_EVENT else None
+
+    def columns(self):
+        """{欄位: ndarray}，code 為 EVENT_SYMBOLS 的索引"""
+        if not self.chunks:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in self.dtypes.items()}
+        if len(self.chunks) > 1:
+            self.chunks = [{name: np.concatenate([c[name] for c in self.chunks]) for name in self.dtypes}]
+        return self.chunks[0]
+
+    def __len__(self):
+        return sum(len(c["code"]) for c in self.chunks)
+
+    @property
+    def event_log(self):
+        """舊介面：[{episode（或 step）, event, h, s, q}]"""
+        return events_to_frame(self.columns()).to_dict("records")
+
+    def save_log(self, save_path=RHYTHM_NAME):
+        columns = self.columns()
+        ext = os.path.splitext(save_path)[1].lower()
+        if ext == ".csv":
+            save_table(pd.DataFrame(columns), save_path, dtypes=self.dtypes, export_csv=False)
+        else:
+            tmp_path = save_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                if ext == ".jsonl":
+                    _write_jsonl(f, columns)
+                else:
+                    json.dump(self.event_log, f, ensure_ascii=False)
+            os.replace(tmp_path, save_path)
+        print(f"✅ 智慧節奏日誌已儲存到 {save_path}（{len(columns['code'])} 個事件）")
+
+def _write_jsonl(f, columns):
+    f.write(json.dumps({"symbols": EVENT_SYMBOLS, "columns": list(columns)}, ensure_ascii=False) + "\n")
+    rows = zip(*(values.tolist() for values in columns.values()))
+    f.writelines(json.dumps(row) + "\n" for row in rows)
+
+# === 讀取端 ===
+def events_to_frame(columns, symbols=EVENT_SYMBOLS):
+    """columns 的第一個欄位為事件位置（episode 或 step）"""
+    index = next(iter(columns))
+    codes = np.asarray(columns["code"], dtype=np.int64)
+    return pd.DataFrame({
+        index: np.asarray(columns[index], dtype=np.int64),
+        "event": np.asarray(symbols, dtype=object)[codes] if len(codes) else np.zeros(0, dtype=object),
+        "h": np.asarray(columns["h"], dtype=np.float64),
+        "s": np.asarray(columns["s"], dtype=np.float64),
+        "q": np.asarray(columns["q"], dtype=np.float64),
+    })
+
+def event_log_path(run_dir):
+    """run 資料夾內的語法事件日誌（新格式優先，舊的 wisdom_rhythm.json 也可讀）；都不存在時回傳 None"""
+    for name in RHYTHM_NAMES:
+        path = os.path.join(run_dir, name)
+        if (table_exists(path) if name.endswith(".csv") else run_fs.exists(path)):
+            return path
+    return None
+
+def load_events(path):
+    """讀取任一格式的事件日誌（也可以是封存內的路徑），回傳 DataFrame[episode 或 step, event, h, s, q]"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return events_to_frame(load_columns(path))
+    if ext == ".jsonl":
+        with run_fs.open_file(path, "r") as f:
+            header = json.loads(f.readline())
+            rows = [json.loads(line) for line in f if line.strip()]
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(header["columns"]))
+        return events_to_frame(dict(zip(header["columns"], data.T)), header["symbols"])
+    events = run_fs.read_json(path)
+    return pd.DataFrame(events, columns=["episode", "event", "h", "s", "q"])
+
+def event_counts(path):
+    """{符號: 事件數}"""
+    return load_events(path)["event"].value_counts().to_dict()
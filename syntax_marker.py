@@ -1,4 +1,7 @@
 # syntax_marker.py
+import math
+import numpy as np
+
 def label_action(
     prev_action, current_action, 
     reward, prev_reward, 
@@ -43,14 +46,160 @@ def label_action(
     # reward總累積
     cumulative_reward = sum(reward_window)
 
-    # 標記邏輯判定
+    return _decide(reward, policy_stability, reward_slope, lambda: cumulative_reward,
+                   reward_threshold, slope_threshold, stability_low, stability_high)
+
+def _decide(reward, policy_stability, reward_slope, cumulative_reward,
+            reward_threshold, slope_threshold, stability_low, stability_high):
+    """標記邏輯判定（cumulative_reward 為函式，只在需要時才計算）"""
     if reward == 0 and policy_stability < stability_low:
         return '∅'  # 潛能探索期
     elif policy_stability > stability_high and abs(reward_slope) < 0.01:
         return 'Σ'  # 穩定存在
     elif abs(reward_slope) > slope_threshold:
         return 'Δ'  # 震盪分裂
-    elif cumulative_reward > reward_threshold and policy_stability > stability_high:
+    elif policy_stability > stability_high and cumulative_reward() > reward_threshold:
         return 'Ω'  # 智慧整合
     else:
         return 'Δ'  # 默認為分裂
+
+# === 逐步標記：固定大小的環形緩衝區，每步 O(1) ===
+# 與 label_action 的對應：update(action, reward) 等同於
+#   label_action(prev_action, action, reward, prev_reward, 最近 window 步的 action, 最近 window 步的 reward)
+# 其中兩個 window 都包含當前這一步。
+# reward 總和以累加 / 扣除維護；浮點捨入只在總和非常接近 reward_threshold 時才可能影響結果，
+# 這種情況下改以 label_action 相同的順序重新加總，輸出與 label_action 完全一致。
+_EPS = np.finfo(np.float64).eps
+
+class ActionLabeler:
+    def __init__(
+        self, window=50,
+        reward_threshold=2.0,
+        slope_threshold=0.5,
+        stability_low=0.3,
+        stability_high=0.8,
+        prev_reward=0.0
+    ):
+        self.window = window
+        self.reward_threshold = reward_threshold
+        self.slope_threshold = slope_threshold
+        self.stability_low = stability_low
+        self.stability_high = stability_high
+        self.initial_prev_reward = prev_reward
+        self.reset()
+
+    def reset(self):
+        self.actions = [None] * self.window
+        self.rewards = [0.0] * self.window
+        self.head = 0              # 下一個寫入位置（最舊的一筆）
+        self.count = 0
+        self.steps = 0
+        self.action_counts = {}
+        self.reward_sum = 0.0
+        self.abs_reward_sum = 0.0
+        self.prev_reward = self.initial_prev_reward
+
+    def _reward_window(self):
+        """依時間順序（舊 → 新）排列的 reward window"""
+        if self.count < self.window:
+            return self.rewards[:self.count]
+        return self.rewards[self.head:] + self.rewards[:self.head]
+
+    def _push(self, action, reward):
+        if self.count == self.window:
+            old_action = self.actions[self.head]
+            self.action_counts[old_action] -= 1
+            self.reward_sum -= self.rewards[self.head]
+            self.abs_reward_sum -= abs(self.rewards[self.head])
+        else:
+            self.count += 1
+        self.actions[self.head] = action
+        self.rewards[self.head] = reward
+        self.head = (self.head + 1) % self.window
+        self.action_counts[action] = self.action_counts.get(action, 0) + 1
+        self.reward_sum += reward
+        self.abs_reward_sum += abs(reward)
+
+        # 每 window 步以精確加總重設，累加誤差維持在 window 步的範圍內
+        self.steps += 1
+        if self.steps % self.window == 0:
+            window = self._reward_window()
+            self.reward_sum = math.fsum(window)
+            self.abs_reward_sum = math.fsum(abs(r) for r in window)
+
+    def cumulative_reward(self):
+        """與 sum(reward_window) 相同的值（只有接近門檻時才真的重新加總）"""
+        tolerance = 4 * self.window * _EPS * self.abs_reward_sum
+        if abs(self.reward_sum - self.reward_threshold) <= tolerance:
+            return sum(self._reward_window())
+        return self.reward_sum
+
+    def update(self, action, reward):
+        """記錄一步並回傳該步的標籤（∅, Σ, Δ, Ω）"""
+        self._push(action, reward)
+        policy_stability = self.action_counts[action] / max(1, self.count)
+        reward_slope = reward - self.prev_reward
+        self.prev_reward = reward
+        return _decide(
+            reward, policy_stability, reward_slope, self.cumulative_reward,
+            self.reward_threshold, self.slope_threshold, self.stability_low, self.stability_high
+        )
+
+    def label_trajectory(self, actions, rewards):
+        """整段軌跡一次標記（NumPy），結果與逐步 update 相同；不改變逐步狀態"""
+        return label_trajectory(
+            actions, rewards, window=self.window,
+            reward_threshold=self.reward_threshold,
+            slope_threshold=self.slope_threshold,
+            stability_low=self.stability_low,
+            stability_high=self.stability_high,
+            prev_reward=self.initial_prev_reward
+        )
+
+def label_trajectory(
+    actions, rewards, window=50,
+    reward_threshold=2.0,
+    slope_threshold=0.5,
+    stability_low=0.3,
+    stability_high=0.8,
+    prev_reward=0.0
+):
+    """
+    批次版本：對整段軌跡的每一步各自呼叫 label_action（window 含當前這一步）的結果，回傳 ndarray[str]
+    """
+    rewards = np.asarray(rewards, dtype=np.float64)
+    n = len(rewards)
+    if n == 0:
+        return np.zeros(0, dtype='<U1')
+    _, codes = np.unique(np.asarray(actions), return_inverse=True)
+    codes = codes.reshape(-1)
+    idx = np.arange(n)
+    start = np.maximum(idx - window + 1, 0)
+    length = idx - start + 1
+
+    # 每個 action 的出現次數前綴和：window 內與當前相同的 action 數 = 兩個前綴和之差
+    counts = np.zeros((n + 1, codes.max() + 1), dtype=np.int64)
+    counts[idx + 1, codes] = 1
+    np.cumsum(counts, axis=0, out=counts)
+    same_action_count = counts[idx + 1, codes] - counts[start, codes]
+    policy_stability = same_action_count / np.maximum(1, length)
+
+    reward_slope = rewards - np.concatenate(([prev_reward], rewards[:-1]))
+
+    prefix = np.concatenate(([0.0], np.cumsum(rewards)))
+    abs_prefix = np.concatenate(([0.0], np.cumsum(np.abs(rewards))))
+    cumulative_reward = prefix[idx + 1] - prefix[start]
+    # 前綴和相減有捨入誤差；接近門檻的步改以 label_action 相同的順序重新加總
+    tolerance = 4 * (idx + 1 + window) * _EPS * abs_prefix[idx + 1]
+    for i in np.flatnonzero(np.abs(cumulative_reward - reward_threshold) <= tolerance):
+        cumulative_reward[i] = sum(rewards[start[i]:i + 1].tolist())
+
+    abs_slope = np.abs(reward_slope)
+    high = policy_stability > stability_high
+    conditions = [
+        (rewards == 0) & (policy_stability < stability_low),
+        high & (abs_slope < 0.01),
+        abs_slope > slope_threshold,
+        (cumulative_reward > reward_threshold) & high,
+    ]
+    return np.select(conditions, ['∅', 'Σ', 'Δ', 'Ω'], default='Δ')
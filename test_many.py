@@ -1,12 +1,17 @@
 # test_many.py
 import os
-import glob
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import matplotlib.pyplot as plt
-from stable_baselines3 import PPO
 from maze_env.maze_env import MazeEnv
+from policy_table import load_policy
+from run_logger import StreamingTableWriter, TEST_MANY_METRICS_COLUMNS
+from columnar_store import load_table
+from loop_detector import LoopDetector, action_is_certain
+from modularity import EpisodeModularity
+from run_catalog import headline_metrics, record_artifact, record_metrics, register_run
+from run_discovery import find_latest_model
 
 def calculate_entropy(actions):
     counts = np.bincount(actions)
@@ -17,47 +22,58 @@ def calculate_entropy(actions):
 def calculate_wisdom_density(successes, total, params=1e5):
     return successes / (total * params)
 
-def find_latest_model():
-    train_dirs = sorted(glob.glob("runs/train_*"), reverse=True)
-    for dir in train_dirs:
-        for name in ["ppo_maze.zip"]:
-            model_path = os.path.join(dir, name)
-            if os.path.exists(model_path):
-                print(f"✅ 載入模型：{model_path}")
-                return model_path
-    raise FileNotFoundError("❌ 找不到模型。")
-
-def run_test_episode(model, env):
+def run_test_episode(model, env, deterministic=False):
     obs, _ = env.reset()
     actions = []
-    for _ in range(1000):
-        action, _ = model.predict(obs)
+    cells = [env.cell]
+    loop_detector = LoopDetector(deterministic=deterministic)
+    for step in range(1000):
+        action, _ = model.predict(obs, deterministic=deterministic)
+        certain = deterministic or action_is_certain(model, obs, action)
+        if loop_detector.update(step + 1, obs, action, certain):
+            # 確定性環境中已證實進入迴圈，不可能再到達終點
+            return actions, False, loop_detector, cells
         obs, reward, terminated, truncated, info = env.step(action)
         actions.append(int(action))
+        cells.append(env.cell)
         if terminated:
-            return actions, True
-    return actions, False
+            return actions, True, loop_detector, cells
+    return actions, False, loop_detector, cells
 
 def test_many(n=10):
     model_path = find_latest_model()
-    model = PPO.load(model_path)
     env = MazeEnv()
+    model = load_policy(model_path, env)  # 有策略查表時不需載入 torch
 
-    records = []
+    now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    save_dir = os.path.join("runs", f"test_many_{now}")
+    os.makedirs(save_dir, exist_ok=True)
+    register_run(save_dir)
+    metrics_path = os.path.join(save_dir, "metrics.csv")
+    records = StreamingTableWriter(metrics_path, TEST_MANY_METRICS_COLUMNS)
+    episode_q = EpisodeModularity(env.maze.size)  # 分群沿用上一回合，每回合只需少量調整
 
     for i in range(n):
-        actions, success = run_test_episode(model, env)
-        H = calculate_entropy(actions)
+        actions, success, loop, cells = run_test_episode(model, env)
+        H = calculate_entropy(actions) if actions else 0.0
         S = calculate_wisdom_density(1 if success else 0, 1)
-        print(f"🧪 測試 {i+1}: 成功={success}, H={H:.4f}, S={S:.6e}")
-        records.append({"episode": i + 1, "entropy": H, "wisdom_density": S})
+        loop_note = f", 迴圈@{loop.loop_entry_step}(長度 {loop.loop_length})" if loop.loop_length else ""
+        if loop.suspected_length:
+            loop_note += f", 疑似迴圈@{loop.suspected_entry_step}(長度 {loop.suspected_length})"
+        print(f"🧪 測試 {i+1}: 成功={success}, H={H:.4f}, S={S:.6e}{loop_note}")
+        records.append(
+            episode=i + 1,
+            entropy=H,
+            wisdom_density=S,
+            loop_entry_step=loop.loop_entry_step or -1,
+            loop_length=loop.loop_length or -1,
+            modularity=episode_q.episode(cells)
+        )
 
-    df = pd.DataFrame(records)
-
-    now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    save_dir = os.path.join("runs", f"test_many_{now}")
-    os.makedirs(save_dir, exist_ok=True)
-    df.to_csv(os.path.join(save_dir, "metrics.csv"), index=False)
+    records.close()
+    record_artifact(metrics_path)
+    record_metrics(save_dir, headline_metrics(save_dir))
+    df = load_table(metrics_path, columns=["episode", "entropy", "wisdom_density"])
 
     # 畫圖
     fig, ax1 = plt.subplots()
@@ -0,0 +1,62 @@
+# training_callbacks.py
+# ✅ 訓練用 SB3 callback：串流寫入 rewards.csv、背景儲存 checkpoint
+#    獨立成模組，main.py 只在 train 模式才載入（評估 / 測試行程不需要 torch）
+
+import os
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from run_logger import StreamingTableWriter, REWARDS_COLUMNS
+from checkpoint_writer import AsyncCheckpointWriter
+
+# === Reward Logger（訓練時記錄總回報，支援多個平行環境，邊訓練邊串流寫入 rewards.csv）===
+class RewardLoggerCallback(BaseCallback):
+    def __init__(self, save_path, flush_every=10_000):
+        super().__init__()
+        self.writer = StreamingTableWriter(save_path, REWARDS_COLUMNS, flush_every=flush_every)
+        self.current_rewards = None
+
+    def _on_training_start(self) -> None:
+        self.current_rewards = np.zeros(self.training_env.num_envs, dtype=np.float32)
+
+    def _on_step(self) -> bool:
+        rewards = self.locals.get("rewards")
+        if rewards is not None:
+            self.current_rewards += rewards
+        dones = self.locals.get("dones")
+        if dones is not None and dones.any():
+            # 同一步有多個環境結束時，依環境編號順序記錄
+            for env_idx in np.flatnonzero(dones):
+                self.writer.append(episode=len(self.writer) + 1, reward=self.current_rewards[env_idx])
+                self.current_rewards[env_idx] = 0.0
+        return True
+
+    def _on_training_end(self) -> None:
+        self.writer.close()
+
+# === 每10萬步儲存 checkpoint ===
+class CheckpointCallback(BaseCallback):
+    def __init__(self, save_freq, save_path, keep_last=None, keep_every=None, verbose=0):
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.save_path = save_path
+        self.last_saved = 0
+        self.save_latencies = []  # 每次儲存造成的停頓秒數（TrainingProfilerCallback 讀取）
+        # 背景寫檔：訓練執行緒只負責快照；保留最近 keep_last 個 + 每 keep_every 個 save_freq 一個
+        self.writer = AsyncCheckpointWriter(
+            keep_last=keep_last,
+            keep_every=keep_every * save_freq if keep_every else None,
+            verbose=verbose,
+        )
+
+    def _on_step(self) -> bool:
+        # 多環境時 num_timesteps 每次前進 n_envs 步，改用「跨過第幾個 save_freq 邊界」判斷
+        boundary = (self.num_timesteps // self.save_freq) * self.save_freq
+        if boundary > self.last_saved:
+            self.last_saved = boundary
+            model_path = os.path.join(self.save_path, f"checkpoint_{boundary}.zip")
+            self.save_latencies.append(self.writer.save(self.model, model_path, step=boundary))
+        return True
+
+    def _on_training_end(self) -> None:
+        # 等最後一次背景寫入完成，之後的 model.save 與分析才看得到完整的 checkpoint
+        self.writer.close()
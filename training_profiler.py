@@ -0,0 +1,218 @@
+# training_profiler.py
+# ✅ 訓練吞吐量剖析：把 model.learn 的時間拆成 env 步進 / 策略前向 / PPO 更新 / 各 callback / checkpoint 儲存
+#    每 interval 步寫一列到 run 資料夾的 profile.csv（欄式檔 profile.cols），訓練結束時輸出 profile_summary.json
+#    每步只多幾次 perf_counter 呼叫，可以在正式訓練中常駐開啟
+
+import os
+import json
+import time
+import numpy as np
+from stable_baselines3.common.callbacks import CallbackList
+from stable_baselines3.common.vec_env import VecEnvWrapper
+from run_logger import StreamingTableWriter
+
+try:
+    import psutil
+except ImportError:  # 沒有 psutil 時改讀 /proc 或 resource
+    psutil = None
+
+PROFILE_NAME = "profile.csv"
+SUMMARY_NAME = "profile_summary.json"
+DEFAULT_INTERVAL = 10_000
+
+PROFILE_COLUMNS = {
+    "timesteps": np.int64,
+    "wall_s": np.float64,         # 自訓練開始經過的秒數
+    "steps_per_sec": np.float32,  # 本區間的吞吐量
+    "rollout_s": np.float32,      # 本區間收集 rollout 的時間（含 env / 前向 / callback）
+    "env_s": np.float32,          # 其中 env.step 的時間
+    "forward_s": np.float32,      # 其中策略前向與 rollout buffer 的時間
+    "callback_s": np.float32,     # 其中各 callback 的時間
+    "update_s": np.float32,       # 本區間 PPO 最佳化（model.train）的時間
+    "checkpoint_s": np.float32,   # 本區間 checkpoint 儲存造成的停頓
+    "rss_mb": np.float32,
+}
+
+# === 行程記憶體 ===
+def current_rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # 峰值（Linux 單位為 KB）
+    except ImportError:
+        return float("nan")
+
+# === env 步進計時 ===
+class TimedVecEnv(VecEnvWrapper):
+    """累計 step_async → step_wait 的時間（SubprocVecEnv 時即為等待子行程的時間）"""
+
+    def __init__(self, venv):
+        super().__init__(venv)
+        self.step_seconds = 0.0
+        self._started = None
+
+    def reset(self):
+        return self.venv.reset()
+
+    def step_async(self, actions):
+        self._started = time.perf_counter()
+        self.venv.step_async(actions)
+
+    def step_wait(self):
+        result = self.venv.step_wait()
+        self.step_seconds += time.perf_counter() - self._started
+        return result
+
+# === 剖析 callback ===
+class TrainingProfilerCallback(CallbackList):
+    """
+    包住其他 callback（取代 CallbackList）並量測每個 callback 的耗時：
+        profiler = TrainingProfilerCallback(run_dir, [reward_logger, checkpoint_callback])
+        model.learn(..., callback=profiler)
+    訓練開始時以 TimedVecEnv 包住 model.env，結束時還原。
+    含 save_latencies 屬性的 callback（CheckpointCallback）另外記錄每次儲存的停頓時間。
+    """
+
+    def __init__(self, run_dir, callbacks=(), interval=DEFAULT_INTERVAL, verbose=1):
+        super().__init__(list(callbacks))
+        self.verbose = verbose
+        self.run_dir = run_dir
+        self.interval = interval
+        self.writer = None
+        self.timed_env = None
+
+    # --- 計時狀態 ---
+    def _reset_interval(self, now):
+        self.interval_started = now
+        self.interval_timesteps = self.num_timesteps
+        self.interval_env = self.timed_env.step_seconds
+        self.interval_totals = dict.fromkeys(("rollout", "callback", "update", "checkpoint"), 0.0)
+
+    def _add(self, phase, seconds):
+        self.interval_totals[phase] += seconds
+        self.totals[phase] += seconds
+
+    def _on_training_start(self):
+        self.timed_env = TimedVecEnv(self.model.env)
+        self.model.env = self.timed_env
+        self.writer = StreamingTableWriter(os.path.join(self.run_dir, PROFILE_NAME), PROFILE_COLUMNS, flush_every=10)
+        self.callback_seconds = {type(callback).__name__: 0.0 for callback in self.callbacks}
+        self.checkpoint_latencies = []
+        self.totals = dict.fromkeys(("rollout", "callback", "update", "checkpoint"), 0.0)
+        self.peak_rss = current_rss_mb()
+        now = time.perf_counter()
+        self.training_started = now
+        self.rollout_started = None
+        self.rollout_ended = None
+        self.next_row = (self.num_timesteps // self.interval + 1) * self.interval
+        self._reset_interval(now)
+        super()._on_training_start()
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self.rollout_ended is not None:
+            self._add("update", now - self.rollout_ended)  # 上一次 rollout 結束後到現在 = model.train
+        self.rollout_started = now
+        super()._on_rollout_start()
+
+    def _on_step(self):
+        continue_training = True
+        for callback in self.callbacks:
+            started = time.perf_counter()
+            saves = len(getattr(callback, "save_latencies", ()))
+            continue_training = callback.on_step() and continue_training
+            elapsed = time.perf_counter() - started
+            self.callback_seconds[type(callback).__name__] += elapsed
+            self._add("callback", elapsed)
+            for latency in getattr(callback, "save_latencies", ())[saves:]:
+                self.checkpoint_latencies.append(latency)
+                self._add("checkpoint", latency)
+
+        if self.num_timesteps >= self.next_row:
+            self._write_row()
+            self.next_row = (self.num_timesteps // self.interval + 1) * self.interval
+        return continue_training
+
+    def _on_rollout_end(self):
+        super()._on_rollout_end()
+        self.rollout_ended = time.perf_counter()
+        self._add("rollout", self.rollout_ended - self.rollout_started)
+        self.rollout_started = None
+
+    def _write_row(self):
+        now = time.perf_counter()
+        # 進行中的 rollout 先把已經過的時間計入本區間
+        if self.rollout_started is not None:
+            self._add("rollout", now - self.rollout_started)
+            self.rollout_started = now
+        elapsed = max(now - self.interval_started, 1e-9)
+        env_s = self.timed_env.step_seconds - self.interval_env
+        totals = self.interval_totals
+        rss = current_rss_mb()
+        self.peak_rss = max(self.peak_rss, rss)
+        self.writer.append(
+            timesteps=self.num_timesteps,
+            wall_s=now - self.training_started,
+            steps_per_sec=(self.num_timesteps - self.interval_timesteps) / elapsed,
+            rollout_s=totals["rollout"],
+            env_s=env_s,
+            forward_s=max(totals["rollout"] - env_s - totals["callback"], 0.0),
+            callback_s=totals["callback"],
+            update_s=totals["update"],
+            checkpoint_s=totals["checkpoint"],
+            rss_mb=rss,
+        )
+        self._reset_interval(now)
+
+    def _on_training_end(self):
+        super()._on_training_end()
+        now = time.perf_counter()
+        if self.rollout_ended is not None and self.rollout_started is None:
+            self._add("update", now - self.rollout_ended)  # 最後一次 model.train
+        if self.num_timesteps > self.interval_timesteps:
+            self._write_row()
+        self.writer.close()
+        self.model.env = self.timed_env.venv
+
+        summary = self.summary(now - self.training_started)
+        with open(os.path.join(self.run_dir, SUMMARY_NAME), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        if self.verbose:
+            print_summary(summary)
+
+    def summary(self, wall_s):
+        env_s = self.timed_env.step_seconds
+        rollout_s = self.totals["rollout"]
+        latencies = self.checkpoint_latencies
+        return {
+            "timesteps": int(self.num_timesteps),
+            "wall_s": wall_s,
+            "steps_per_sec": self.num_timesteps / max(wall_s, 1e-9),
+            "rollout_s": rollout_s,
+            "env_s": env_s,
+            "forward_s": max(rollout_s - env_s - self.totals["callback"], 0.0),
+            "update_s": self.totals["update"],
+            "callback_s": self.callback_seconds,
+            "checkpoints": len(latencies),
+            "checkpoint_mean_s": float(np.mean(latencies)) if latencies else 0.0,
+            "checkpoint_max_s": float(np.max(latencies)) if latencies else 0.0,
+            "peak_rss_mb": self.peak_rss,
+        }
+
+def print_summary(summary):
+    wall_s = max(summary["wall_s"], 1e-9)
+    print(f"\n⏱️ 訓練剖析：{summary['timesteps']:,} 步，{summary['wall_s']:.1f}s，"
+          f"{summary['steps_per_sec']:,.0f} 步/秒，峰值 RSS {summary['peak_rss_mb']:.0f} MB")
+    for name in ("rollout_s", "env_s", "forward_s", "update_s"):
+        print(f"   - {name[:-2]:<9}{summary[name]:>9.2f}s（{summary[name] / wall_s:6.1%}）")
+    for name, seconds in summary["callback_s"].items():
+        print(f"   - {name}：{seconds:.2f}s（{seconds / wall_s:.1%}）")
+    if summary["checkpoints"]:
+        print(f"   - checkpoint：{summary['checkpoints']} 次，平均 {summary['checkpoint_mean_s']:.3f}s，"
+              f"最長 {summary['checkpoint_max_s']:.3f}s")